@@ -1,38 +1,105 @@
 """
 API 요청 디버깅 미들웨어
 """
+import time
+import uuid
 import logging
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from core.structured_logging import request_id_var, debug_trace_var, mask_authorization
+from core.request_timing import request_stages_var, QueryTimer, server_timing_header, slow_requests
 
 logger = logging.getLogger('api')
 
 
+class RequestTimingMiddleware:
+    """
+    API 요청 지연 시간 측정 미들웨어
+    - 요청 전체 시간, 요청 스레드의 DB 쿼리 수/시간, 처리 단계별 시간을 Server-Timing 헤더로 반환
+    - SLOW_REQUEST_THRESHOLD_MS 이상 걸린 요청은 단계별 시간과 함께 보관 (/api/metrics/slow-requests/)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith('/api/'):
+            return self.get_response(request)
+
+        started_at = timezone.now()
+        start = time.perf_counter()
+        query_timer = QueryTimer()
+        stages = {}
+        stages_token = request_stages_var.set(stages)
+        try:
+            with connection.execute_wrapper(query_timer):
+                response = self.get_response(request)
+        finally:
+            request_stages_var.reset(stages_token)
+        duration = time.perf_counter() - start
+
+        # 스트리밍 응답은 헤더 전송 시점까지만 측정됨
+        response['Server-Timing'] = server_timing_header(duration, query_timer, stages)
+
+        user = getattr(request, 'user', None)
+        slow_requests.add({
+            'request_id': response.get('X-Request-ID'),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'user': user.username if user is not None and user.is_authenticated else None,
+            'started_at': started_at.isoformat(),
+            'duration': duration,
+            'db_queries': query_timer.count,
+            'db_time': query_timer.seconds,
+            'stages': stages,
+        })
+        return response
+
+
 class RequestLoggingMiddleware:
-    """모든 API 요청을 로깅하는 미들웨어"""
+    """
+    모든 API 요청을 로깅하는 미들웨어
+    - 요청 ID (X-Request-ID 헤더 또는 새로 생성)를 로그와 응답 헤더에 포함
+    - X-Debug-Trace: 1 헤더는 요청 표시만 하고, 인증 후 관리자/스태프 요청인 경우에만 view에서 추적 시작
+      (LOG_DEBUG_TRACE=header, api.views._apply_debug_trace)
+    """
 
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
         # API 요청만 로깅
-        if request.path.startswith('/api/'):
-            logger.info("\n" + "="*80)
-            logger.info(f"[REQUEST RECEIVED] {request.method} {request.path}")
-            logger.info("="*80)
-            logger.info(f"Authorization Header: {request.META.get('HTTP_AUTHORIZATION', 'NOT PROVIDED')}")
-            logger.info(f"Content-Type: {request.META.get('CONTENT_TYPE', 'NOT PROVIDED')}")
-            logger.info(f"User: {request.user if hasattr(request, 'user') else 'Anonymous'}")
-            logger.info(f"Remote Address: {request.META.get('REMOTE_ADDR')}")
+        if not request.path.startswith('/api/'):
+            return self.get_response(request)
 
+        request_id = (request.META.get('HTTP_X_REQUEST_ID') or uuid.uuid4().hex[:16])[:64]
+        # 인증 전이므로 추적 요청 여부만 기록 (view에서 사용자 확인 후 debug_trace_var 설정)
+        request.debug_trace_requested = (
+            getattr(settings, 'LOG_DEBUG_TRACE', 'off') == 'header'
+            and request.META.get('HTTP_X_DEBUG_TRACE', '').lower() in ('1', 'true', 'yes')
+        )
+        request_id_token = request_id_var.set(request_id)
+        trace_token = debug_trace_var.set(False)
+        try:
+            logger.info(
+                f"[REQUEST RECEIVED] {request.method} {request.path} "
+                f"auth={mask_authorization(request.META.get('HTTP_AUTHORIZATION'))} "
+                f"content_type={request.META.get('CONTENT_TYPE', 'NOT PROVIDED')} "
+                f"remote={request.META.get('REMOTE_ADDR')}"
+                + (" trace=requested" if request.debug_trace_requested else "")
+            )
             if request.GET:
                 logger.info(f"GET Parameters: {dict(request.GET)}")
 
             # POST 데이터는 view에서 로깅 (파일 제외)
-            logger.info("="*80 + "\n")
+            response = self.get_response(request)
 
-        response = self.get_response(request)
-
-        # 응답 상태 로깅
-        if request.path.startswith('/api/'):
-            logger.info(f"[RESPONSE] {request.method} {request.path} - Status: {response.status_code}\n")
-
-        return response
+            # 응답 상태 로깅
+            logger.info(f"[RESPONSE] {request.method} {request.path} - Status: {response.status_code}")
+            response['X-Request-ID'] = request_id
+            return response
+        finally:
+            request_id_var.reset(request_id_token)
+            debug_trace_var.reset(trace_token)
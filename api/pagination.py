@@ -0,0 +1,71 @@
+"""
+키셋(커서) 페이지네이션
+(created_at, id) 내림차순으로 정렬하고, 이전 페이지 마지막 행 다음부터 조회하여
+OFFSET 없이 오래된 페이지도 첫 페이지와 같은 비용으로 조회
+"""
+import json
+import base64
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from django.db.models import Q, QuerySet
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    """다음 페이지 커서 (불투명 문자열)"""
+    raw = json.dumps([created_at.isoformat(), pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """커서 해석 (형식이 잘못되면 ValueError)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"잘못된 커서입니다: {cursor}") from e
+
+
+def keyset_page(
+    queryset: QuerySet,
+    cursor: Optional[str],
+    limit: int,
+    serialize: Callable[[Any], Dict[str, Any]],
+    max_bytes: int = 0
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    (created_at, id) 내림차순 키셋 페이지 조회
+
+    Args:
+        queryset: 필터가 적용된 쿼리셋 (created_at, id 필드 필요)
+        cursor: 이전 응답의 next_cursor (없으면 첫 페이지)
+        limit: 페이지 최대 행 수
+        serialize: 행 -> 응답 dict
+        max_bytes: 페이지 응답 크기 상한 (JSON 기준, 0이면 제한 없음) - 넘으면 그 전 행까지만 반환
+
+    Returns:
+        (행 목록, 다음 페이지 커서 - 마지막 페이지면 None)
+    """
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    # 다음 페이지 여부 확인용으로 1건 더 조회
+    rows = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    data = []
+    size = 0
+    for row in rows:
+        item = serialize(row)
+        if max_bytes:
+            size += len(json.dumps(item, ensure_ascii=False, default=str).encode('utf-8'))
+            if data and size > max_bytes:
+                has_more = True
+                break
+        data.append(item)
+
+    last = rows[len(data) - 1] if data else None
+    next_cursor = encode_cursor(last.created_at, last.id) if has_more and last is not None else None
+    return data, next_cursor
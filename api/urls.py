@@ -13,8 +13,13 @@ urlpatterns = [
     # 인증
     path('auth/login/', login_view, name='login'),
 
+    # 헬스 체크
+    path('health/', views.health_check, name='health_check'),
+
     # 인보이스 처리
     path('process/', views.process_invoice, name='process_invoice'),
+    path('process/batch/', views.process_invoice_batch, name='process_invoice_batch'),
+    path('process/stream/', views.process_invoice_stream, name='process_invoice_stream'),
 
     # 처리 로그
     path('logs/', views.get_process_logs, name='get_process_logs'),
@@ -22,4 +27,12 @@ urlpatterns = [
 
     # 신고서 설정
     path('declaration/<int:declaration_id>/config/', views.get_declaration_config, name='get_declaration_config'),
+    path('config/cache-stats/', views.get_config_cache_stats, name='get_config_cache_stats'),
+
+    # OCR 캐시
+    path('ocr/cache-stats/', views.get_ocr_cache_stats, name='get_ocr_cache_stats'),
+
+    # 처리 지표 (Prometheus)
+    path('metrics/', views.get_metrics, name='get_metrics'),
+    path('metrics/slow-requests/', views.get_slow_requests, name='get_slow_requests'),
 ]
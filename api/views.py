@@ -4,56 +4,65 @@ REST API Views
 """
 import os
 import time
+import json
+import queue
+import zipfile
 import logging
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
+from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.db import transaction, connection, close_old_connections
+from django.db.models import Q, Case, When, Value, BooleanField
+from django.conf import settings
 from django.utils import timezone
-from core.models import (
-    ServiceUser, Declaration, MappingInfo, TableProcessConfig,
-    PromptConfig, InvoiceProcessLog, Service, CustomUser
+from core.models import ServiceUser, Declaration, InvoiceProcessLog, ArchivedProcessLog
+from core.jobs import (
+    run_process_log, submit_process_log, iter_batch_results,
+    reserve_stream_slot, release_stream_slot, submit_stream
 )
-from core.services import InvoiceProcessor
+from core.config_loader import (
+    load_declaration_config, resolve_service_user, resolve_declaration, get_cache_stats
+)
+from core.ocr_cache import ocr_cache
+from core.ocr_batcher import ocr_batcher
+from core.clients import check_clients_health
+from core.documents import combine_images
+from core.engines import ENGINES, engine_label
+from core.metrics import registry as metrics_registry
+from core.structured_logging import log_payload, debug_trace_var
+from core.request_timing import slow_requests
+from core.log_archive import load_archived_log
+from core.single_flight import single_flight, request_key, upload_sha256
+from .pagination import keyset_page
 
 logger = logging.getLogger('api')
 
+# 배치 처리 시 zip 파일에서 추출할 이미지 확장자
+BATCH_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff', '.pdf')
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def process_invoice(request):
-    """
-    인보이스 처리 API
 
-    Request Body:
-    - image: 인보이스 이미지 파일 (multipart/form-data)
-    - service_slug: 서비스 slug (예: rk-customs)
-    - customs_code: 관세사 코드 (예: 6N003) 또는 'default'
-    - declaration_code: 신고서 코드 (예: CUSDEC929)
-    - ai_engine: AI 엔진 선택 (gemini 또는 gpt, 기본값: gemini)
-    - hs_code_process_order: HS 코드 추천을 실행할 테이블 처리 순서 (선택, 예: 1)
+def _apply_debug_trace(request):
+    """X-Debug-Trace 요청 헤더 적용 - 인증된 관리자/스태프 요청만 본문 전체 추적 (미들웨어는 인증 전이라 요청 여부만 기록)"""
+    user = request.user
+    if getattr(request, 'debug_trace_requested', False) and (user.user_type == 'admin' or user.is_staff):
+        debug_trace_var.set(True)
+        logger.info(f"[DEBUG TRACE] Enabled for {user.username}")
 
-    Response:
-    - success: 성공 여부
-    - data: 정리된 JSON 데이터
-    - ocr_text: OCR 추출 텍스트
-    - processing_time: 처리 시간(초)
-    - log_id: 처리 로그 ID
-    - ai_engine: 사용된 AI 엔진
-    """
 
-    logger.info("\n" + "="*80)
-    logger.info("[API REQUEST] /api/process/")
-    logger.info("="*80)
-    logger.info(f"User: {request.user.username}")
-    logger.info(f"Request Data: {dict(request.data)}")
-    logger.info("="*80 + "\n")
+def _validate_process_request(request):
+    """
+    인보이스 처리 요청 검증 (단건 / SSE 스트리밍 공용)
 
-    # Step 1: 요청 데이터 검증
+    Returns:
+        (검증된 파라미터, None) 또는 (None, 오류 Response)
+    """
     if 'image' not in request.FILES:
-        return Response(
+        return None, Response(
             {'success': False, 'error': '이미지 파일이 필요합니다.'},
             status=status.HTTP_400_BAD_REQUEST
         )
@@ -62,6 +71,11 @@ def process_invoice(request):
     customs_code = request.data.get('customs_code')
     declaration_code = request.data.get('declaration_code')
     ai_engine = request.data.get('ai_engine', 'gpt').lower()  # 기본값: gpt
+    if ai_engine not in ENGINES:
+        return None, Response(
+            {'success': False, 'error': f"ai_engine은 {', '.join(ENGINES)} 중 하나여야 합니다."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
     # HS 코드 추천 실행 순서 (선택)
     hs_code_process_order = request.data.get('hs_code_process_order')
@@ -69,180 +83,173 @@ def process_invoice(request):
         try:
             hs_code_process_order = int(hs_code_process_order)
         except (ValueError, TypeError):
-            return Response(
+            return None, Response(
                 {'success': False, 'error': 'hs_code_process_order는 숫자여야 합니다.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
     if not service_slug or not customs_code or not declaration_code:
-        return Response(
+        return None, Response(
             {'success': False, 'error': 'service_slug, customs_code, declaration_code가 필요합니다.'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    # 서비스 조회
-    service = get_object_or_404(Service, slug=service_slug)
-
-    # ServiceUser 조회
-    if customs_code == 'default':
-        service_user = get_object_or_404(ServiceUser, service=service, is_default=True)
-    else:
-        user = get_object_or_404(CustomUser, customs_code=customs_code)
-        service_user = get_object_or_404(ServiceUser, service=service, user=user)
+    # ServiceUser 조회 (서비스/관세사 조인)
+    service_user = resolve_service_user(service_slug, customs_code)
 
     # Declaration 조회
-    declaration = get_object_or_404(Declaration, service=service, code=declaration_code)
+    declaration = resolve_declaration(service_user, declaration_code)
 
     if request.user.user_type != 'admin':
         if service_user.user != request.user:
-            return Response(
+            return None, Response(
                 {'success': False, 'error': '권한이 없습니다.'},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-    # Step 1: 이미지 파일 저장
-    image_file = request.FILES['image']
+    # 여러 장의 이미지는 업로드 순서대로 하나의 다중 페이지 문서로 결합
+    image_files = request.FILES.getlist('image')
+    image_file = image_files[0]
+    if len(image_files) > 1:
+        max_pages = getattr(settings, 'DOCUMENT_MAX_PAGES', 30)
+        if len(image_files) > max_pages:
+            return None, Response(
+                {'success': False, 'error': f'이미지는 최대 {max_pages}장까지 업로드할 수 있습니다.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            image_file = combine_images(image_files)
+        except Exception as e:
+            return None, Response(
+                {'success': False, 'error': f'이미지 결합 실패: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-    # 로그 생성
-    process_log = InvoiceProcessLog.objects.create(
-        service_user=service_user,
-        declaration=declaration,
-        image_file=image_file,
-        status='processing'
-    )
+    return {
+        'service_user': service_user,
+        'declaration': declaration,
+        'ai_engine': ai_engine,
+        'hs_code_process_order': hs_code_process_order or None,
+        'image_file': image_file
+    }, None
 
-    try:
-        # 이미지 파일 경로
-        image_path = process_log.image_file.path
 
-        # 테이블 처리 설정 정보 가져오기 (테이블명으로 매칭)
-        table_configs = {}
-        configs = TableProcessConfig.objects.filter(
-            declaration=declaration,
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def process_invoice(request):
+    """
+    인보이스 처리 API
+
+    Request Body:
+    - image: 인보이스 이미지 파일 (multipart/form-data)
+    - service_slug: 서비스 slug (예: rk-customs)
+    - customs_code: 관세사 코드 (예: 6N003) 또는 'default'
+    - declaration_code: 신고서 코드 (예: CUSDEC929)
+    - ai_engine: AI 엔진 선택 (gemini, gpt 또는 local, 기본값: gpt)
+    - hs_code_process_order: HS 코드 추천을 실행할 테이블 처리 순서 (선택, 예: 1)
+    - async: true인 경우 처리 로그만 생성하고 즉시 log_id 반환 (선택, 기본값: false)
+             처리 결과는 /api/logs/<log_id>/ 의 status로 확인
+
+    Response:
+    - success: 성공 여부
+    - data: 정리된 JSON 데이터
+    - ocr_text: OCR 추출 텍스트
+    - processing_time: 처리 시간(초)
+    - log_id: 처리 로그 ID
+    - ai_engine: 사용된 AI 엔진
+    """
+
+    _apply_debug_trace(request)
+    logger.info(f"[API REQUEST] /api/process/ - User: {request.user.username}")
+    log_payload(logger, "Request Data", {key: request.data.get(key) for key in request.data if key != 'image'})
+
+    # Step 1: 요청 데이터 검증
+    params, error_response = _validate_process_request(request)
+    if error_response is not None:
+        return error_response
+
+    service_user = params['service_user']
+    service = service_user.service
+    declaration = params['declaration']
+    ai_engine = params['ai_engine']
+
+    # 비동기 처리 여부 (선택)
+    is_async = str(request.data.get('async', 'false')).lower() in ('true', '1', 'yes')
+
+    # Step 1: 이미지 파일 저장 및 로그 생성
+    def create_process_log():
+        return InvoiceProcessLog.objects.create(
             service_user=service_user,
-            is_active=True
+            declaration=declaration,
+            image_file=params['image_file'],
+            ai_engine=ai_engine,
+            hs_code_process_order=params['hs_code_process_order'],
+            status='pending' if is_async else 'processing',
+            claimed_at=None if is_async else timezone.now(),
+            attempts=0 if is_async else 1
         )
-        for config in configs:
-            table_configs[config.db_table_name] = {
-                'process_order': config.process_order,
-                'work_group': config.work_group,
-                'table_prompt': config.table_prompt  # 테이블 프롬프트 추가
-            }
 
-        # 매핑 정보 가져오기
-        mappings = MappingInfo.objects.filter(
-            declaration=declaration,
-            is_active=True
-        ).order_by('priority')
-
-        mapping_info = []
-
-        for mapping in mappings:
-            # 기본 프롬프트
-            basic_prompt = PromptConfig.objects.filter(
-                mapping=mapping,
-                prompt_type='basic',
-                service_user__isnull=True,
-                is_active=True
-            ).first()
-
-            # 추가 프롬프트
-            additional_prompt = PromptConfig.objects.filter(
-                mapping=mapping,
-                prompt_type='additional',
-                service_user=service_user,
-                is_active=True
-            ).first()
-
-            # 테이블 처리 설정 정보 (테이블명으로 조회)
-            process_order = None
-            work_group = None
-            table_prompt = None
-            table_config = table_configs.get(mapping.db_table_name)
-            if table_config:
-                process_order = table_config['process_order']
-                work_group = table_config['work_group']
-                table_prompt = table_config['table_prompt']
-
-            # 매핑 정보에 프롬프트 및 처리 순서 포함
-            mapping_info.append({
-                'unipass_field_name': mapping.unipass_field_name,
-                'db_table_name': mapping.db_table_name,
-                'db_field_name': mapping.db_field_name,
-                'basic_prompt': basic_prompt.prompt_text if basic_prompt else None,
-                'additional_prompt': additional_prompt.prompt_text if additional_prompt else None,
-                'process_order': process_order,
-                'work_group': work_group,
-                'table_prompt': table_prompt  # 테이블 프롬프트 추가
-            })
+    # 비동기 처리: 워커 풀에 등록 후 즉시 반환
+    if is_async:
+        process_log = create_process_log()
+        transaction.on_commit(lambda: submit_process_log(process_log.id))
+        logger.info(f"[API RESPONSE] Async job queued - Log ID: {process_log.id}")
+        return Response({
+            'success': True,
+            'log_id': process_log.id,
+            'status': process_log.status,
+            'ai_engine': engine_label(ai_engine),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    try:
+        # 설정 스냅샷 조회 (설정 버전 기준 캐시)
+        snapshot = load_declaration_config(declaration, service_user)
+        mapping_info = snapshot.mapping_info()
 
         # AI 메타데이터 (최상위 프롬프트)
-        ai_metadata = declaration.description if declaration.description else None
+        ai_metadata = snapshot.ai_metadata
 
         # 순차 처리 여부 확인
         has_process_order = any(mapping.get('process_order') is not None for mapping in mapping_info)
 
-        # 매핑 정보 출력 (순차 처리가 아닐 때만 상세 출력)
-        logger.info("\n" + "="*80)
-        logger.info("[MAPPING INFO]")
-        logger.info("="*80)
-        logger.info(f"Service: {service.name} ({service.slug})")
-        logger.info(f"Declaration: {declaration.name} ({declaration.code})")
-        logger.info(f"AI Engine: {'Gemini' if ai_engine == 'gemini' else 'ChatGPT'}")
-        logger.info(f"AI Metadata: {ai_metadata}")
-        logger.info(f"Total {len(mapping_info)} field mappings")
-
-        if has_process_order:
-            # 순차 처리 시에는 간략하게
-            ordered_count = sum(1 for m in mapping_info if m.get('process_order') is not None)
-            logger.info(f"  - Ordered mappings: {ordered_count}")
-            logger.info(f"  - Unordered mappings: {len(mapping_info) - ordered_count}")
-            logger.info("  (Detailed mapping info will be shown in each step)")
-        else:
-            # 일괄 처리 시에는 전체 출력
-            for idx, mapping in enumerate(mapping_info, 1):
-                logger.info(f"\n  [{idx}] {mapping['unipass_field_name']}")
-                logger.info(f"      -> DB: {mapping['db_table_name']}.{mapping['db_field_name']}")
-                if mapping.get('basic_prompt'):
-                    logger.info(f"      -> Basic Prompt: {mapping['basic_prompt'][:50]}...")
-                if mapping.get('additional_prompt'):
-                    logger.info(f"      -> Additional Prompt: {mapping['additional_prompt'][:50]}...")
-
-        logger.info("="*80 + "\n")
-
-        # 인보이스 처리 (AI 엔진 선택)
-        use_gemini = ai_engine == 'gemini'
-        processor = InvoiceProcessor(use_gemini=use_gemini)
-        result = processor.process(
-            image_path=image_path,
-            mapping_info=mapping_info,
-            ai_metadata=ai_metadata,
-            hs_code_process_order=hs_code_process_order
+        # 매핑 정보 요약 (상세 매핑은 디버그 추적 시에만 전체 기록)
+        ordered_count = sum(1 for m in mapping_info if m.get('process_order') is not None)
+        logger.info(
+            f"[MAPPING INFO] Service: {service.name} ({service.slug}), "
+            f"Declaration: {declaration.name} ({declaration.code}), AI Engine: {engine_label(ai_engine)}, "
+            f"{len(mapping_info)} field mappings ({ordered_count} ordered)"
+        )
+        log_payload(logger, "AI Metadata", ai_metadata or '')
+        if not has_process_order:
+            log_payload(logger, "Mappings", [
+                f"{mapping['unipass_field_name']} -> {mapping['db_table_name']}.{mapping['db_field_name']}"
+                for mapping in mapping_info
+            ])
+
+        # 인보이스 처리 (AI 엔진 선택) 및 로그 업데이트
+        # 처리 중인 동일 요청(재시도 등)이 있으면 새로 처리하지 않고 그 결과를 함께 사용
+        key = request_key(
+            upload_sha256(params['image_file']), service_user.id, declaration.id,
+            ai_engine, params['hs_code_process_order'], snapshot.version
+        )
+        log_id, result, coalesced = single_flight.run(
+            key,
+            create_process_log,
+            lambda process_log: _run_process_log_or_fail(process_log, mapping_info, ai_metadata)
         )
-
-        # 로그 업데이트
-        process_log.ocr_text = result.get('ocr_text')
-        process_log.gpt_response = result.get('gpt_response')
-        process_log.result_json = result.get('result_json')
-        process_log.processing_time = result.get('processing_time')
-
-        if result['success']:
-            process_log.status = 'completed'
-            process_log.completed_at = timezone.now()
-        else:
-            process_log.status = 'failed'
-            process_log.error_message = result.get('error')
-
-        process_log.save()
 
         # Step 5: 응답 반환
         response_data = {
             'success': result['success'],
+            'coalesced': coalesced,  # 처리 중인 동일 요청의 결과를 함께 받은 경우 true
             'data': result.get('result_json'),
             'ocr_text': result.get('ocr_text'),
             'processing_time': result.get('processing_time'),
-            'log_id': process_log.id,
-            'ai_engine': 'Gemini' if use_gemini else 'ChatGPT',
+            'timings': result.get('timings'),  # 단계별 소요 시간 (OCR/AI 및 OCR 병행으로 절약한 시간)
+            'image': result.get('image'),  # 이미지 전처리 결과 (절감 바이트, 이미지 토큰 추정치)
+            'usage': result.get('usage'),  # 토큰 사용량 (프롬프트 캐시 적중 토큰 포함)
+            'log_id': log_id,
+            'ai_engine': engine_label(ai_engine),
             'ai_metadata': ai_metadata,
             'mapping_info': mapping_info,
             'prompt': result.get('prompt'),
@@ -253,70 +260,337 @@ def process_invoice(request):
             'error': result.get('error')
         }
 
-        # 응답 출력
-        logger.info("\n" + "="*80)
-        logger.info("[API RESPONSE]")
-        logger.info("="*80)
-        logger.info(f"Success: {response_data['success']}")
-        logger.info(f"Processing Time: {response_data['processing_time']:.2f}s")
-        logger.info(f"Log ID: {response_data['log_id']}")
-        logger.info(f"AI Engine: {response_data['ai_engine']}")
-        if response_data.get('total_steps'):
-            logger.info(f"Total Steps: {response_data['total_steps']}")
-
-        # 단계별 정보 출력
-        if response_data.get('steps'):
-            logger.info(f"\nStep-by-Step Processing Details:")
-            for step in response_data['steps']:
-                logger.info(f"\n  [Step {step['step']}/{response_data.get('total_steps', '?')}] {step['work_group']} (Order: {step['order']})")
-                logger.info(f"  - Mapping Count: {step['mapping_count']}")
-
-                # 이 단계의 매핑 목록 출력
-                if step.get('mappings'):
-                    logger.info(f"  - Mappings in this step:")
-                    for idx, m in enumerate(step['mappings'], 1):
-                        logger.info(f"      {idx}. {m['unipass_field_name']} -> {m['db_table_name']}.{m['db_field_name']}")
-
-                logger.info(f"  - Has Prompt: {'Yes' if step.get('prompt') else 'No'}")
-                logger.info(f"  - Has Response: {'Yes' if step.get('response') else 'No'}")
-
+        # 응답 요약 (추출 데이터는 디버그 추적 시에만 전체 기록)
+        logger.info(
+            f"[API RESPONSE] Log ID: {response_data['log_id']}, Success: {response_data['success']}, "
+            f"Coalesced: {coalesced}, "
+            f"AI Engine: {response_data['ai_engine']}, Steps: {response_data.get('total_steps')}, "
+            f"Processing Time: {response_data['processing_time'] or 0:.2f}s, Timings: {response_data['timings']}"
+        )
+        for step in response_data.get('steps') or []:
+            logger.info(
+                f"  [Step {step['step']}/{response_data.get('total_steps', '?')}] {step['work_group']} "
+                f"(Order: {step['order']}, Mappings: {step['mapping_count']}, Usage: {step.get('usage')})"
+            )
         if response_data.get('error'):
             logger.info(f"Error: {response_data['error']}")
         if response_data.get('data'):
-            logger.info(f"\nExtracted Data:")
-            logger.info(f"[DEBUG api/views.py:213] response_data['data'] type: {type(response_data['data'])}")
-            logger.info(f"[DEBUG api/views.py:214] response_data['data'] value: {response_data['data']}")
-            try:
-                if isinstance(response_data['data'], dict):
-                    logger.info(f"[DEBUG api/views.py:217] Iterating dict with .items()")
-                    for key, value in response_data['data'].items():
-                        logger.info(f"  - {key}: {value}")
-                elif isinstance(response_data['data'], list):
-                    logger.info(f"[DEBUG api/views.py:221] Iterating list")
-                    for item in response_data['data']:
-                        logger.info(f"  - {item}")
-                else:
-                    logger.info(f"[DEBUG api/views.py:225] Other type, printing directly")
-                    logger.info(f"  {response_data['data']}")
-            except Exception as e:
-                logger.error(f"[ERROR api/views.py:228] Error while logging data: {str(e)}")
-                logger.error(f"[ERROR api/views.py:229] Data type: {type(response_data['data'])}")
-                logger.error(f"[ERROR api/views.py:230] Data value: {response_data['data']}")
-        logger.info("="*80 + "\n")
+            log_payload(logger, "Extracted Data", response_data['data'])
 
         return Response(response_data, status=status.HTTP_200_OK if result['success'] else status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    except ProcessLogError as e:
+        return Response(
+            {'success': False, 'error': str(e), 'log_id': e.log_id},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    except Exception as e:
+        return Response(
+            {'success': False, 'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+class ProcessLogError(Exception):
+    """처리 중 예외 (처리 로그는 실패로 기록됨)"""
+
+    def __init__(self, message: str, log_id: int):
+        super().__init__(message)
+        self.log_id = log_id
+
+
+def _run_process_log_or_fail(process_log, mapping_info, ai_metadata):
+    """인보이스 처리 - 예외 시 처리 로그를 실패로 기록 (합쳐진 요청도 같은 예외를 받음)"""
+    try:
+        return run_process_log(process_log, mapping_info, ai_metadata)
     except Exception as e:
-        # 오류 처리
         process_log.status = 'failed'
         process_log.error_message = str(e)
         process_log.save()
+        raise ProcessLogError(str(e), process_log.id) from e
+
+
+def _sse_event(event: str, data) -> str:
+    """Server-Sent Events 메시지 형식"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def process_invoice_stream(request):
+    """
+    인보이스 처리 API (Server-Sent Events 진행 상황 스트리밍)
+    요청 파라미터는 /api/process/ 와 동일 (async 제외)
+
+    Events (text/event-stream):
+    - started: 처리 로그 생성 (log_id)
+    - ocr_done: OCR 완료 (추출 글자 수, 소요 시간)
+    - step_done: 단계별 부분 결과 (영문 필드명, 단계가 끝나는 순서대로)
+    - hs_code_done: HS 코드 추천 완료
+    - result: 최종 병합 결과 (result_json) 및 처리 시간
+    """
+    _apply_debug_trace(request)
+    params, error_response = _validate_process_request(request)
+    if error_response is not None:
+        return error_response
+
+    service_user = params['service_user']
+    declaration = params['declaration']
+    ai_engine = params['ai_engine']
+
+    logger.info(f"[API REQUEST] /api/process/stream/ - User: {request.user.username}")
+
+    # 스트리밍 전용 워커 풀에 빈 자리가 없으면 대기시키지 않고 거절 (비동기 작업 풀과 분리)
+    if not reserve_stream_slot():
+        logger.warning(f"[STREAM] Rejected - all {getattr(settings, 'STREAM_MAX_WORKERS', 4)} stream workers busy")
+        return Response({
+            'success': False,
+            'error': '처리 중인 요청이 많습니다. 잠시 후 다시 시도해 주세요.'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    try:
+        process_log = InvoiceProcessLog.objects.create(
+            service_user=service_user,
+            declaration=declaration,
+            image_file=params['image_file'],
+            ai_engine=ai_engine,
+            hs_code_process_order=params['hs_code_process_order'],
+            status='processing',
+            claimed_at=timezone.now(),
+            attempts=1
+        )
+        snapshot = load_declaration_config(declaration, service_user)
+    except Exception:
+        release_stream_slot()
+        raise
 
+    events = queue.Queue()
+
+    def on_event(event, data):
+        events.put((event, data))
+
+    def run():
+        # 스트리밍 워커 풀에서 처리 (클라이언트 연결이 끊어져도 처리 로그는 끝까지 갱신)
+        close_old_connections()
+        try:
+            result = run_process_log(process_log, snapshot.mapping_info(), snapshot.ai_metadata, on_event=on_event)
+            events.put(('result', {
+                'success': result['success'],
+                'log_id': process_log.id,
+                'data': result.get('result_json'),
+                'processing_time': result.get('processing_time'),
+                'timings': result.get('timings'),
+                'hs_code_recommendation': result.get('hs_code_recommendation'),
+                'error': result.get('error')
+            }))
+        except Exception as e:
+            logger.exception(f"[STREAM] Log {process_log.id} failed")
+            InvoiceProcessLog.objects.filter(pk=process_log.id).update(status='failed', error_message=str(e))
+            events.put(('result', {'success': False, 'log_id': process_log.id, 'error': str(e)}))
+        finally:
+            close_old_connections()
+
+    submit_stream(run)
+
+    def stream():
+        yield _sse_event('started', {
+            'log_id': process_log.id,
+            'ai_engine': engine_label(ai_engine)
+        })
+        keepalive = getattr(settings, 'SSE_KEEPALIVE_SECONDS', 15)
+        while True:
+            try:
+                event, data = events.get(timeout=keepalive)
+            except queue.Empty:
+                # 프록시 연결 유지용 주석
+                yield ": keep-alive\n\n"
+                continue
+            yield _sse_event(event, data)
+            if event == 'result':
+                break
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 프록시 버퍼링 없이 이벤트를 바로 전달
+    return response
+
+
+def _collect_batch_files(request) -> list:
+    """
+    배치 요청의 이미지 파일 목록 (images 여러 개 또는 zip 파일)
+
+    Returns:
+        [(파일명, 파일 객체), ...]
+    """
+    files = [(f.name, f) for f in request.FILES.getlist('images')]
+
+    archive = request.FILES.get('archive')
+    if archive:
+        max_files = getattr(settings, 'BATCH_MAX_FILES', 100)
+        max_file_size = getattr(settings, 'BATCH_MAX_FILE_SIZE', 20 * 1024 * 1024)
+        max_total_size = getattr(settings, 'BATCH_MAX_TOTAL_SIZE', 200 * 1024 * 1024)
+        try:
+            with zipfile.ZipFile(archive) as zf:
+                # 압축 해제 전에 목록(헤더)만으로 파일 수/크기 제한 확인
+                members = []
+                total_size = 0
+                for info in zf.infolist():
+                    name = os.path.basename(info.filename)
+                    if info.is_dir() or not name or info.filename.startswith('__MACOSX'):
+                        continue
+                    if not name.lower().endswith(BATCH_IMAGE_EXTENSIONS):
+                        continue
+                    if len(files) + len(members) >= max_files:
+                        raise Exception(f'한 번에 최대 {max_files}개까지 처리할 수 있습니다.')
+                    if info.file_size > max_file_size:
+                        raise Exception(f'zip 내 파일이 너무 큽니다: {name}')
+                    total_size += info.file_size
+                    if total_size > max_total_size:
+                        raise Exception(f'zip 내 파일 전체 크기가 {max_total_size // (1024 * 1024)}MB를 넘습니다.')
+                    members.append((name, info))
+
+                for name, info in members:
+                    files.append((name, ContentFile(zf.read(info), name=name)))
+        except zipfile.BadZipFile:
+            raise Exception('올바른 zip 파일이 아닙니다.')
+
+    return files
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def process_invoice_batch(request):
+    """
+    인보이스 일괄 처리 API (NDJSON 스트리밍)
+
+    Request Body:
+    - images: 인보이스 이미지 파일 (여러 개, multipart/form-data)
+    - archive: 인보이스 이미지가 들어 있는 zip 파일 (images 대신 또는 함께 사용)
+    - service_slug / customs_code / declaration_code: 모든 인보이스에 공통 적용
+    - ai_engine: AI 엔진 선택 (gemini, gpt 또는 local, 기본값: gpt)
+    - hs_code_process_order: HS 코드 추천을 실행할 테이블 처리 순서 (선택)
+    - concurrency: 동시 처리 수 (선택, 최대 BATCH_MAX_CONCURRENCY)
+
+    Response (application/x-ndjson):
+    - 인보이스별 결과 1줄 (type=result, 처리가 끝나는 순서대로)
+    - 마지막 요약 1줄 (type=summary)
+    """
+    _apply_debug_trace(request)
+    logger.info(f"[API REQUEST] /api/process/batch/ - User: {request.user.username}")
+
+    service_slug = request.data.get('service_slug')
+    customs_code = request.data.get('customs_code')
+    declaration_code = request.data.get('declaration_code')
+    ai_engine = request.data.get('ai_engine', 'gpt').lower()  # 기본값: gpt
+
+    if not service_slug or not customs_code or not declaration_code:
         return Response(
-            {'success': False, 'error': str(e), 'log_id': process_log.id},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            {'success': False, 'error': 'service_slug, customs_code, declaration_code가 필요합니다.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if ai_engine not in ENGINES:
+        return Response(
+            {'success': False, 'error': f"ai_engine은 {', '.join(ENGINES)} 중 하나여야 합니다."},
+            status=status.HTTP_400_BAD_REQUEST
         )
 
+    # HS 코드 추천 실행 순서 / 동시 처리 수 (선택)
+    try:
+        hs_code_process_order = int(request.data.get('hs_code_process_order') or 0) or None
+        max_concurrency = getattr(settings, 'BATCH_MAX_CONCURRENCY', 4)
+        concurrency = min(int(request.data.get('concurrency') or max_concurrency), max_concurrency)
+    except (ValueError, TypeError):
+        return Response(
+            {'success': False, 'error': 'hs_code_process_order, concurrency는 숫자여야 합니다.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        files = _collect_batch_files(request)
+    except Exception as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not files:
+        return Response(
+            {'success': False, 'error': '이미지 파일이 필요합니다.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    max_files = getattr(settings, 'BATCH_MAX_FILES', 100)
+    if len(files) > max_files:
+        return Response(
+            {'success': False, 'error': f'한 번에 최대 {max_files}개까지 처리할 수 있습니다.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # ServiceUser / Declaration 조회 및 권한 확인 (배치 전체 1회)
+    service_user = resolve_service_user(service_slug, customs_code)
+    declaration = resolve_declaration(service_user, declaration_code)
+
+    if request.user.user_type != 'admin':
+        if service_user.user != request.user:
+            return Response(
+                {'success': False, 'error': '권한이 없습니다.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+    # 설정 스냅샷 조회 (배치 전체 1회)
+    snapshot = load_declaration_config(declaration, service_user)
+
+    # 인보이스별 처리 로그 생성
+    process_logs = []
+    filenames = {}
+    for index, (filename, image_file) in enumerate(files):
+        process_log = InvoiceProcessLog.objects.create(
+            service_user=service_user,
+            declaration=declaration,
+            image_file=image_file,
+            ai_engine=ai_engine,
+            hs_code_process_order=hs_code_process_order,
+            status='processing',
+            claimed_at=timezone.now(),
+            attempts=1
+        )
+        process_logs.append(process_log)
+        filenames[process_log.id] = (index, filename)
+
+    logger.info(f"[BATCH] {len(process_logs)} invoices queued (concurrency={concurrency})")
+
+    def stream():
+        batch_start = time.time()
+        succeeded = 0
+        for process_log, result in iter_batch_results(process_logs, snapshot, concurrency):
+            index, filename = filenames[process_log.id]
+            if result.get('success'):
+                succeeded += 1
+            line = {
+                'type': 'result',
+                'index': index,
+                'filename': filename,
+                'log_id': process_log.id,
+                'success': result.get('success', False),
+                'data': result.get('result_json'),
+                'processing_time': result.get('processing_time'),
+                'timings': result.get('timings'),
+                'error': result.get('error')
+            }
+            yield json.dumps(line, ensure_ascii=False, default=str) + '\n'
+
+        summary = {
+            'type': 'summary',
+            'total': len(process_logs),
+            'succeeded': succeeded,
+            'failed': len(process_logs) - succeeded,
+            'processing_time': time.time() - batch_start,
+            'ai_engine': engine_label(ai_engine)
+        }
+        logger.info(f"[BATCH] Finished: {summary}")
+        yield json.dumps(summary, ensure_ascii=False) + '\n'
+
+    response = StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+    response['X-Accel-Buffering'] = 'no'  # 프록시 버퍼링 없이 결과를 바로 전달
+    return response
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -328,9 +602,11 @@ def get_process_log(request, log_id):
     - log_id: 처리 로그 ID
 
     Response:
-    - 처리 로그 상세 정보
+    - 처리 로그 상세 정보 (보관 기간이 지나 아카이브된 로그는 아카이브 파일에서 조회, archived: true)
     """
-    process_log = get_object_or_404(InvoiceProcessLog, pk=log_id)
+    process_log = InvoiceProcessLog.objects.filter(pk=log_id).first()
+    if process_log is None:
+        return _get_archived_process_log(request, log_id)
 
     # 권한 확인
     if request.user.user_type != 'admin':
@@ -340,6 +616,9 @@ def get_process_log(request, log_id):
                 status=status.HTTP_403_FORBIDDEN
             )
 
+    # 본문(OCR 텍스트/결과 JSON)은 상세 조회에서만 로드
+    payload = process_log.load_payload()
+
     return Response({
         'success': True,
         'data': {
@@ -347,8 +626,8 @@ def get_process_log(request, log_id):
             'service': process_log.service_user.service.name,
             'declaration': process_log.declaration.name,
             'status': process_log.status,
-            'ocr_text': process_log.ocr_text,
-            'result_json': process_log.result_json,
+            'ocr_text': payload['ocr_text'],
+            'result_json': payload['result_json'],
             'error_message': process_log.error_message,
             'processing_time': process_log.processing_time,
             'created_at': process_log.created_at,
@@ -357,48 +636,103 @@ def get_process_log(request, log_id):
     })
 
 
+def _get_archived_process_log(request, log_id):
+    """아카이브된 처리 로그 조회 (색인으로 아카이브 파일을 찾아 한 건만 읽음)"""
+    entry = get_object_or_404(ArchivedProcessLog.objects.select_related('service_user'), pk=log_id)
+
+    # 권한 확인
+    if request.user.user_type != 'admin':
+        if entry.service_user.user_id != request.user.id:
+            return Response(
+                {'success': False, 'error': '권한이 없습니다.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+    try:
+        record = load_archived_log(entry)
+    except Exception as e:
+        logger.error(f"아카이브된 처리 로그 조회 실패 (log_id={log_id}): {str(e)}", exc_info=True)
+        return Response(
+            {'success': False, 'error': f'아카이브 조회 실패: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    return Response({
+        'success': True,
+        'data': {
+            'id': record['id'],
+            'service': record['service'],
+            'declaration': record['declaration'],
+            'status': record['status'],
+            'ocr_text': record['ocr_text'],
+            'result_json': record['result_json'],
+            'error_message': record['error_message'],
+            'processing_time': record['processing_time'],
+            'created_at': record['created_at'],
+            'completed_at': record['completed_at'],
+            'archived': True,
+        }
+    })
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_process_logs(request):
     """
-    처리 로그 목록 조회 API
+    처리 로그 목록 조회 API (최신순, 커서 기반 페이지네이션)
 
     Query Parameters:
     - service_user_id: 서비스 사용자 ID (optional)
     - declaration_id: 신고서 ID (optional)
     - status: 상태 (optional)
-    - limit: 결과 개수 제한 (default: 50)
+    - limit: 페이지 크기 (default: 50, 최대 PROCESS_LOG_PAGE_MAX)
+    - cursor: 이전 응답의 next_cursor (optional, 없으면 첫 페이지)
 
     Response:
-    - 처리 로그 목록
+    - 처리 로그 목록, 다음 페이지 커서 (마지막 페이지면 null)
     """
-    logs = InvoiceProcessLog.objects.all()
+    logs = InvoiceProcessLog.objects.select_related('service_user__service', 'declaration').only(
+        'id', 'status', 'processing_time', 'created_at', 'completed_at',
+        'service_user__service__name', 'declaration__name'
+    ).annotate(
+        # 에러 메시지 본문 대신 유무만 조회
+        has_error=Case(
+            When(Q(error_message__isnull=True) | Q(error_message=''), then=Value(False)),
+            default=Value(True),
+            output_field=BooleanField()
+        )
+    )
 
     # 권한에 따른 필터링
     if request.user.user_type != 'admin':
         logs = logs.filter(service_user__user=request.user)
 
     # 필터 적용
-    service_user_id = request.query_params.get('service_user_id')
-    if service_user_id:
-        logs = logs.filter(service_user_id=service_user_id)
+    try:
+        service_user_id = request.query_params.get('service_user_id')
+        if service_user_id:
+            logs = logs.filter(service_user_id=int(service_user_id))
 
-    declaration_id = request.query_params.get('declaration_id')
-    if declaration_id:
-        logs = logs.filter(declaration_id=declaration_id)
+        declaration_id = request.query_params.get('declaration_id')
+        if declaration_id:
+            logs = logs.filter(declaration_id=int(declaration_id))
+
+        limit = int(request.query_params.get('limit', 50))
+    except ValueError:
+        return Response(
+            {'success': False, 'error': 'service_user_id, declaration_id, limit은 숫자여야 합니다.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
     log_status = request.query_params.get('status')
     if log_status:
         logs = logs.filter(status=log_status)
 
-    # 개수 제한
-    limit = int(request.query_params.get('limit', 50))
-    logs = logs.order_by('-created_at')[:limit]
+    # 페이지 크기 제한
+    limit = max(1, min(limit, getattr(settings, 'PROCESS_LOG_PAGE_MAX', 200)))
 
-    # 데이터 구성
-    data = []
-    for log in logs:
-        data.append({
+    def serialize(log):
+        return {
             'id': log.id,
             'service': log.service_user.service.name,
             'declaration': log.declaration.name,
@@ -406,12 +740,24 @@ def get_process_logs(request):
             'processing_time': log.processing_time,
             'created_at': log.created_at,
             'completed_at': log.completed_at,
-            'has_error': bool(log.error_message),
-        })
+            'has_error': log.has_error,
+        }
+
+    try:
+        data, next_cursor = keyset_page(
+            logs, request.query_params.get('cursor'), limit, serialize,
+            max_bytes=getattr(settings, 'PROCESS_LOG_PAGE_MAX_BYTES', 0)
+        )
+    except ValueError as e:
+        return Response(
+            {'success': False, 'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
     return Response({
         'success': True,
         'count': len(data),
+        'next_cursor': next_cursor,
         'data': data
     })
 
@@ -440,7 +786,7 @@ def get_declaration_config(request, declaration_id):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    service_user = get_object_or_404(ServiceUser, pk=service_user_id)
+    service_user = get_object_or_404(ServiceUser.objects.select_related('service', 'user'), pk=service_user_id)
 
     # 권한 확인
     if request.user.user_type != 'admin':
@@ -450,66 +796,9 @@ def get_declaration_config(request, declaration_id):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-    # 테이블 처리 설정 정보 가져오기 (테이블명으로 매칭)
-    table_configs = {}
-    configs = TableProcessConfig.objects.filter(
-        declaration=declaration,
-        service_user=service_user,
-        is_active=True
-    )
-    for config in configs:
-        table_configs[config.db_table_name] = {
-            'process_order': config.process_order,
-            'work_group': config.work_group,
-            'table_prompt': config.table_prompt  # 테이블 프롬프트 추가
-        }
-
-    # 매핑 정보 가져오기
-    mappings = MappingInfo.objects.filter(
-        declaration=declaration,
-        is_active=True
-    ).order_by('priority')
-
-    mapping_data = []
-    for mapping in mappings:
-        # 기본 프롬프트
-        basic_prompt = PromptConfig.objects.filter(
-            mapping=mapping,
-            prompt_type='basic',
-            service_user__isnull=True,
-            is_active=True
-        ).first()
-
-        # 추가 프롬프트
-        additional_prompt = PromptConfig.objects.filter(
-            mapping=mapping,
-            prompt_type='additional',
-            service_user=service_user,
-            is_active=True
-        ).first()
-
-        # 테이블 처리 설정 정보 (테이블명으로 조회)
-        process_order = None
-        work_group = None
-        table_prompt = None
-        table_config = table_configs.get(mapping.db_table_name)
-        if table_config:
-            process_order = table_config['process_order']
-            work_group = table_config['work_group']
-            table_prompt = table_config['table_prompt']
-
-        mapping_data.append({
-            'id': mapping.id,
-            'unipass_field_name': mapping.unipass_field_name,
-            'db_table_name': mapping.db_table_name,
-            'db_field_name': mapping.db_field_name,
-            'priority': mapping.priority,
-            'basic_prompt': basic_prompt.prompt_text if basic_prompt else None,
-            'additional_prompt': additional_prompt.prompt_text if additional_prompt else None,
-            'process_order': process_order,
-            'work_group': work_group,
-            'table_prompt': table_prompt,  # 테이블 프롬프트 추가
-        })
+    # 설정 스냅샷 조회 (설정 버전 기준 캐시)
+    snapshot = load_declaration_config(declaration, service_user)
+    mapping_data = [entry.as_config() for entry in snapshot.mappings]
 
     return Response({
         'success': True,
@@ -524,3 +813,137 @@ def get_declaration_config(request, declaration_id):
         },
         'mappings': mapping_data
     })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_config_cache_stats(request):
+    """
+    설정 스냅샷 캐시 통계 조회 API (관리자 전용)
+
+    Response:
+    - hits / misses / evictions / hit_rate / entries
+    """
+    if request.user.user_type != 'admin':
+        return Response(
+            {'success': False, 'error': '권한이 없습니다.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    return Response({
+        'success': True,
+        'data': get_cache_stats()
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_ocr_cache_stats(request):
+    """
+    OCR 캐시 통계 조회 API (관리자 전용)
+
+    Response:
+    - memory_hits / db_hits / misses / stores / hits / hit_rate / memory_entries
+    - batching: Vision 마이크로 배치 통계 (현재 프로세스 기준)
+    """
+    if request.user.user_type != 'admin':
+        return Response(
+            {'success': False, 'error': '권한이 없습니다.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    return Response({
+        'success': True,
+        'data': {
+            **ocr_cache.stats(),
+            'batching': ocr_batcher.stats()
+        }
+    })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def health_check(request):
+    """
+    헬스 체크 API (로드밸런서/모니터링용, 인증 불필요)
+    외부 API는 호출하지 않고 DB 연결과 프로세스 공용 클라이언트 생성 가능 여부만 확인
+
+    Response:
+    - success: 전체 정상 여부 (DB, OCR, AI 엔진 1개 이상)
+    - data: database / clients 상태
+    """
+    try:
+        connection.ensure_connection()
+        database_ok = True
+    except Exception as e:
+        logger.warning(f"Health check - database error: {str(e)}")
+        database_ok = False
+
+    clients = check_clients_health()
+    healthy = database_ok and clients['vision']['ok'] and (clients['openai']['ok'] or clients['gemini']['ok'])
+
+    return Response(
+        {
+            'success': healthy,
+            'data': {
+                'database': database_ok,
+                'clients': clients
+            }
+        },
+        status=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_metrics(request):
+    """
+    처리 지표 조회 API (관리자 전용, Prometheus 텍스트 형식)
+    METRICS_DIR이 설정된 경우 모든 워커 프로세스의 값을 합산
+
+    Response (text/plain; version=0.0.4):
+    - invoice_requests_total / invoice_requests_in_flight
+    - invoice_stage_seconds / invoice_step_seconds (히스토그램)
+    - provider_errors_total / provider_retries_total / ai_tokens_total
+    """
+    if request.user.user_type != 'admin':
+        return Response(
+            {'success': False, 'error': '권한이 없습니다.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    return HttpResponse(metrics_registry.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_slow_requests(request):
+    """
+    느린 요청 조회 API (관리자 전용, 요청을 받은 워커 프로세스 기준)
+
+    Query Parameters:
+    - limit: 반환할 느린 요청 수 (선택, 느린 순)
+
+    Response:
+    - threshold_ms / total_requests
+    - recent: 최근 요청 지연 시간 분포 (count, p50, p95, p99, max - 초)
+    - slow_requests: 요청 ID, 경로, 상태 코드, 소요 시간, DB 쿼리 수/시간, 처리 단계별 시간
+    """
+    if request.user.user_type != 'admin':
+        return Response(
+            {'success': False, 'error': '권한이 없습니다.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    try:
+        limit = int(request.query_params.get('limit', 0)) or None
+    except ValueError:
+        return Response(
+            {'success': False, 'error': 'limit은 숫자여야 합니다.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return Response({
+        'success': True,
+        'data': slow_requests.snapshot(limit)
+    })
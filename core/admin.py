@@ -1,9 +1,29 @@
+import json
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.utils.html import format_html
 from .models import (
     CustomUser, Service, ServiceUser, Declaration,
-    TableProcessConfig, MappingInfo, PromptConfig, InvoiceProcessLog
+    TableProcessConfig, MappingInfo, PromptConfig, InvoiceProcessLog,
+    ArchivedProcessLog, StoredImage, OCRCacheEntry
 )
+from .config_loader import bump_config_version
+
+
+class ConfigVersionBumpMixin:
+    """저장/삭제 시 설정 버전을 증가시켜 설정 스냅샷 캐시를 무효화"""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        bump_config_version()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_config_version()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_config_version()
 
 
 @admin.register(CustomUser)
@@ -21,7 +41,7 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(Service)
 class ServiceAdmin(admin.ModelAdmin):
-    list_display = ['name', 'is_active', 'created_at', 'updated_at']
+    list_display = ['name', 'is_active', 'log_retention_days', 'created_at', 'updated_at']
     list_filter = ['is_active']
     search_fields = ['name', 'description']
 
@@ -34,14 +54,14 @@ class ServiceUserAdmin(admin.ModelAdmin):
 
 
 @admin.register(Declaration)
-class DeclarationAdmin(admin.ModelAdmin):
+class DeclarationAdmin(ConfigVersionBumpMixin, admin.ModelAdmin):
     list_display = ['name', 'service', 'declaration_type', 'is_active', 'created_at']
     list_filter = ['service', 'declaration_type', 'is_active']
     search_fields = ['name', 'description']
 
 
 @admin.register(TableProcessConfig)
-class TableProcessConfigAdmin(admin.ModelAdmin):
+class TableProcessConfigAdmin(ConfigVersionBumpMixin, admin.ModelAdmin):
     list_display = ['declaration', 'work_group', 'db_table_name', 'process_order',
                    'service_user', 'is_active']
     list_filter = ['declaration', 'is_active']
@@ -53,7 +73,7 @@ class TableProcessConfigAdmin(admin.ModelAdmin):
         if request.user.is_superuser or request.user.user_type == 'admin':
             # admin은 모든 필드 표시
             return ['declaration', 'service_user', 'work_group', 'db_table_name',
-                   'process_order', 'table_prompt', 'is_active']
+                   'process_order', 'depends_on', 'needs_ocr', 'pages', 'region', 'table_prompt', 'is_active']
         else:
             # 일반 사용자는 업무그룹만 표시
             return ['declaration', 'service_user', 'work_group', 'is_active']
@@ -76,7 +96,7 @@ class TableProcessConfigAdmin(admin.ModelAdmin):
 
 
 @admin.register(MappingInfo)
-class MappingInfoAdmin(admin.ModelAdmin):
+class MappingInfoAdmin(ConfigVersionBumpMixin, admin.ModelAdmin):
     list_display = ['unipass_field_name', 'db_table_name', 'db_field_name',
                    'declaration', 'table_config', 'priority', 'is_active']
     list_filter = ['declaration', 'table_config', 'is_active']
@@ -87,14 +107,14 @@ class MappingInfoAdmin(admin.ModelAdmin):
         if request.user.is_superuser or request.user.user_type == 'admin':
             return ['declaration', 'service_user', 'table_config', 'unipass_field_name',
                    'db_table_name', 'db_field_name', 'field_type', 'field_length',
-                   'priority', 'is_active']
+                   'keyword_hints', 'priority', 'is_active']
         else:
             return ['declaration', 'service_user', 'table_config', 'unipass_field_name',
-                   'field_type', 'field_length', 'priority', 'is_active']
+                   'field_type', 'field_length', 'keyword_hints', 'priority', 'is_active']
 
 
 @admin.register(PromptConfig)
-class PromptConfigAdmin(admin.ModelAdmin):
+class PromptConfigAdmin(ConfigVersionBumpMixin, admin.ModelAdmin):
     list_display = ['mapping', 'prompt_type', 'service_user', 'created_by', 'created_at']
     list_filter = ['prompt_type', 'is_active']
     search_fields = ['prompt_text', 'mapping__unipass_field_name']
@@ -104,5 +124,61 @@ class PromptConfigAdmin(admin.ModelAdmin):
 class InvoiceProcessLogAdmin(admin.ModelAdmin):
     list_display = ['declaration', 'service_user', 'status', 'processing_time', 'created_at']
     list_filter = ['status', 'declaration', 'created_at']
-    search_fields = ['ocr_text', 'error_message']
-    readonly_fields = ['created_at', 'completed_at', 'processing_time']
+    search_fields = ['error_message']  # 본문은 압축 보관되어 검색 대상에서 제외
+    list_select_related = ['declaration__service', 'service_user__service', 'service_user__user']
+    readonly_fields = ['created_at', 'completed_at', 'processing_time',
+                       'payload_ocr_text', 'payload_gpt_request', 'payload_gpt_response', 'payload_result_json']
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        if obj is not None:
+            # 상세 화면에서만 본문 로드
+            obj.payload_data = obj.load_payload()
+        return obj
+
+    def _payload_field(self, obj, field):
+        value = getattr(obj, 'payload_data', {}).get(field)
+        if value is not None and not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False, indent=2)
+        if value is None:
+            return '-'
+        return format_html('<pre style="white-space: pre-wrap;">{}</pre>', value)
+
+    @admin.display(description='OCR 추출 텍스트')
+    def payload_ocr_text(self, obj):
+        return self._payload_field(obj, 'ocr_text')
+
+    @admin.display(description='GPT 요청')
+    def payload_gpt_request(self, obj):
+        return self._payload_field(obj, 'gpt_request')
+
+    @admin.display(description='GPT 응답')
+    def payload_gpt_response(self, obj):
+        return self._payload_field(obj, 'gpt_response')
+
+    @admin.display(description='결과 JSON')
+    def payload_result_json(self, obj):
+        return self._payload_field(obj, 'result_json')
+
+
+@admin.register(ArchivedProcessLog)
+class ArchivedProcessLogAdmin(admin.ModelAdmin):
+    list_display = ['id', 'declaration', 'service_user', 'status', 'created_at', 'archive_file', 'archived_at']
+    list_filter = ['status', 'declaration__service']
+    list_select_related = ['declaration__service', 'service_user__service', 'service_user__user']
+    readonly_fields = ['id', 'service_user', 'declaration', 'status', 'created_at',
+                       'archive_file', 'image_file', 'archived_at']
+
+
+@admin.register(StoredImage)
+class StoredImageAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'ref_count', 'size', 'created_at', 'updated_at']
+    search_fields = ['sha256']
+    readonly_fields = ['name', 'sha256', 'size', 'ref_count', 'created_at', 'updated_at']
+
+
+@admin.register(OCRCacheEntry)
+class OCRCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['image_sha256', 'hit_count', 'created_at', 'expires_at']
+    search_fields = ['image_sha256', 'cache_key']
+    readonly_fields = ['cache_key', 'image_sha256', 'hit_count', 'created_at']
@@ -5,3 +5,12 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
     verbose_name = '핵심 모듈'
+
+    def ready(self):
+        # 서버 재시작 전에 등록된 비동기 처리 작업 복구
+        from .jobs import schedule_resume_pending_jobs
+        schedule_resume_pending_jobs()
+
+        # 외부 API 클라이언트 미리 생성 (PROVIDER_CLIENT_WARMUP)
+        from .clients import schedule_warmup_clients
+        schedule_warmup_clients()
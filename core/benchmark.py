@@ -0,0 +1,516 @@
+"""
+인보이스 처리 벤치마크 (기록/재생)
+기록(record): 실제 Vision/AI 호출의 응답과 지연 시간을 인보이스별로 저장
+재생(replay): 저장된 응답을 원래 지연 시간만큼 기다린 뒤 돌려주며 API 뷰(/api/process/) 또는
+InvoiceProcessor.process 전체 흐름을 실행하고 단계별 소요 시간, DB 쿼리 수, 메모리 할당(tracemalloc),
+최대 RSS를 측정 (설정 로더, 프롬프트 구성, 키 변환 등의 성능 회귀를 배포 전에 확인)
+
+코퍼스 디렉터리:
+    manifest.json           [{"name": "inv-001", "image": "inv-001.pdf", "service_slug": "...", "customs_code": "...",
+                              "declaration_code": "...", "ai_engine": "gpt", "hs_code_process_order": 3}]
+    recordings/<name>.json  기록된 Vision/AI 응답 (record로 생성)
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import mimetypes
+import threading
+import tracemalloc
+from contextlib import contextmanager, ExitStack
+from typing import Dict, Any, List, Optional, Callable
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from google.cloud import vision
+from .clients import get_vision_client, override_client
+from .config_loader import resolve_service_user, resolve_declaration, load_declaration_config, clear_config_cache
+from .engines import ENGINES, EnginePrompt, EngineResponse
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger('core')
+
+# tracemalloc 상위 할당 위치 수
+TOP_ALLOCATIONS = 10
+
+# 회귀 비교에서 제외하는 값 (소요 시간이 아니거나 클수록 좋은 값)
+_NOT_COMPARED = {'pages', 'ocr_pages_per_second', 'ocr_overlap_saved'}
+
+# 같은 조건으로 측정한 결과끼리만 비교
+_COMPARE_CONDITIONS = ('via', 'latency_scale', 'cold_config')
+
+
+def load_manifest(corpus_dir: str) -> List[Dict[str, Any]]:
+    """코퍼스 목록 로드"""
+    manifest_path = os.path.join(corpus_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        raise Exception(f"manifest.json이 없습니다: {manifest_path}")
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        items = json.load(f)
+    for item in items:
+        item.setdefault('ai_engine', 'gpt')
+        item['image_path'] = os.path.join(corpus_dir, item['image'])
+    return items
+
+
+def recording_path(corpus_dir: str, name: str) -> str:
+    return os.path.join(corpus_dir, 'recordings', f'{name}.json')
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """프로세스 최대 RSS (resource 모듈이 없는 환경에서는 None)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux는 KB, macOS는 bytes 단위
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _image_sha256(image) -> str:
+    return hashlib.sha256(image.content).hexdigest()
+
+
+class VisionRecorder:
+    """Vision 클라이언트 응답 기록 (text_detection / batch_annotate_images)"""
+
+    def __init__(self, client):
+        self.client = client
+        self.responses = {}
+        self._lock = threading.Lock()
+
+    def _record(self, image, response, latency: float):
+        with self._lock:
+            self.responses[_image_sha256(image)] = {
+                'response': vision.AnnotateImageResponse.to_json(response),
+                'latency': latency
+            }
+
+    def text_detection(self, image, **kwargs):
+        start = time.time()
+        response = self.client.text_detection(image=image, **kwargs)
+        self._record(image, response, time.time() - start)
+        return response
+
+    def batch_annotate_images(self, requests, **kwargs):
+        start = time.time()
+        response = self.client.batch_annotate_images(requests=requests, **kwargs)
+        latency = time.time() - start
+        for request, image_response in zip(requests, response.responses):
+            self._record(request['image'], image_response, latency)
+        return response
+
+
+class VisionReplayer:
+    """기록된 Vision 응답 재생 (원래 지연 시간 x latency_scale 만큼 대기)"""
+
+    def __init__(self, responses: Dict[str, Any], latency_scale: float = 1.0):
+        self.responses = responses
+        self.latency_scale = latency_scale
+
+    def _lookup(self, image):
+        recorded = self.responses.get(_image_sha256(image))
+        if recorded is None:
+            raise Exception("기록된 Vision 응답이 없습니다 (이미지가 기록 이후 변경됨)")
+        return recorded
+
+    def _sleep(self, latency: float):
+        if latency and self.latency_scale:
+            time.sleep(latency * self.latency_scale)
+
+    def text_detection(self, image, **kwargs):
+        recorded = self._lookup(image)
+        self._sleep(recorded['latency'])
+        return vision.AnnotateImageResponse.from_json(recorded['response'])
+
+    def batch_annotate_images(self, requests, **kwargs):
+        recorded = [self._lookup(request['image']) for request in requests]
+        # 배치 요청은 기록된 응답 중 가장 긴 지연 시간만큼 대기
+        self._sleep(max(item['latency'] for item in recorded))
+        return vision.BatchAnnotateImagesResponse(
+            responses=[vision.AnnotateImageResponse.from_json(item['response']) for item in recorded]
+        )
+
+
+def recording_engine_class(engine_class, recording: Dict[str, Any]):
+    """실제 엔진 호출 결과를 recording에 기록하는 엔진 클래스"""
+    lock = threading.Lock()
+    recording.update({'engine': engine_class.name, 'steps': {}, 'hs_code': []})
+
+    class RecordingEngine(engine_class):
+        def build_step_prompt(self, context, ocr_text, previous_results):
+            prompt = super().build_step_prompt(context, ocr_text, previous_results)
+            # 호출 시 단계(처리 순서)를 알 수 있도록 함께 전달
+            return EnginePrompt(prompt.text, (context.order, prompt.payload))
+
+        def call(self, prompt, extra_instruction, max_tokens):
+            order, payload = prompt.payload
+            start = time.time()
+            response = super().call(EnginePrompt(prompt.text, payload), extra_instruction, max_tokens)
+            with lock:
+                recording['steps'].setdefault(str(order), []).append({
+                    'extra_instruction': extra_instruction,
+                    'max_tokens': max_tokens,
+                    'text': response.text,
+                    'truncated': response.truncated,
+                    'usage': response.usage,
+                    'latency': time.time() - start
+                })
+            return response
+
+        def call_hs_code(self, prompt, images):
+            start = time.time()
+            text = super().call_hs_code(prompt, images)
+            with lock:
+                recording['hs_code'].append({'text': text, 'latency': time.time() - start})
+            return text
+
+    return RecordingEngine
+
+
+def replay_engine_class(engine_class, recording: Dict[str, Any], latency_scale: float = 1.0):
+    """
+    기록된 응답을 재생하는 엔진 클래스
+    프롬프트 구성은 실제 엔진 코드를 그대로 실행하고 API 호출만 기록된 응답으로 대체
+    (단계별 호출 순서대로 재생, 행 범위 분할 호출 포함)
+    """
+    lock = threading.Lock()
+
+    class ReplayEngine(engine_class):
+        def __init__(self):
+            # API 클라이언트는 생성하지 않음
+            self.positions = {}
+            self.hs_position = 0
+
+        def _sleep(self, latency: float):
+            if latency and latency_scale:
+                time.sleep(latency * latency_scale)
+
+        def build_step_prompt(self, context, ocr_text, previous_results):
+            prompt = super().build_step_prompt(context, ocr_text, previous_results)
+            return EnginePrompt(prompt.text, (context.order, prompt.payload))
+
+        def call(self, prompt, extra_instruction, max_tokens):
+            order = str(prompt.payload[0])
+            with lock:
+                index = self.positions.get(order, 0)
+                self.positions[order] = index + 1
+            calls = recording['steps'].get(order, [])
+            if index >= len(calls):
+                raise Exception(f"기록된 AI 응답이 없습니다 (처리 순서 {order}, {index + 1}번째 호출)")
+            recorded = calls[index]
+            self._sleep(recorded['latency'])
+            return EngineResponse(recorded['text'], recorded['truncated'], dict(recorded.get('usage') or {}))
+
+        def call_hs_code(self, prompt, images):
+            with lock:
+                index = self.hs_position
+                self.hs_position += 1
+            if index >= len(recording['hs_code']):
+                raise Exception("기록된 HS 코드 응답이 없습니다")
+            recorded = recording['hs_code'][index]
+            self._sleep(recorded['latency'])
+            return recorded['text']
+
+    return ReplayEngine
+
+
+@contextmanager
+def override_engine(name: str, engine_class):
+    """ai_engine 값의 엔진 클래스 임시 교체"""
+    previous = ENGINES.get(name)
+    ENGINES[name] = engine_class
+    try:
+        yield engine_class
+    finally:
+        if previous is None:
+            ENGINES.pop(name, None)
+        else:
+            ENGINES[name] = previous
+
+
+def _stage_timings(timings: Dict[str, Any]) -> Dict[str, float]:
+    """InvoiceProcessor 단계별 소요 시간 중 숫자 값만"""
+    return {
+        key: value for key, value in (timings or {}).items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+
+def run_processor(item: Dict[str, Any]) -> Dict[str, Any]:
+    """InvoiceProcessor.process로 1건 처리 (설정 로드 포함)"""
+    from .services import InvoiceProcessor
+
+    config_start = time.time()
+    service_user = resolve_service_user(item['service_slug'], item['customs_code'])
+    declaration = resolve_declaration(service_user, item['declaration_code'])
+    snapshot = load_declaration_config(declaration, service_user)
+    mapping_info = snapshot.mapping_info()
+    config_time = time.time() - config_start
+
+    result = InvoiceProcessor(engine=item['ai_engine']).process(
+        image_path=item['image_path'],
+        mapping_info=mapping_info,
+        ai_metadata=snapshot.ai_metadata,
+        hs_code_process_order=item.get('hs_code_process_order')
+    )
+    timings = _stage_timings(result.get('timings'))
+    timings['config'] = config_time
+    return {'success': result['success'], 'error': result.get('error'), 'timings': timings}
+
+
+def run_api(item: Dict[str, Any], user) -> Dict[str, Any]:
+    """/api/process/ 뷰로 1건 처리 (생성된 처리 로그와 이미지는 측정 후 삭제)"""
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from api.views import process_invoice
+
+    with open(item['image_path'], 'rb') as f:
+        upload = SimpleUploadedFile(
+            os.path.basename(item['image_path']), f.read(),
+            content_type=mimetypes.guess_type(item['image_path'])[0] or 'application/octet-stream'
+        )
+    data = {
+        'image': upload,
+        'service_slug': item['service_slug'],
+        'customs_code': item['customs_code'],
+        'declaration_code': item['declaration_code'],
+        'ai_engine': item['ai_engine'],
+    }
+    if item.get('hs_code_process_order'):
+        data['hs_code_process_order'] = item['hs_code_process_order']
+
+    request = APIRequestFactory().post('/api/process/', data, format='multipart')
+    force_authenticate(request, user=user)
+    try:
+        response = process_invoice(request)
+    finally:
+        # 서버 핸들러처럼 업로드 임시 파일 정리
+        request.close()
+    body = response.data or {}
+    return {
+        'success': bool(body.get('success')),
+        'error': body.get('error'),
+        'timings': _stage_timings(body.get('timings')),
+        'log_id': body.get('log_id')
+    }
+
+
+def cleanup_api_log(log_id: Optional[int]):
+    """벤치마크로 생성된 처리 로그 삭제 (이미지 참조는 post_delete 수신기에서 해제)"""
+    from .models import InvoiceProcessLog
+
+    if not log_id:
+        return
+    InvoiceProcessLog.objects.filter(id=log_id).delete()
+
+
+def measure(run: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """1회 실행의 전체 소요 시간과 DB 쿼리 수 (요청 스레드 연결 기준)"""
+    with CaptureQueriesContext(connection) as queries:
+        start = time.time()
+        outcome = run()
+        outcome['wall'] = time.time() - start
+    outcome['queries'] = len(queries.captured_queries)
+    return outcome
+
+
+def measure_allocations(run: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    tracemalloc으로 1회 실행의 메모리 할당 측정 (소요 시간 측정 실행과 분리)
+
+    Returns:
+        {peak_bytes, allocated_bytes, allocated_blocks, top: [{location, size, count}]}
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    stats = [stat for stat in after.compare_to(before, 'lineno') if stat.size_diff > 0]
+    return {
+        'peak_bytes': peak,
+        'allocated_bytes': sum(stat.size_diff for stat in stats),
+        'allocated_blocks': sum(stat.count_diff for stat in stats if stat.count_diff > 0),
+        'top': [
+            {
+                'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size': stat.size_diff,
+                'count': stat.count_diff
+            }
+            for stat in stats[:TOP_ALLOCATIONS]
+        ]
+    }
+
+
+def summarize_runs(runs: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """단계별 평균/최소/최대 (wall, queries, InvoiceProcessor timings)"""
+    values = {}
+    for run in runs:
+        for key, value in [('wall', run['wall']), ('queries', run['queries']), *run['timings'].items()]:
+            values.setdefault(key, []).append(value)
+    return {
+        key: {'mean': sum(items) / len(items), 'min': min(items), 'max': max(items)}
+        for key, items in values.items()
+    }
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+                    min_seconds: float = 0.005) -> List[Dict[str, Any]]:
+    """
+    기준 결과 대비 회귀 항목
+
+    시간 항목은 평균이 threshold 비율과 min_seconds를 모두 넘게 늘어난 경우,
+    DB 쿼리 수는 평균이 늘어난 경우, 메모리 최대 사용량은 threshold 비율을 넘게 늘어난 경우
+    """
+    for condition in _COMPARE_CONDITIONS:
+        if current.get(condition) != baseline.get(condition):
+            raise Exception(f"기준 결과와 측정 조건이 다릅니다 ({condition}: {baseline.get(condition)} -> {current.get(condition)})")
+
+    baseline_items = {item['name']: item for item in baseline.get('invoices', [])}
+    regressions = []
+    for item in current.get('invoices', []):
+        base = baseline_items.get(item['name'])
+        if base is None:
+            continue
+
+        for stage, stats in item.get('stages', {}).items():
+            base_stats = base.get('stages', {}).get(stage)
+            if base_stats is None or stage in _NOT_COMPARED:
+                continue
+            before, after = base_stats['mean'], stats['mean']
+            if stage == 'queries':
+                regressed = after > before
+            else:
+                regressed = after - before > min_seconds and after > before * (1 + threshold)
+            if regressed:
+                regressions.append({'name': item['name'], 'metric': stage, 'baseline': before, 'current': after})
+
+        before = (base.get('allocations') or {}).get('peak_bytes')
+        after = (item.get('allocations') or {}).get('peak_bytes')
+        if before and after and after > before * (1 + threshold):
+            regressions.append({'name': item['name'], 'metric': 'peak_bytes', 'baseline': before, 'current': after})
+    return regressions
+
+
+class Benchmark:
+    """코퍼스 기록/재생 실행"""
+
+    def __init__(self, corpus_dir: str, use_ocr_cache: bool = False, log: Callable[[str], None] = None):
+        self.corpus_dir = corpus_dir
+        self.items = load_manifest(corpus_dir)
+        # OCR 캐시를 사용하면 두 번째 실행부터 Vision 호출(재생)이 생략되므로 기본적으로 끔
+        self.use_ocr_cache = use_ocr_cache
+        self.log = log or logger.info
+
+    def _settings(self):
+        return override_settings(OCR_CACHE_ENABLED=self.use_ocr_cache and getattr(settings, 'OCR_CACHE_ENABLED', True))
+
+    def record(self) -> List[str]:
+        """실제 API로 코퍼스를 처리하며 응답 기록 (InvoiceProcessor 경로)"""
+        os.makedirs(os.path.join(self.corpus_dir, 'recordings'), exist_ok=True)
+        recorded = []
+        for item in self.items:
+            engine_class = ENGINES.get(item['ai_engine'])
+            if engine_class is None:
+                raise Exception(f"지원하지 않는 AI 엔진입니다: {item['ai_engine']}")
+
+            recording = {}
+            vision_recorder = VisionRecorder(get_vision_client())
+            with ExitStack() as stack:
+                stack.enter_context(override_settings(OCR_CACHE_ENABLED=False))
+                stack.enter_context(override_client('vision', vision_recorder))
+                stack.enter_context(override_engine(item['ai_engine'], recording_engine_class(engine_class, recording)))
+                outcome = run_processor(item)
+
+            if not outcome['success']:
+                raise Exception(f"{item['name']} 기록 실패: {outcome['error']}")
+
+            recording['vision'] = vision_recorder.responses
+            with open(recording_path(self.corpus_dir, item['name']), 'w', encoding='utf-8') as f:
+                json.dump(recording, f, ensure_ascii=False, indent=2)
+            recorded.append(item['name'])
+            self.log(f"{item['name']}: Vision {len(recording['vision'])}건, "
+                     f"AI {sum(len(calls) for calls in recording['steps'].values())}건 기록")
+        return recorded
+
+    def replay(self, via: str = 'api', user=None, iterations: int = 3, latency_scale: float = 1.0,
+               trace_allocations: bool = True, cold_config: bool = False) -> Dict[str, Any]:
+        """
+        기록된 응답으로 코퍼스 재생 및 측정
+
+        Args:
+            via: 'api' (/api/process/ 뷰) 또는 'processor' (InvoiceProcessor.process)
+            user: API 요청 사용자 (via='api')
+            iterations: 인보이스별 측정 반복 횟수
+            latency_scale: 기록된 지연 시간 배율 (0이면 대기 없음 - CPU 처리 시간만 측정)
+            trace_allocations: 측정 후 tracemalloc으로 1회 더 실행하여 메모리 할당 측정
+            cold_config: 매 실행 전 설정 스냅샷 캐시 비움 (설정 로더 측정용)
+        """
+        results = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'via': via,
+            'iterations': iterations,
+            'latency_scale': latency_scale,
+            'cold_config': cold_config,
+            'python': sys.version.split()[0],
+            'invoices': []
+        }
+
+        for item in self.items:
+            path = recording_path(self.corpus_dir, item['name'])
+            if not os.path.exists(path):
+                raise Exception(f"{item['name']} 기록이 없습니다. 먼저 record를 실행하세요: {path}")
+            with open(path, 'r', encoding='utf-8') as f:
+                recording = json.load(f)
+
+            engine_class = ENGINES.get(recording['engine'])
+            if engine_class is None:
+                raise Exception(f"지원하지 않는 AI 엔진입니다: {recording['engine']}")
+            item = {**item, 'ai_engine': recording['engine']}
+
+            def run():
+                if cold_config:
+                    clear_config_cache()
+                if via == 'api':
+                    outcome = run_api(item, user)
+                    cleanup_api_log(outcome.get('log_id'))
+                    return outcome
+                return run_processor(item)
+
+            rss_before = peak_rss_bytes()
+            with ExitStack() as stack:
+                stack.enter_context(self._settings())
+                stack.enter_context(override_client('vision', VisionReplayer(recording['vision'], latency_scale)))
+                stack.enter_context(override_engine(
+                    recording['engine'], replay_engine_class(engine_class, recording, latency_scale)
+                ))
+
+                runs = [measure(run) for _ in range(iterations)]
+                allocations = measure_allocations(run) if trace_allocations else None
+
+            failed = next((run for run in runs if not run['success']), None)
+            results['invoices'].append({
+                'name': item['name'],
+                'success': failed is None,
+                'error': failed['error'] if failed else None,
+                'runs': [{key: run[key] for key in ('wall', 'queries', 'timings')} for run in runs],
+                'stages': summarize_runs(runs),
+                'allocations': allocations,
+                'peak_rss_bytes': peak_rss_bytes(),
+                'peak_rss_growth_bytes': (peak_rss_bytes() - rss_before) if rss_before is not None else None
+            })
+            self.log(f"{item['name']}: wall {results['invoices'][-1]['stages']['wall']['mean']:.3f}s, "
+                     f"queries {results['invoices'][-1]['stages']['queries']['mean']:.1f}")
+
+        results['peak_rss_bytes'] = peak_rss_bytes()
+        return results
@@ -0,0 +1,207 @@
+"""
+외부 API 클라이언트 레지스트리
+Google Vision / OpenAI / Gemini 클라이언트를 워커 프로세스당 한 번만 생성하여 재사용
+(요청마다 gRPC 채널, TLS 연결, 자격증명 파일 확인을 반복하지 않음)
+"""
+import os
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Callable
+import httpx
+from django.conf import settings
+from google.cloud import vision
+from google.cloud.vision_v1.services.image_annotator.transports import ImageAnnotatorGrpcTransport
+from openai import OpenAI
+import google.generativeai as genai
+from .metrics import provider_retries_total
+
+logger = logging.getLogger('core')
+
+# Gemini 2.5 Flash - 빠르고 안정적인 멀티모달 모델
+GEMINI_MODEL_NAME = 'gemini-2.5-flash'
+
+_clients = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def _get_or_create(name: str, factory: Callable[[], Any]) -> Any:
+    """클라이언트 조회 (없으면 생성, fork된 프로세스에서는 새로 생성)"""
+    global _pid
+    if os.getpid() != _pid:
+        # 부모 프로세스에서 만든 gRPC 채널/HTTP 연결은 자식 프로세스에서 사용할 수 없음
+        with _lock:
+            if os.getpid() != _pid:
+                _clients.clear()
+                _pid = os.getpid()
+
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+                logger.info(f"[CLIENTS] {name} client created (pid={_pid})")
+    return client
+
+
+def _create_vision_client() -> vision.ImageAnnotatorClient:
+    # OCR 필수: Google Vision API 설정 필수
+    credentials_path = settings.GOOGLE_VISION_CREDENTIALS
+    if not credentials_path:
+        raise Exception("Google Vision API 자격증명이 설정되지 않았습니다. .env 파일에 GOOGLE_VISION_CREDENTIALS를 설정해주세요.")
+
+    if not os.path.exists(credentials_path):
+        raise Exception(f"Google Vision API 자격증명 파일을 찾을 수 없습니다: {credentials_path}")
+
+    try:
+        # keep-alive 설정된 gRPC 채널 1개를 프로세스 내 모든 스레드가 공유
+        channel = ImageAnnotatorGrpcTransport.create_channel(
+            credentials_file=credentials_path,
+            options=[
+                ('grpc.keepalive_time_ms', getattr(settings, 'VISION_KEEPALIVE_TIME_MS', 30000)),
+                ('grpc.keepalive_permit_without_calls', 1),
+            ]
+        )
+        return vision.ImageAnnotatorClient(transport=ImageAnnotatorGrpcTransport(channel=channel))
+    except Exception as e:
+        raise Exception(f"Google Vision API 초기화 실패: {str(e)}\n\n해결 방법:\n1. Google Cloud Console에서 Vision API 활성화\n2. 서비스 계정에 'Cloud Vision API User' 역할 부여")
+
+
+def _count_openai_retryable(response: httpx.Response):
+    # OpenAI SDK가 재시도하는 상태 코드 (408/409/429/5xx) 집계
+    if response.status_code in (408, 409, 429) or response.status_code >= 500:
+        provider_retries_total.inc(provider='gpt', reason=f'http_{response.status_code}')
+
+
+def _create_openai_client() -> OpenAI:
+    # httpx 클라이언트를 직접 생성 (환경 변수의 proxy 설정 무시, 연결 풀 재사용)
+    http_client = httpx.Client(
+        timeout=getattr(settings, 'OPENAI_TIMEOUT', 60.0),
+        trust_env=False,  # 환경 변수의 proxy 설정 무시
+        limits=httpx.Limits(
+            max_connections=getattr(settings, 'OPENAI_MAX_CONNECTIONS', 20),
+            max_keepalive_connections=getattr(settings, 'OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10),
+            keepalive_expiry=getattr(settings, 'OPENAI_KEEPALIVE_EXPIRY', 60.0)
+        ),
+        event_hooks={'response': [_count_openai_retryable]}
+    )
+
+    return OpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        http_client=http_client,
+        max_retries=2
+    )
+
+
+def _create_gemini_model() -> genai.GenerativeModel:
+    # genai.configure는 프로세스 전역 설정이므로 한 번만 호출
+    genai.configure(api_key=getattr(settings, 'GEMINI_API_KEY', None))
+    return genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+
+def get_vision_client() -> vision.ImageAnnotatorClient:
+    """Google Vision 클라이언트 (프로세스 공용)"""
+    return _get_or_create('vision', _create_vision_client)
+
+
+def get_openai_client() -> OpenAI:
+    """OpenAI 클라이언트 (프로세스 공용, httpx 연결 풀)"""
+    return _get_or_create('openai', _create_openai_client)
+
+
+def get_gemini_model() -> genai.GenerativeModel:
+    """Gemini 모델 (프로세스 공용)"""
+    return _get_or_create('gemini', _create_gemini_model)
+
+
+@contextmanager
+def override_client(name: str, client: Any):
+    """
+    클라이언트 임시 교체 (벤치마크 기록/재생용)
+    프로세스 공용 레지스트리를 바꾸므로 OCR 배치 스레드 등 모든 스레드에 적용됨
+    """
+    with _lock:
+        previous = _clients.get(name)
+        _clients[name] = client
+    try:
+        yield client
+    finally:
+        with _lock:
+            if previous is None:
+                _clients.pop(name, None)
+            else:
+                _clients[name] = previous
+
+
+_factories = {
+    'vision': get_vision_client,
+    'openai': get_openai_client,
+    'gemini': get_gemini_model,
+}
+
+
+def _is_configured(name: str) -> bool:
+    if name == 'vision':
+        return bool(getattr(settings, 'GOOGLE_VISION_CREDENTIALS', None))
+    if name == 'openai':
+        return bool(getattr(settings, 'OPENAI_API_KEY', None))
+    return bool(getattr(settings, 'GEMINI_API_KEY', None))
+
+
+def warmup_clients() -> Dict[str, bool]:
+    """
+    설정된 클라이언트를 미리 생성 (첫 요청에서 연결 비용이 발생하지 않도록)
+
+    Returns:
+        클라이언트별 생성 성공 여부
+    """
+    results = {}
+    for name, factory in _factories.items():
+        if not _is_configured(name):
+            continue
+        try:
+            factory()
+            results[name] = True
+        except Exception as e:
+            logger.warning(f"[CLIENTS] {name} warmup failed: {str(e)}")
+            results[name] = False
+    return results
+
+
+def schedule_warmup_clients():
+    """앱 초기화를 막지 않도록 백그라운드 스레드에서 클라이언트 생성"""
+    from .jobs import is_server_process
+    if not getattr(settings, 'PROVIDER_CLIENT_WARMUP', False) or not is_server_process():
+        return
+
+    thread = threading.Thread(target=warmup_clients, name='client-warmup', daemon=True)
+    thread.start()
+
+
+def check_clients_health() -> Dict[str, Dict[str, Any]]:
+    """
+    클라이언트 상태 확인 (외부 API 호출 없이 설정 및 생성 가능 여부만 확인)
+
+    Returns:
+        클라이언트별 {configured, initialized, ok}
+    """
+    health = {}
+    for name, factory in _factories.items():
+        configured = _is_configured(name)
+        initialized = name in _clients and os.getpid() == _pid
+        ok = False
+        if configured:
+            try:
+                factory()
+                ok = True
+            except Exception as e:
+                logger.warning(f"[CLIENTS] {name} health check failed: {str(e)}")
+        health[name] = {
+            'configured': configured,
+            'initialized': initialized,
+            'ok': ok
+        }
+    return health
@@ -0,0 +1,288 @@
+"""
+신고서 설정 스냅샷 로더
+(신고서, 서비스 사용자) 단위로 테이블 처리 설정, 매핑정보, 프롬프트를
+고정된 몇 개의 쿼리로 한 번에 조회하여 불변 스냅샷으로 구성하고,
+설정 버전(ConfigVersion) 기준으로 프로세스 내 캐시에 보관
+"""
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+from django.conf import settings
+from django.db.models import F, Prefetch, Q
+from django.shortcuts import get_object_or_404
+from .models import (
+    ServiceUser, Declaration, TableProcessConfig, MappingInfo,
+    PromptConfig, ConfigVersion
+)
+
+logger = logging.getLogger('core')
+
+# 신고서 설정 전체에 대한 버전 키
+CONFIG_VERSION_KEY = 'declaration_config'
+
+
+@dataclass(frozen=True)
+class StepConfig:
+    """테이블 처리 단계 (TableProcessConfig 1건)"""
+    process_order: int
+    work_group: str
+    db_table_name: str
+    table_prompt: Optional[str]
+    depends_on: Optional[Tuple[str, ...]]
+    needs_ocr: bool
+    pages: str
+    region: str
+
+
+@dataclass(frozen=True)
+class MappingEntry:
+    """매핑정보 1건 (프롬프트 및 처리 단계 정보 포함)"""
+    id: int
+    unipass_field_name: str
+    db_table_name: str
+    db_field_name: str
+    priority: int
+    basic_prompt: Optional[str]
+    additional_prompt: Optional[str]
+    keyword_hints: str
+    process_order: Optional[int]
+    work_group: Optional[str]
+    table_prompt: Optional[str]
+    depends_on: Optional[Tuple[str, ...]]
+    needs_ocr: bool
+    pages: str
+    region: str
+
+    def as_mapping_info(self) -> Dict[str, Any]:
+        """InvoiceProcessor에 전달하는 매핑 정보 형식 (호출마다 새 dict 반환)"""
+        return {
+            'unipass_field_name': self.unipass_field_name,
+            'db_table_name': self.db_table_name,
+            'db_field_name': self.db_field_name,
+            'basic_prompt': self.basic_prompt,
+            'additional_prompt': self.additional_prompt,
+            'keyword_hints': self.keyword_hints,
+            'process_order': self.process_order,
+            'work_group': self.work_group,
+            'table_prompt': self.table_prompt,
+            'depends_on': list(self.depends_on) if self.depends_on is not None else None,
+            'needs_ocr': self.needs_ocr,
+            'pages': self.pages,
+            'region': self.region
+        }
+
+    def as_config(self) -> Dict[str, Any]:
+        """신고서 설정 조회 API 응답 형식"""
+        return {
+            'id': self.id,
+            'unipass_field_name': self.unipass_field_name,
+            'db_table_name': self.db_table_name,
+            'db_field_name': self.db_field_name,
+            'priority': self.priority,
+            'basic_prompt': self.basic_prompt,
+            'additional_prompt': self.additional_prompt,
+            'keyword_hints': self.keyword_hints,
+            'process_order': self.process_order,
+            'work_group': self.work_group,
+            'table_prompt': self.table_prompt,
+            'depends_on': list(self.depends_on) if self.depends_on is not None else None,
+            'needs_ocr': self.needs_ocr,
+            'pages': self.pages,
+            'region': self.region,
+        }
+
+
+@dataclass(frozen=True)
+class DeclarationConfigSnapshot:
+    """(신고서, 서비스 사용자) 설정 스냅샷"""
+    version: int
+    declaration_id: int
+    service_user_id: int
+    ai_metadata: Optional[str]
+    steps: Tuple[StepConfig, ...]
+    mappings: Tuple[MappingEntry, ...]
+
+    def mapping_info(self) -> list:
+        """엔진에서 수정해도 스냅샷이 바뀌지 않도록 매번 새 리스트 반환"""
+        return [entry.as_mapping_info() for entry in self.mappings]
+
+    def key_map(self) -> Dict[str, str]:
+        """한글 항목명 -> 테이블명.필드명"""
+        return {
+            entry.unipass_field_name: f"{entry.db_table_name}.{entry.db_field_name}"
+            for entry in self.mappings
+        }
+
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def get_config_version() -> int:
+    """현재 설정 버전 조회 (1 쿼리)"""
+    version = ConfigVersion.objects.filter(name=CONFIG_VERSION_KEY).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_config_version():
+    """
+    설정 버전 증가
+    매핑/프롬프트/테이블 처리 설정/신고서 메타데이터 변경 시 호출
+    """
+    updated = ConfigVersion.objects.filter(name=CONFIG_VERSION_KEY).update(version=F('version') + 1)
+    if not updated:
+        ConfigVersion.objects.get_or_create(name=CONFIG_VERSION_KEY, defaults={'version': 1})
+
+    # 현재 프로세스의 캐시는 즉시 비움 (다른 프로세스는 버전 비교로 무효화)
+    clear_config_cache()
+
+
+def clear_config_cache():
+    """현재 프로세스의 설정 스냅샷 캐시 비움"""
+    with _lock:
+        _cache.clear()
+
+
+def resolve_service_user(service_slug: str, customs_code: str) -> ServiceUser:
+    """service_slug + customs_code로 ServiceUser 조회 (서비스/관세사 조인 1 쿼리)"""
+    queryset = ServiceUser.objects.select_related('service', 'user')
+    if customs_code == 'default':
+        return get_object_or_404(queryset, service__slug=service_slug, is_default=True)
+    return get_object_or_404(queryset, service__slug=service_slug, user__customs_code=customs_code)
+
+
+def resolve_declaration(service_user: ServiceUser, declaration_code: str) -> Declaration:
+    """서비스 사용자의 서비스에 속한 신고서 조회"""
+    return get_object_or_404(Declaration, service_id=service_user.service_id, code=declaration_code)
+
+
+def _build_snapshot(declaration: Declaration, service_user: ServiceUser, version: int) -> DeclarationConfigSnapshot:
+    """스냅샷 구성 (테이블 처리 설정 1 쿼리 + 매핑 1 쿼리 + 프롬프트 1 쿼리)"""
+    configs = TableProcessConfig.objects.filter(
+        declaration=declaration,
+        service_user=service_user,
+        is_active=True
+    ).order_by('process_order')
+
+    # 테이블명으로 매칭
+    table_configs = {}
+    steps = []
+    for config in configs:
+        step = StepConfig(
+            process_order=config.process_order,
+            work_group=config.work_group,
+            db_table_name=config.db_table_name,
+            table_prompt=config.table_prompt,
+            depends_on=tuple(config.depends_on) if config.depends_on is not None else None,
+            needs_ocr=config.needs_ocr,
+            pages=config.pages,
+            region=config.region
+        )
+        table_configs[config.db_table_name] = step
+        steps.append(step)
+
+    # 기본 프롬프트(service_user 없음) + 해당 서비스 사용자의 추가 프롬프트만 prefetch
+    prompts = PromptConfig.objects.filter(is_active=True).filter(
+        Q(prompt_type='basic', service_user__isnull=True) |
+        Q(prompt_type='additional', service_user=service_user)
+    ).order_by('pk')
+
+    mappings = MappingInfo.objects.filter(
+        declaration=declaration,
+        is_active=True
+    ).order_by('priority').prefetch_related(
+        Prefetch('prompts', queryset=prompts, to_attr='active_prompts')
+    )
+
+    entries = []
+    for mapping in mappings:
+        basic_prompt = None
+        additional_prompt = None
+        for prompt in mapping.active_prompts:
+            if prompt.prompt_type == 'basic' and basic_prompt is None:
+                basic_prompt = prompt.prompt_text
+            elif prompt.prompt_type == 'additional' and additional_prompt is None:
+                additional_prompt = prompt.prompt_text
+
+        step = table_configs.get(mapping.db_table_name)
+        entries.append(MappingEntry(
+            id=mapping.id,
+            unipass_field_name=mapping.unipass_field_name,
+            db_table_name=mapping.db_table_name,
+            db_field_name=mapping.db_field_name,
+            priority=mapping.priority,
+            basic_prompt=basic_prompt,
+            additional_prompt=additional_prompt,
+            keyword_hints=mapping.keyword_hints,
+            process_order=step.process_order if step else None,
+            work_group=step.work_group if step else None,
+            table_prompt=step.table_prompt if step else None,
+            depends_on=step.depends_on if step else None,
+            needs_ocr=step.needs_ocr if step else True,
+            pages=step.pages if step else '',
+            region=step.region if step else ''
+        ))
+
+    return DeclarationConfigSnapshot(
+        version=version,
+        declaration_id=declaration.id,
+        service_user_id=service_user.id,
+        ai_metadata=declaration.description if declaration.description else None,
+        steps=tuple(steps),
+        mappings=tuple(entries)
+    )
+
+
+def load_declaration_config(declaration: Declaration, service_user: ServiceUser) -> DeclarationConfigSnapshot:
+    """
+    설정 스냅샷 조회 (캐시 우선)
+
+    Args:
+        declaration: 신고서
+        service_user: 서비스 사용자
+
+    Returns:
+        불변 설정 스냅샷
+    """
+    key = (declaration.id, service_user.id)
+    version = get_config_version()
+
+    with _lock:
+        snapshot = _cache.get(key)
+        if snapshot is not None and snapshot.version == version:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return snapshot
+        _stats['misses'] += 1
+
+    snapshot = _build_snapshot(declaration, service_user, version)
+
+    max_entries = getattr(settings, 'CONFIG_SNAPSHOT_CACHE_SIZE', 256)
+    with _lock:
+        _cache[key] = snapshot
+        _cache.move_to_end(key)
+        while len(_cache) > max_entries:
+            _cache.popitem(last=False)
+            _stats['evictions'] += 1
+
+    logger.info(f"[CONFIG] Snapshot built: declaration={declaration.id}, service_user={service_user.id}, "
+                f"version={version}, mappings={len(snapshot.mappings)}, steps={len(snapshot.steps)}")
+    return snapshot
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """스냅샷 캐시 적중/미적중 통계"""
+    with _lock:
+        hits = _stats['hits']
+        misses = _stats['misses']
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': _stats['evictions'],
+            'hit_rate': hits / total if total else 0.0,
+            'entries': len(_cache),
+        }
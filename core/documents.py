@@ -0,0 +1,167 @@
+"""
+다중 페이지 문서 처리
+PDF(pypdfium2 설치 시)와 다중 프레임 TIFF를 페이지별 이미지로 분리하고,
+여러 장의 인보이스 이미지를 하나의 다중 페이지 문서로 묶음
+"""
+import io
+import logging
+from typing import List, Optional
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, ImageSequence
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # PDF 인보이스를 사용하지 않는 환경
+    pdfium = None
+
+logger = logging.getLogger('core')
+
+
+def _read_header(image_path: str) -> bytes:
+    with open(image_path, 'rb') as f:
+        return f.read(8)
+
+
+def is_pdf(header: bytes) -> bool:
+    return header.startswith(b'%PDF')
+
+
+def is_tiff(header: bytes) -> bool:
+    return header.startswith(b'II*\x00') or header.startswith(b'MM\x00*')
+
+
+def _encode_page(page: Image.Image) -> bytes:
+    """페이지 이미지를 PNG 바이트로 변환 (OCR 정확도를 위해 무손실)"""
+    if page.mode not in ('RGB', 'L'):
+        page = page.convert('RGB')
+    buffer = io.BytesIO()
+    page.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _split_pdf(image_path: str, max_pages: int) -> List[bytes]:
+    if pdfium is None:
+        raise Exception("PDF 인보이스를 처리하려면 pypdfium2 패키지를 설치해주세요. (pip install pypdfium2)")
+
+    scale = getattr(settings, 'PDF_RENDER_DPI', 200) / 72
+    pdf = pdfium.PdfDocument(image_path)
+    try:
+        page_count = len(pdf)
+        if page_count > max_pages:
+            raise Exception(f"문서 페이지 수가 너무 많습니다: {page_count}페이지 (최대 {max_pages}페이지)")
+
+        pages = []
+        for index in range(page_count):
+            page = pdf[index]
+            try:
+                pages.append(_encode_page(page.render(scale=scale).to_pil()))
+            finally:
+                page.close()
+        return pages
+    finally:
+        pdf.close()
+
+
+def _split_tiff(image_path: str, max_pages: int) -> Optional[List[bytes]]:
+    with Image.open(image_path) as img:
+        frame_count = getattr(img, 'n_frames', 1)
+        if frame_count <= 1:
+            # 단일 프레임 TIFF는 일반 이미지와 동일하게 처리
+            return None
+        if frame_count > max_pages:
+            raise Exception(f"문서 페이지 수가 너무 많습니다: {frame_count}페이지 (최대 {max_pages}페이지)")
+        return [_encode_page(frame.copy()) for frame in ImageSequence.Iterator(img)]
+
+
+def split_document(image_path: str) -> Optional[List[bytes]]:
+    """
+    다중 페이지 문서를 페이지별 이미지로 분리
+
+    Args:
+        image_path: 업로드된 파일 경로
+
+    Returns:
+        페이지 순서대로 PNG 바이트 목록 (단일 이미지인 경우 None)
+    """
+    header = _read_header(image_path)
+    max_pages = getattr(settings, 'DOCUMENT_MAX_PAGES', 30)
+
+    if is_pdf(header):
+        pages = _split_pdf(image_path, max_pages)
+    elif is_tiff(header):
+        pages = _split_tiff(image_path, max_pages)
+    else:
+        return None
+
+    if pages is not None:
+        logger.info(f"[DOCUMENT] Split into {len(pages)} pages: {image_path}")
+    return pages
+
+
+def parse_pages(spec: Optional[str], page_count: int) -> List[int]:
+    """
+    처리 페이지 설정을 페이지 인덱스(0부터)로 변환
+
+    Args:
+        spec: '1', '1-2', '2,4', 'last', '2-last' 등 (빈 값: 전체)
+        page_count: 문서 페이지 수
+
+    Returns:
+        정렬된 페이지 인덱스 목록 (해당하는 페이지가 없으면 전체)
+    """
+    all_pages = list(range(page_count))
+    spec = (spec or '').strip().lower()
+    if not spec:
+        return all_pages
+
+    def to_number(token):
+        return page_count if token == 'last' else int(token)
+
+    selected = set()
+    for token in spec.split(','):
+        token = token.strip()
+        if not token:
+            continue
+        try:
+            if '-' in token:
+                start, end = token.split('-', 1)
+                start, end = to_number(start.strip()), to_number(end.strip())
+                selected.update(range(start - 1, end))
+            else:
+                selected.add(to_number(token) - 1)
+        except ValueError:
+            logger.warning(f"[DOCUMENT] Ignoring invalid page spec '{token}'")
+
+    pages = sorted(index for index in selected if 0 <= index < page_count)
+    return pages or all_pages
+
+
+def combine_page_texts(page_texts: List[str]) -> str:
+    """페이지별 OCR 텍스트를 페이지 순서대로 결합"""
+    if len(page_texts) == 1:
+        return page_texts[0]
+    return "\n\n".join(f"[페이지 {index}]\n{text}" for index, text in enumerate(page_texts, 1))
+
+
+def combine_images(files) -> ContentFile:
+    """
+    여러 장의 인보이스 이미지를 하나의 다중 프레임 TIFF로 결합 (업로드 순서 = 페이지 순서)
+
+    Args:
+        files: 업로드된 이미지 파일 목록
+
+    Returns:
+        처리 로그에 저장할 TIFF 파일
+    """
+    frames = []
+    for uploaded in files:
+        with Image.open(uploaded) as img:
+            img = ImageOps.exif_transpose(img)
+            frame = img.convert('L') if img.mode in ('1', 'L') else img.convert('RGB')
+            frames.append(frame)
+
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format='TIFF', save_all=True, append_images=frames[1:], compression='tiff_deflate')
+    name = f"{files[0].name.rsplit('.', 1)[0]}_{len(frames)}p.tiff"
+    return ContentFile(buffer.getvalue(), name=name)
@@ -0,0 +1,31 @@
+"""
+AI 엔진 (ai_engine 값별 어댑터)
+새 제공자는 AIEngine을 구현하여 ENGINES에 등록하면 StepOrchestrator의 단계 처리 흐름을 그대로 사용
+"""
+from .base import AIEngine, StepContext, EnginePrompt, EngineResponse
+from .orchestrator import StepOrchestrator, emit_event, resolve_ocr_text, prepare_step_inputs
+from .gemini import GeminiEngine
+from .chatgpt import ChatGPTEngine
+from .local import LocalEngine
+
+# ai_engine 값 -> 엔진 클래스
+ENGINES = {
+    GeminiEngine.name: GeminiEngine,
+    ChatGPTEngine.name: ChatGPTEngine,
+    LocalEngine.name: LocalEngine,
+}
+
+
+def get_engine(name: str) -> AIEngine:
+    """ai_engine 값으로 엔진 생성"""
+    engine_class = ENGINES.get(name)
+    if engine_class is None:
+        raise Exception(f"지원하지 않는 AI 엔진입니다: {name} (사용 가능: {', '.join(ENGINES)})")
+    return engine_class()
+
+
+def engine_label(name: str) -> str:
+    """ai_engine 값의 표시 이름 (응답/로그용)"""
+    engine_class = ENGINES.get(name)
+    return engine_class.label if engine_class else name
+
@@ -0,0 +1,74 @@
+"""
+AI 엔진 인터페이스
+제공자별 어댑터는 프롬프트 구성과 API 호출만 구현하고,
+단계 그룹화/스케줄링/토큰 예산/결과 병합/HS 코드 추천은 StepOrchestrator가 공통으로 처리
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+from ..image_preprocess import PreparedImage
+
+
+@dataclass
+class StepContext:
+    """단계 1건의 프롬프트 구성 정보"""
+    step_num: int
+    total_steps: int
+    order: int
+    mappings: List[Dict[str, Any]]
+    images: List[PreparedImage]
+    ai_metadata: Optional[str] = None
+    # 캐시 친화적 구성(PROMPT_LAYOUT=cache_friendly)의 공통 지시문 (legacy 구성이면 None)
+    static_instructions: Optional[str] = None
+
+
+@dataclass
+class EnginePrompt:
+    """엔진별 요청 내용"""
+    text: str  # 로그/처리 로그 저장 및 토큰 계산용 텍스트
+    payload: Any = None  # 엔진이 API 호출에 사용하는 내용 (Gemini contents, ChatGPT messages 등)
+
+
+@dataclass
+class EngineResponse:
+    """엔진 응답"""
+    text: str
+    truncated: bool = False  # 응답 토큰 상한에 걸려 잘렸는지 여부
+    usage: Dict[str, Any] = field(default_factory=dict)
+
+
+class AIEngine:
+    """AI 엔진 어댑터 기본 클래스"""
+
+    # ai_engine 값 (gpt / gemini / local)
+    name = ''
+    # 응답/로그 표시 이름
+    label = ''
+    # 값을 찾을 수 없는 항목 처리 규칙 (프롬프트에 포함)
+    missing_value_rule = "값을 찾을 수 없는 경우 null을 사용하세요."
+    # 품목 목록의 HS 코드 응답 키
+    hs_code_list_key = 'hs'
+    # True면 실패한 단계는 빈 결과로 두고 다음 단계 진행, False면 전체 처리 실패
+    continue_on_step_error = False
+
+    def estimate_image_tokens(self, image: PreparedImage) -> int:
+        """첨부 이미지 토큰 추정치 (토큰 예산 계산용)"""
+        raise NotImplementedError
+
+    def build_step_prompt(self, context: StepContext, ocr_text: Optional[str], previous_results: Dict[str, Any]) -> EnginePrompt:
+        """단계 프롬프트 구성"""
+        raise NotImplementedError
+
+    def call(self, prompt: EnginePrompt, extra_instruction: Optional[str], max_tokens: int) -> EngineResponse:
+        """
+        단계 API 호출
+
+        Args:
+            prompt: build_step_prompt 결과
+            extra_instruction: 프롬프트 마지막에 추가할 지시문 (행 범위 분할 요청 등)
+            max_tokens: 응답 토큰 상한
+        """
+        raise NotImplementedError
+
+    def call_hs_code(self, prompt: str, images: List[PreparedImage]) -> str:
+        """HS 코드 추천 API 호출 (응답 텍스트 반환)"""
+        raise NotImplementedError
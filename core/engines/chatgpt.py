@@ -0,0 +1,234 @@
+"""
+OpenAI ChatGPT 엔진
+"""
+from typing import List, Optional, Dict, Any
+from ..clients import get_openai_client
+from ..image_preprocess import PreparedImage, estimate_openai_image_tokens
+from ..prompt_layout import build_ocr_block, build_step_block, extract_openai_usage
+from .base import AIEngine, StepContext, EnginePrompt, EngineResponse
+
+
+def _image_contents(images: List[PreparedImage]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "type": "image_url",
+            "image_url": {
+                "url": image.data_url
+            }
+        }
+        for image in images
+    ]
+
+
+class ChatGPTEngine(AIEngine):
+    """OpenAI ChatGPT API 엔진"""
+
+    name = 'gpt'
+    label = 'ChatGPT'
+    missing_value_rule = "값을 찾을 수 없는 경우 생략하세요."
+    hs_code_list_key = 'HS코드'
+    # 실패한 단계는 결과 없이 다음 단계 진행 (기존 ChatGPT 처리 방식)
+    continue_on_step_error = True
+
+    def __init__(self):
+        # OpenAI 클라이언트 (proxy 없이, 프로세스 공용 연결 풀)
+        self.client = get_openai_client()
+
+    def estimate_image_tokens(self, image: PreparedImage) -> int:
+        return estimate_openai_image_tokens(image.width, image.height)
+
+    def build_step_prompt(self, context: StepContext, ocr_text: Optional[str], previous_results: Dict[str, Any]) -> EnginePrompt:
+        image_contents = _image_contents(context.images)
+
+        if context.static_instructions:
+            # 공통 접두사(시스템 프롬프트 + OCR + 이미지) 뒤에 단계별 내용 배치
+            system_prompt = context.static_instructions
+            ocr_block = build_ocr_block(ocr_text)
+            step_block = build_step_block(context.mappings, previous_results, context.step_num, context.total_steps)
+            user_content = []
+            if ocr_block:
+                user_content.append({"type": "text", "text": ocr_block})
+            user_content.extend(image_contents)
+            user_content.append({"type": "text", "text": step_block})
+            user_prompt = f"{ocr_block}[이미지]\n\n{step_block}"
+        else:
+            # 현재 단계 시스템 프롬프트 구성 (선행 단계 결과 포함)
+            system_prompt = self._build_system_prompt_with_previous_results(
+                context.mappings,
+                context.ai_metadata,
+                previous_results,
+                context.step_num,
+                context.total_steps
+            )
+
+            if ocr_text:
+                user_prompt = f"""
+                [OCR 추출 텍스트 - 참고용]
+                {ocr_text}
+
+                **중요**: 위 OCR 텍스트는 참고용이며, 반드시 이미지를 직접 분석하여 정확한 값을 추출하세요.
+                시스템 프롬프트에 명시된 매핑 정보와 규칙에 따라 JSON 형태로 데이터를 정리해주세요.
+                """
+            else:
+                user_prompt = "첨부된 인보이스 이미지를 직접 분석하여 시스템 프롬프트에 명시된 매핑 정보와 규칙에 따라 JSON 형태로 데이터를 정리해주세요."
+
+            user_content = [
+                {
+                    "type": "text",
+                    "text": user_prompt
+                },
+                *image_contents
+            ]
+
+        return EnginePrompt(
+            f"[System Prompt]\n{system_prompt}\n[User Prompt]\n{user_prompt}",
+            (system_prompt, user_content)
+        )
+
+    def call(self, prompt: EnginePrompt, extra_instruction: Optional[str], max_tokens: int) -> EngineResponse:
+        # ChatGPT API 호출
+        system_prompt, user_content = prompt.payload
+        content = user_content + [{"type": "text", "text": extra_instruction}] if extra_instruction else user_content
+        response = self.client.chat.completions.create(
+            model="gpt-4.1",
+            messages=[
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ],
+            max_tokens=max_tokens,
+            temperature=0.1
+        )
+        choice = response.choices[0]
+        return EngineResponse(
+            choice.message.content or '',
+            choice.finish_reason == 'length',
+            extract_openai_usage(response) or {}
+        )
+
+    def call_hs_code(self, prompt: str, images: List[PreparedImage]) -> str:
+        response = self.client.chat.completions.create(
+            model="gpt-4.1",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": prompt
+                        },
+                        *_image_contents(images)
+                    ]
+                }
+            ],
+            max_tokens=2048,
+            temperature=0.3
+        )
+        return response.choices[0].message.content
+
+    def _build_system_prompt_with_previous_results(
+        self,
+        mapping_info: list,
+        ai_metadata: str,
+        previous_results: dict,
+        step_num: int,
+        total_steps: int
+    ) -> str:
+        """이전 결과를 포함한 시스템 프롬프트 구성 (순차 처리용)"""
+
+        prompt = f"당신은 인보이스(Invoice) 데이터를 분석하고 구조화하는 전문가입니다.\n\n"
+
+        prompt += f"=== 현재 단계: {step_num}/{total_steps} ===\n"
+        prompt += "이 작업은 여러 단계로 나뉘어 처리됩니다. 현재 단계에서는 아래 지정된 항목만 추출하면 됩니다.\n\n"
+
+        # 이전 단계 결과가 있으면 포함
+        if previous_results:
+            prompt += "[이전 단계에서 추출된 데이터]\n"
+            prompt += "참고: 아래는 이전 단계에서 이미 추출된 데이터입니다. 이 정보를 참고하여 현재 단계의 데이터를 추출하세요.\n\n"
+            if isinstance(previous_results, dict):
+                for key, value in previous_results.items():
+                    prompt += f"  - {key}: {value}\n"
+            else:
+                prompt += f"{previous_results}\n"
+            prompt += "\n"
+
+        prompt += "=== 중요: 첨부된 이미지를 우선적으로 분석하세요 ===\n"
+        prompt += "이 요청에는 인보이스 이미지가 첨부되어 있습니다. 반드시 이미지를 직접 확인하여 정확한 정보를 추출하세요.\n\n"
+
+        # AI 메타데이터를 최상위로 배치
+        if ai_metadata:
+            prompt += f"[문서 정보]\n{ai_metadata}\n\n"
+
+        # 테이블 정보 추출 (테이블명과 table_prompt)
+        table_info = {}
+        for mapping in mapping_info:
+            table_name = mapping.get('db_table_name')
+            table_prompt = mapping.get('table_prompt')
+            if table_name and table_name not in table_info:
+                table_info[table_name] = table_prompt
+
+        # 테이블 프롬프트가 있는 경우 표시
+        if any(table_info.values()):
+            prompt += "[테이블별 추출 가이드]\n"
+            for table_name, table_prompt in table_info.items():
+                if table_prompt:
+                    prompt += f"\n<{table_name} 테이블>\n{table_prompt}\n"
+            prompt += "\n"
+
+        # 추출할 항목 및 규칙
+        prompt += "[이번 단계에서 추출할 항목 및 규칙]\n"
+        prompt += "다음 항목들의 데이터를 이미지에서 찾아 아래 규칙에 따라 추출해주세요:\n\n"
+
+        # 각 매핑 정보별로 항목과 프롬프트 배치 (table_prompt는 제외)
+        for mapping in mapping_info:
+            field_name = mapping['unipass_field_name']
+
+            prompt += f"• {field_name}\n"
+
+            if mapping.get('basic_prompt'):
+                prompt += f"  - {mapping['basic_prompt']}\n"
+
+            if mapping.get('additional_prompt'):
+                prompt += f"  - {mapping['additional_prompt']}\n"
+
+            prompt += "\n"
+
+        prompt += """[응답 형식]
+반드시 다음 형식의 JSON으로 응답해주세요.
+**중요**: JSON의 키는 위에 제시된 한글 항목명(유니패스 필드명)을 그대로 사용해야 합니다.
+**주의**: 이번 단계에서 요청한 항목만 JSON에 포함하세요. 이전 단계 데이터는 포함하지 마세요.
+
+```json
+{
+  "항목명1": "추출된_값1",
+  "항목명2": "추출된_값2",
+  ...
+}
+```
+
+예시:
+```json
+{
+  "판매자명": "N.S TRADING",
+  "송장일자": "2025-05-22",
+  "차대번호": "KMHDU41BP7U253602"
+}
+```
+
+주의사항:
+1. **반드시 첨부된 이미지를 직접 분석**하여 정확한 정보를 추출하세요.
+2. OCR 텍스트는 참고용이며, 이미지가 우선입니다.
+3. 이전 단계 데이터는 참고만 하고, 현재 단계 항목만 추출하세요.
+4. 값을 찾을 수 없는 경우 생략하세요.
+5. 날짜는 YYYY-MM-DD 형식으로 변환하세요.
+6. 숫자는 천단위 구분자 없이 숫자만 추출하세요.
+7. JSON 키는 위에 제시된 한글 항목명을 정확히 사용하세요.
+8. 반드시 JSON 형식으로만 응답하세요.
+9. 각 항목별로 제시된 규칙을 준수하세요.
+"""
+        return prompt
@@ -0,0 +1,161 @@
+"""
+Google Gemini 엔진
+"""
+from typing import List, Optional, Dict, Any
+from django.conf import settings
+from ..clients import get_gemini_model
+from ..image_preprocess import PreparedImage, estimate_gemini_image_tokens
+from ..prompt_layout import build_ocr_block, build_step_block, extract_gemini_usage, is_gemini_truncated
+from .base import AIEngine, StepContext, EnginePrompt, EngineResponse
+
+
+class GeminiEngine(AIEngine):
+    """Google Gemini API 엔진"""
+
+    name = 'gemini'
+    label = 'Gemini'
+
+    def __init__(self):
+        # Gemini 2.5 Flash - 빠르고 안정적인 멀티모달 모델 (프로세스 공용)
+        self.model = get_gemini_model()
+
+    def estimate_image_tokens(self, image: PreparedImage) -> int:
+        return estimate_gemini_image_tokens(image.width, image.height)
+
+    def build_step_prompt(self, context: StepContext, ocr_text: Optional[str], previous_results: Dict[str, Any]) -> EnginePrompt:
+        images = [image.as_gemini_part() for image in context.images]
+
+        if context.static_instructions:
+            # 공통 접두사(지시문 + 문서 정보 + OCR) -> 이미지 -> 단계별 내용 순서
+            prefix = context.static_instructions + build_ocr_block(ocr_text)
+            step_block = build_step_block(context.mappings, previous_results, context.step_num, context.total_steps)
+            return EnginePrompt(f"{prefix}[이미지]\n\n{step_block}", [prefix, *images, step_block])
+
+        # 현재 단계 프롬프트 구성 (선행 단계 결과 포함)
+        prompt = self._build_prompt_with_previous_results(
+            context.mappings,
+            context.ai_metadata,
+            ocr_text,
+            previous_results,
+            context.step_num,
+            context.total_steps
+        )
+        return EnginePrompt(prompt, [prompt, *images])
+
+    def call(self, prompt: EnginePrompt, extra_instruction: Optional[str], max_tokens: int) -> EngineResponse:
+        # Gemini API 호출 (2.5 모델은 생각 토큰도 출력 상한에 포함되므로 여유분 추가)
+        contents = prompt.payload + [extra_instruction] if extra_instruction else prompt.payload
+        response = self.model.generate_content(
+            contents,
+            generation_config={
+                'max_output_tokens': max_tokens + getattr(settings, 'GEMINI_THINKING_RESERVE_TOKENS', 8192)
+            }
+        )
+        try:
+            text = response.text
+        except ValueError:
+            # 응답 상한에 걸려 텍스트가 없는 경우
+            text = ''
+        return EngineResponse(text, is_gemini_truncated(response), extract_gemini_usage(response) or {})
+
+    def call_hs_code(self, prompt: str, images: List[PreparedImage]) -> str:
+        response = self.model.generate_content([prompt, *[image.as_gemini_part() for image in images]])
+        return response.text
+
+    def _build_prompt_with_previous_results(
+        self,
+        mapping_info: list,
+        ai_metadata: str,
+        ocr_text: str,
+        previous_results: dict,
+        step_num: int,
+        total_steps: int
+    ) -> str:
+        """이전 결과를 포함한 프롬프트 구성 (순차 처리용)"""
+
+        prompt = f"당신은 인보이스(Invoice) 데이터를 분석하고 구조화하는 전문가입니다.\n\n"
+
+        prompt += f"=== 현재 단계: {step_num}/{total_steps} ===\n"
+        prompt += "이 작업은 여러 단계로 나뉘어 처리됩니다. 현재 단계에서는 아래 지정된 항목만 추출하면 됩니다.\n\n"
+
+        # 이전 단계 결과가 있으면 포함
+        if previous_results:
+            prompt += "[이전 단계에서 추출된 데이터]\n"
+            prompt += "참고: 아래는 이전 단계에서 이미 추출된 데이터입니다. 이 정보를 참고하여 현재 단계의 데이터를 추출하세요.\n\n"
+            if isinstance(previous_results, dict):
+                for key, value in previous_results.items():
+                    prompt += f"  - {key}: {value}\n"
+            else:
+                prompt += f"{previous_results}\n"
+            prompt += "\n"
+
+        prompt += "=== 중요: 첨부된 이미지를 우선적으로 분석하세요 ===\n"
+        prompt += "이 요청에는 인보이스 이미지가 첨부되어 있습니다. 반드시 이미지를 직접 확인하여 정확한 정보를 추출하세요.\n\n"
+
+        # AI 메타데이터를 최상위로 배치
+        if ai_metadata:
+            prompt += f"[문서 정보]\n{ai_metadata}\n\n"
+
+        # 테이블 프롬프트 (있는 경우)
+        table_prompt = mapping_info[0].get('table_prompt') if mapping_info and mapping_info[0].get('table_prompt') else None
+        if table_prompt:
+            prompt += f"[테이블 전체 추출 가이드]\n{table_prompt}\n\n"
+
+        # 추출할 항목 및 규칙
+        prompt += "[이번 단계에서 추출할 항목 및 규칙]\n"
+        prompt += "다음 항목들의 데이터를 이미지에서 찾아 아래 규칙에 따라 추출해주세요:\n\n"
+
+        # 각 매핑 정보별로 항목과 프롬프트 배치
+        for mapping in mapping_info:
+            field_name = mapping['unipass_field_name']
+
+            prompt += f"• {field_name}\n"
+
+            if mapping.get('basic_prompt'):
+                prompt += f"  - {mapping['basic_prompt']}\n"
+
+            if mapping.get('additional_prompt'):
+                prompt += f"  - {mapping['additional_prompt']}\n"
+
+            prompt += "\n"
+
+        # OCR 텍스트 (참고용)
+        if ocr_text:
+            prompt += "[OCR 추출 텍스트 - 참고용]\n"
+            prompt += "다음은 OCR로 추출한 텍스트입니다. 참고용으로만 사용하고, 반드시 이미지를 직접 확인하여 정확한 값을 추출하세요:\n\n"
+            prompt += f"{ocr_text}\n\n"
+
+        prompt += """[응답 형식]
+반드시 다음 형식의 JSON으로 응답해주세요.
+**중요**: JSON의 키는 위에 제시된 한글 항목명(유니패스 필드명)을 그대로 사용해야 합니다.
+**주의**: 이번 단계에서 요청한 항목만 JSON에 포함하세요. 이전 단계 데이터는 포함하지 마세요.
+
+```json
+{
+  "항목명1": "추출된_값1",
+  "항목명2": "추출된_값2",
+  ...
+}
+```
+
+예시:
+```json
+{
+  "판매자명": "N.S TRADING",
+  "송장일자": "2025-05-22",
+  "차대번호": "KMHDU41BP7U253602"
+}
+```
+
+주의사항:
+1. **반드시 첨부된 이미지를 직접 분석**하여 정확한 정보를 추출하세요.
+2. OCR 텍스트는 참고용이며, 이미지가 우선입니다.
+3. 이전 단계 데이터는 참고만 하고, 현재 단계 항목만 추출하세요.
+4. 값을 찾을 수 없는 경우 null을 사용하세요.
+5. 날짜는 YYYY-MM-DD 형식으로 변환하세요.
+6. 숫자는 천단위 구분자 없이 숫자만 추출하세요.
+7. JSON 키는 위에 제시된 한글 항목명을 정확히 사용하세요.
+8. 반드시 JSON 형식으로만 응답하세요.
+9. 각 항목별로 제시된 규칙을 준수하세요.
+"""
+        return prompt
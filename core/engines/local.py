@@ -0,0 +1,128 @@
+"""
+로컬 엔진 (ai_engine = 'local')
+외부 API 없이 픽스처(LOCAL_ENGINE_FIXTURES) 값으로 결정적으로 응답하고, 설정한 지연 시간(LOCAL_ENGINE_LATENCY_MS)만큼 대기
+OCR -> 단계 스케줄링 -> 토큰 예산 -> 행 범위 분할 -> 결과 병합 전체 흐름을 오프라인으로 부하 테스트하는 용도
+
+픽스처 형식 (JSON):
+    {
+        "fields": {"송장번호": "INV-001", "CUSDEC830C1.qty": 3},   # 항목명, 테이블명.필드명 또는 필드명
+        "tables": {"CUSDEC830C1": [{"품명": "BOLT", "qty": 10}]},  # 품목 표 (행 목록으로 응답)
+        "hs_code": "7318.15.90.00"
+    }
+"""
+import os
+import re
+import json
+import time
+import threading
+from typing import List, Optional, Dict, Any
+from django.conf import settings
+from ..image_preprocess import PreparedImage, estimate_gemini_image_tokens
+from ..prompt_layout import build_static_instructions, build_ocr_block, build_step_block
+from ..token_budget import count_tokens, ROW_RANGE_PATTERN
+from .base import AIEngine, StepContext, EnginePrompt, EngineResponse
+
+# HS 코드 프롬프트의 품목 수 ("총 N개")
+_HS_ITEM_COUNT_PATTERN = re.compile(r'총 (\d+)개')
+
+# 픽스처 파일 캐시 (경로 -> (수정 시각, 내용))
+_fixtures_cache = {}
+_fixtures_lock = threading.Lock()
+
+
+def load_fixtures(path: Optional[str]) -> Dict[str, Any]:
+    """픽스처 파일 로드 (파일이 바뀐 경우에만 다시 읽음)"""
+    if not path:
+        return {}
+    try:
+        mtime = os.path.getmtime(path)
+        with _fixtures_lock:
+            cached = _fixtures_cache.get(path)
+            if cached is None or cached[0] != mtime:
+                with open(path, 'r', encoding='utf-8') as f:
+                    cached = (mtime, json.load(f))
+                _fixtures_cache[path] = cached
+        return cached[1]
+    except (OSError, ValueError) as e:
+        raise Exception(f"로컬 엔진 픽스처를 읽을 수 없습니다 ({path}): {str(e)}")
+
+
+class LocalEngine(AIEngine):
+    """픽스처 기반 결정적 로컬 엔진"""
+
+    name = 'local'
+    label = 'Local'
+
+    def __init__(self):
+        self.fixtures = load_fixtures(getattr(settings, 'LOCAL_ENGINE_FIXTURES', ''))
+        self.latency = getattr(settings, 'LOCAL_ENGINE_LATENCY_MS', 0) / 1000
+
+    def estimate_image_tokens(self, image: PreparedImage) -> int:
+        return estimate_gemini_image_tokens(image.width, image.height)
+
+    def build_step_prompt(self, context: StepContext, ocr_text: Optional[str], previous_results: Dict[str, Any]) -> EnginePrompt:
+        # 토큰 예산 계산이 실제 엔진과 비슷하도록 캐시 친화적 구성과 같은 내용으로 구성
+        instructions = context.static_instructions or build_static_instructions(context.ai_metadata, self.missing_value_rule)
+        step_block = build_step_block(context.mappings, previous_results, context.step_num, context.total_steps)
+        return EnginePrompt(f"{instructions}{build_ocr_block(ocr_text)}[이미지]\n\n{step_block}", context)
+
+    def _field_value(self, mapping: Dict[str, Any], row: Dict[str, Any]):
+        table_field = f"{mapping['db_table_name']}.{mapping['db_field_name']}"
+        for key in (mapping['unipass_field_name'], table_field, mapping['db_field_name']):
+            if key in row:
+                return row[key]
+        return None
+
+    def _step_output(self, mappings: List[Dict[str, Any]], extra_instruction: Optional[str]):
+        """단계 응답 JSON (품목 표 픽스처가 있으면 행 목록, 없으면 항목별 값)"""
+        rows = self.fixtures.get('tables', {}).get(mappings[0].get('db_table_name'))
+        if rows is not None:
+            match = ROW_RANGE_PATTERN.search(extra_instruction or '')
+            if match:
+                rows = rows[int(match.group(1)) - 1:int(match.group(2))]
+            return [
+                {mapping['unipass_field_name']: self._field_value(mapping, row) for mapping in mappings}
+                for row in rows
+            ]
+
+        fields = self.fixtures.get('fields', {})
+        output = {}
+        for mapping in mappings:
+            value = self._field_value(mapping, fields)
+            output[mapping['unipass_field_name']] = value if value is not None else f"LOCAL-{mapping['db_field_name']}"
+        return output
+
+    def call(self, prompt: EnginePrompt, extra_instruction: Optional[str], max_tokens: int) -> EngineResponse:
+        if self.latency:
+            time.sleep(self.latency)
+
+        context = prompt.payload
+        text = f"```json\n{json.dumps(self._step_output(context.mappings, extra_instruction), ensure_ascii=False, indent=2)}\n```"
+
+        # 실제 엔진처럼 응답 토큰 상한을 넘으면 잘린 응답 반환
+        output_tokens = count_tokens(text)
+        truncated = output_tokens > max_tokens
+        if truncated:
+            text = text[:len(text) * max_tokens // output_tokens]
+            output_tokens = max_tokens
+
+        prompt_tokens = count_tokens(prompt.text) + count_tokens(extra_instruction) + sum(
+            self.estimate_image_tokens(image) for image in context.images
+        )
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': 0,
+            'uncached_tokens': prompt_tokens,
+            'completion_tokens': output_tokens
+        }
+        return EngineResponse(text, truncated, usage)
+
+    def call_hs_code(self, prompt: str, images: List[PreparedImage]) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+
+        hs_code = self.fixtures.get('hs_code', '0000.00.00.00')
+        match = _HS_ITEM_COUNT_PATTERN.search(prompt)
+        if match:
+            return json.dumps([{self.hs_code_list_key: hs_code} for _ in range(int(match.group(1)))])
+        return json.dumps({'HS코드': hs_code}, ensure_ascii=False)
@@ -0,0 +1,524 @@
+"""
+단계 처리 공통 흐름 (StepOrchestrator)
+처리 순서별 그룹화 -> 단계 스케줄링 -> 토큰 예산 -> 엔진 호출(행 범위 분할) -> 결과 병합/키 변환 -> HS 코드 추천
+엔진(AIEngine)은 프롬프트 구성과 API 호출만 담당
+"""
+import json
+import time
+import logging
+from typing import Dict, Any, Optional, Callable, List, Tuple
+from concurrent.futures import Future
+from ..step_scheduler import (
+    group_mappings_by_order, build_step_dependencies, run_steps,
+    merge_step_results, to_step_result, merge_hs_codes
+)
+from ..image_preprocess import PreparedImage, prepare_image, crop_prepared_image
+from ..ocr_layout import parse_region, region_text
+from ..ocr_reducer import reduce_ocr_text
+from ..token_budget import fit_prompt_budget, call_with_row_split
+from ..documents import parse_pages
+from ..prompt_layout import use_cache_friendly_layout, build_static_instructions, sum_usage, merge_call_usage
+from ..metrics import provider_errors_total, provider_retries_total
+from ..structured_logging import log_payload
+from .base import AIEngine, StepContext
+from .prompts import build_hs_code_prompt
+
+logger = logging.getLogger('core')
+
+
+def emit_event(on_event: Optional[Callable[[str, Dict[str, Any]], None]], event: str, data: Dict[str, Any]):
+    """진행 이벤트 전달 (콜백 오류가 처리 흐름을 중단시키지 않도록 함)"""
+    if on_event is None:
+        return
+    try:
+        on_event(event, data)
+    except Exception as e:
+        logging.getLogger('core').warning(f"[EVENT] {event} callback failed: {str(e)}")
+
+
+def resolve_ocr_text(ocr_text) -> str:
+    """OCR 결과 대기 (ocr_text가 Future인 경우 OCR 완료까지 대기)"""
+    if isinstance(ocr_text, Future):
+        return ocr_text.result()
+    return ocr_text
+
+
+def prepare_step_inputs(prepared_pages: List[PreparedImage], ocr_text, mappings: List[Dict[str, Any]]) -> Tuple[Optional[str], List[PreparedImage]]:
+    """
+    단계별 입력 (OCR 텍스트, 첨부 이미지)
+    처리 페이지(pages)/처리 영역(region) 설정이 있으면 해당 페이지와 영역만 사용하고,
+    OCR 텍스트는 단계의 추출 항목과 관련 있는 줄만 남김 (OCR_REDUCER_ENABLED)
+    OCR 텍스트가 필요 없는 단계는 OCR 완료를 기다리지 않음 (None)
+    """
+    mapping = mappings[0]
+    page_indices = parse_pages(mapping.get('pages'), len(prepared_pages)) if len(prepared_pages) > 1 else None
+    images = prepared_pages if page_indices is None else [prepared_pages[index] for index in page_indices]
+
+    region = parse_region(mapping.get('region'))
+    if region is not None:
+        images = [crop_prepared_image(image, region) for image in images]
+
+    step_ocr_text = None
+    if mapping.get('needs_ocr', True):
+        step_ocr_text = region_text(resolve_ocr_text(ocr_text), region, page_indices)
+        step_ocr_text = reduce_ocr_text(step_ocr_text, mappings, mapping.get('work_group') or '')
+    return step_ocr_text, images
+
+
+def normalize_keys_to_korean(data, reverse_mapping: Dict):
+    """테이블명.필드명 형식의 키를 한글 키로 정규화 (재귀적으로 중첩된 구조 처리)"""
+    if isinstance(data, list):
+        return [normalize_keys_to_korean(item, reverse_mapping) for item in data]
+    elif isinstance(data, dict):
+        normalized = {}
+        for key, value in data.items():
+            # 테이블명.필드명 → 한글 키로 변환
+            normalized_key = reverse_mapping.get(key, key)
+            # 값도 재귀적으로 처리
+            normalized[normalized_key] = normalize_keys_to_korean(value, reverse_mapping)
+        return normalized
+    else:
+        return data
+
+
+def convert_to_english_keys(korean_json, mapping_structure: Dict):
+    """한글 키를 영문 필드명으로 변환 (재귀적으로 중첩된 구조 처리)"""
+    try:
+        # 리스트인 경우: 각 항목을 재귀적으로 변환
+        if isinstance(korean_json, list):
+            english_list = []
+            for idx, item in enumerate(korean_json):
+                # 재귀 호출로 중첩된 dict/list 처리
+                english_list.append(convert_to_english_keys(item, mapping_structure))
+            return english_list
+
+        # 딕셔너리인 경우: 키 변환 및 값을 재귀적으로 처리
+        elif isinstance(korean_json, dict):
+            english_json = {}
+            for korean_key, value in korean_json.items():
+                english_key = mapping_structure.get(korean_key)
+
+                # 키 변환
+                final_key = english_key if english_key else korean_key
+
+                # 값도 재귀적으로 변환 (중첩된 dict/list 처리)
+                english_json[final_key] = convert_to_english_keys(value, mapping_structure)
+
+            return english_json
+
+        # 기타 타입(str, int, float, bool, None 등): 그대로 반환
+        else:
+            return korean_json
+
+    except Exception as e:
+        raise
+
+
+def extract_json(text: str) -> Dict[str, Any]:
+    """응답에서 JSON 추출"""
+    try:
+        # ```json ... ``` 형태로 온 경우 추출
+        if '```json' in text:
+            start = text.find('```json') + 7
+            end = text.find('```', start)
+            json_text = text[start:end].strip()
+        elif '```' in text:
+            start = text.find('```') + 3
+            end = text.find('```', start)
+            json_text = text[start:end].strip()
+        else:
+            json_text = text.strip()
+
+        parsed_result = json.loads(json_text)
+        return parsed_result
+    except json.JSONDecodeError as e:
+        # AI가 JSON이 아닌 일반 텍스트로 응답한 경우
+        error_msg = f"AI가 JSON 형식이 아닌 텍스트로 응답했습니다.\n\n"
+        error_msg += f"파싱 오류: {str(e)}\n\n"
+        error_msg += f"AI 응답 내용:\n{text}\n\n"
+        error_msg += "가능한 원인:\n"
+        error_msg += "1. 이미지가 불명확하거나 AI가 인식할 수 없는 형식입니다.\n"
+        error_msg += "2. 프롬프트가 명확하지 않아 AI가 JSON을 생성하지 못했습니다.\n"
+        error_msg += "3. 매핑 정보나 테이블 처리 설정이 누락되었을 수 있습니다."
+        raise Exception(error_msg)
+
+
+class StepOrchestrator:
+    """엔진 공통 단계 처리 (엔진별 차이는 AIEngine 어댑터로 분리)"""
+
+    def __init__(self, engine: AIEngine):
+        self.engine = engine
+
+    def process_invoice(
+        self,
+        image_path: str,
+        ocr_text: str,
+        mapping_info: list,
+        ai_metadata: str = None,
+        hs_code_process_order: int = None,
+        prepared_pages: List[PreparedImage] = None,
+        on_event: Callable[[str, Dict[str, Any]], None] = None
+    ) -> Dict[str, Any]:
+        """
+        인보이스 이미지와 OCR 텍스트를 분석하여 JSON 형태로 데이터 정리
+
+        Args:
+            image_path: 이미지 파일 경로
+            ocr_text: OCR로 추출된 텍스트 (또는 OCR 결과 Future - OCR이 필요한 단계에서만 대기)
+            mapping_info: 매핑 정보 리스트 (프롬프트 포함)
+            ai_metadata: AI 메타데이터 (최상위 컨텍스트)
+            hs_code_process_order: HS 코드 추천을 실행할 테이블 처리 순서
+            prepared_pages: 페이지별 전처리된 이미지 (없으면 image_path에서 전처리)
+            on_event: 진행 이벤트 콜백 (event, data) - step_done, hs_code_done
+
+        Returns:
+            정리된 JSON 데이터
+        """
+        self.last_prompt = None
+        try:
+            # 전처리된 이미지를 모든 단계와 HS 코드 추천에서 재사용
+            if prepared_pages is None:
+                prepared_pages = [prepare_image(image_path)]
+            return self._process_invoice_sequential(
+                prepared_pages, image_path, ocr_text, mapping_info, ai_metadata, hs_code_process_order, on_event
+            )
+
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'data': None,
+                'prompt': self.last_prompt
+            }
+
+    def _process_invoice_sequential(
+        self,
+        prepared_pages: List[PreparedImage],
+        image_path: str,
+        ocr_text: str,
+        mapping_info: list,
+        ai_metadata: str = None,
+        hs_code_process_order: int = None,
+        on_event: Callable[[str, Dict[str, Any]], None] = None
+    ) -> Dict[str, Any]:
+        """순차 처리 로직 - 처리 순서대로 단계별 처리 (서로 의존하지 않는 단계는 동시 실행)"""
+        engine = self.engine
+
+        # 처리 순서별로 매핑 정보 그룹화
+        sorted_orders, grouped_mappings = group_mappings_by_order(mapping_info)
+
+        # 단계별 선행 단계 (TableProcessConfig.depends_on)
+        dependencies = build_step_dependencies(sorted_orders, grouped_mappings)
+
+        # 전체 매핑 구조 (한글 -> 영문 필드명)
+        mapping_structure = {}
+        for mapping in mapping_info:
+            field_key = f"{mapping['db_table_name']}.{mapping['db_field_name']}"
+            mapping_structure[mapping['unipass_field_name']] = field_key
+
+        # 단계별 프롬프트/응답 저장용 (처리 순서 -> 텍스트)
+        step_prompts = {}
+        step_responses = {}
+
+        # 단계별 토큰 사용량 (캐시 적중 토큰 포함)
+        step_usage = {}
+
+        # HS 코드 추천 정보 저장용
+        hs_info = {'hs_code_recommendation': None, 'hs_prompt': None}
+
+        # 단계별 프롬프트 구성 시간 (토큰 예산 포함, 동시 실행 단계는 합산)
+        prompt_build_times = []
+
+        # 응답 JSON 파싱 시간 (행 범위 분할 호출 포함, 합산) / HS 코드 추천 시간
+        json_parse_times = []
+        hs_code_times = []
+
+        # 캐시 친화적 구성: 모든 단계에서 동일한 지시문을 한 번만 구성
+        cache_friendly = use_cache_friendly_layout()
+        static_instructions = build_static_instructions(
+            ai_metadata, engine.missing_value_rule
+        ) if cache_friendly else None
+
+        def run_step(step_num, order, previous_results):
+            current_mappings = grouped_mappings[order]
+            work_group = current_mappings[0].get('work_group', f'순서 {order}')
+
+            # OCR 텍스트가 필요한 단계만 OCR 완료 대기, 이 단계에 필요한 페이지/영역 이미지만 첨부
+            step_ocr_text, step_images = prepare_step_inputs(prepared_pages, ocr_text, current_mappings)
+            context = StepContext(
+                step_num=step_num,
+                total_steps=len(sorted_orders),
+                order=order,
+                mappings=current_mappings,
+                images=step_images,
+                ai_metadata=ai_metadata,
+                static_instructions=static_instructions
+            )
+
+            # 토큰 예산을 넘으면 이전 단계 결과 -> OCR 텍스트 순서로 축소
+            build_start = time.time()
+            step_ocr_text, step_previous_results, budget_info = fit_prompt_budget(
+                lambda text, previous: engine.build_step_prompt(context, text, previous).text,
+                step_ocr_text,
+                previous_results,
+                sum(engine.estimate_image_tokens(image) for image in step_images),
+                f"STEP {step_num}"
+            )
+            prompt = engine.build_step_prompt(context, step_ocr_text, step_previous_results)
+            prompt_build_times.append(time.time() - build_start)
+
+            step_prompts[order] = f"[STEP {step_num}: {work_group}]\n{prompt.text}"
+
+            # Request 로깅 (길이 포함)
+            logger.info(f"[STEP {step_num}] REQUEST ({engine.label}): ~{budget_info['prompt_tokens']:,} tokens (budget {budget_info['budget']:,})")
+            log_payload(logger, f"[STEP {step_num}] PROMPT", prompt.text)
+
+            call_usages = []
+
+            def call(extra_instruction, max_tokens):
+                if extra_instruction:
+                    # 응답 잘림으로 인한 행 범위 분할 재호출
+                    provider_retries_total.inc(provider=engine.name, reason='row_split')
+                call_start = time.time()
+                try:
+                    response = engine.call(prompt, extra_instruction, max_tokens)
+                except Exception:
+                    provider_errors_total.inc(provider=engine.name, operation='step')
+                    raise
+                usage = dict(response.usage or {})
+                usage['latency'] = time.time() - call_start
+                call_usages.append(usage)
+                return response.text, response.truncated
+
+            def parse(text):
+                parse_start = time.time()
+                try:
+                    return extract_json(text)
+                finally:
+                    json_parse_times.append(time.time() - parse_start)
+
+            try:
+                result_text, parsed = call_with_row_split(
+                    call, parse, current_mappings, f"STEP {step_num}"
+                )
+                step_responses[order] = f"[STEP {step_num}: {work_group}]\n{result_text}"
+
+                usage = merge_call_usage(call_usages)
+                step_usage[order] = usage
+                logger.info(f"[STEP {step_num}] Usage: {usage}")
+
+                # Response 로깅
+                log_payload(logger, f"[STEP {step_num}] RESPONSE", result_text)
+
+                # JSON 추출
+                step_result = to_step_result(parsed, current_mappings, order)
+
+                # HS 코드 추천 실행 (지정된 순서와 일치하는 경우)
+                if hs_code_process_order and order == hs_code_process_order:
+                    logger.info(f"\n[HS CODE RECOMMENDATION] Executing at order {order}")
+
+                    # 한글 키를 영문 필드명으로 변환 (HS 코드 추천 API 호출용)
+                    temp_result_json = convert_to_english_keys(
+                        merge_step_results([previous_results, step_result]), mapping_structure
+                    )
+
+                    hs_start = time.time()
+                    hs_result = self.recommend_hs_code(
+                        extracted_data=temp_result_json,
+                        image_path=image_path,
+                        prepared_pages=prepared_pages
+                    )
+                    hs_code_times.append(time.time() - hs_start)
+
+                    # HS 코드 추천 정보 저장
+                    hs_info['hs_code_recommendation'] = hs_result.get('hs_code_recommendation')
+                    hs_info['hs_prompt'] = hs_result.get('hs_prompt')
+
+                    if hs_result.get('success') and hs_result.get('hs_code_recommendation'):
+                        logger.info(f"\n[HS CODE] Recommendation received")
+                        # HS 코드를 현재 단계 결과에 병합 (한글 키로)
+                        merge_hs_codes(
+                            step_result,
+                            hs_result.get('hs_code_recommendation'),
+                            current_mappings[0].get('db_table_name')
+                        )
+
+                    emit_event(on_event, 'hs_code_done', {
+                        'order': order,
+                        'success': hs_result.get('success', False),
+                        'hs_code_recommendation': hs_info['hs_code_recommendation']
+                    })
+
+            except Exception as e:
+                if not engine.continue_on_step_error:
+                    raise
+                # 실패한 단계는 결과 없이 다음 단계 진행
+                logger.warning(f"[STEP {step_num}] Failed: {str(e)}")
+                emit_event(on_event, 'step_done', {
+                    'step': step_num,
+                    'total_steps': len(sorted_orders),
+                    'order': order,
+                    'work_group': work_group,
+                    'data': {},
+                    'error': str(e)
+                })
+                return {}
+
+            # 단계 부분 결과 (영문 필드명)
+            emit_event(on_event, 'step_done', {
+                'step': step_num,
+                'total_steps': len(sorted_orders),
+                'order': order,
+                'work_group': work_group,
+                'data': convert_to_english_keys(step_result, mapping_structure)
+            })
+
+            return step_result
+
+        # 각 순서별로 처리 (선행 단계가 끝난 단계부터 실행)
+        try:
+            step_results = run_steps(sorted_orders, dependencies, run_step)
+        finally:
+            # 실패한 경우에도 그때까지 구성된 프롬프트를 처리 로그에 남김
+            self.last_prompt = "\n\n".join(step_prompts[order] for order in sorted_orders if order in step_prompts)
+
+        # 처리 순서대로 결과 병합
+        merge_start = time.time()
+        previous_results = merge_step_results(step_results[order] for order in sorted_orders)
+
+        # AI가 테이블명.필드명 형식을 사용한 경우를 한글 키로 정규화
+        reverse_mapping = {}  # {"CUSDEC830C1.qty": "수량(단위)", ...}
+        for mapping in mapping_info:
+            table_field = f"{mapping['db_table_name']}.{mapping['db_field_name']}"
+            reverse_mapping[table_field] = mapping['unipass_field_name']
+
+        previous_results = normalize_keys_to_korean(previous_results, reverse_mapping)
+
+        # 한글 키를 영문 필드명으로 변환
+        result_json = convert_to_english_keys(previous_results, mapping_structure)
+
+        # 모든 응답 합치기 (처리 순서대로)
+        all_responses = [step_responses[order] for order in sorted_orders if order in step_responses]
+        combined_response = "\n\n".join(all_responses)
+
+        # 단계별 프롬프트와 응답을 구조화
+        steps_detail = []
+        for idx, order in enumerate(sorted_orders, 1):
+            work_group = grouped_mappings[order][0].get('work_group', f'순서 {order}')
+
+            # 이 단계의 매핑 정보만 추출
+            step_mappings = []
+            for m in grouped_mappings[order]:
+                step_mappings.append({
+                    'unipass_field_name': m['unipass_field_name'],
+                    'db_table_name': m['db_table_name'],
+                    'db_field_name': m['db_field_name'],
+                    'basic_prompt': m.get('basic_prompt'),
+                    'additional_prompt': m.get('additional_prompt')
+                })
+
+            steps_detail.append({
+                'step': idx,
+                'order': order,
+                'work_group': work_group,
+                'depends_on': list(dependencies.get(order, ())),
+                'prompt': step_prompts.get(order, ''),
+                'response': step_responses.get(order, ''),
+                'usage': step_usage.get(order),  # 토큰 사용량 (cached/uncached)
+                'mapping_count': len(grouped_mappings[order]),
+                'mappings': step_mappings  # 이 단계의 매핑만 포함
+            })
+
+        timings = {
+            'prompt_build': sum(prompt_build_times),
+            'json_parse': sum(json_parse_times),
+            'result_merge': time.time() - merge_start  # 결과 병합/키 변환/단계 상세 구성
+        }
+        if hs_code_times:
+            timings['hs_code'] = sum(hs_code_times)
+
+        return {
+            'success': True,
+            'data': result_json,
+            'raw_response': combined_response,
+            'prompt': self.last_prompt,
+            'timings': timings,  # 프롬프트 구성/JSON 파싱/HS 코드 추천/결과 병합 소요 시간
+            'steps': steps_detail,  # 단계별 상세 정보
+            'total_steps': len(sorted_orders),
+            'usage': sum_usage(step_usage.values()),  # 전체 토큰 사용량
+            'prompt_layout': 'cache_friendly' if cache_friendly else 'legacy',
+            'hs_code_recommendation': hs_info['hs_code_recommendation'],  # HS 코드 추천
+            'hs_prompt': hs_info['hs_prompt']  # HS 코드 프롬프트
+        }
+
+    def recommend_hs_code(
+        self,
+        extracted_data,
+        image_path: str,
+        prepared_pages: List[PreparedImage] = None
+    ) -> Dict[str, Any]:
+        """
+        추출된 Invoice 데이터를 분석하여 HS코드 추천하고 데이터에 병합
+
+        Args:
+            extracted_data: 1차로 추출된 Invoice 데이터 (dict 또는 list)
+            image_path: Invoice 이미지 경로
+            prepared_pages: 요청 단위로 전처리된 전체 페이지 (없으면 image_path에서 전처리)
+
+        Returns:
+            HS코드가 병합된 데이터
+        """
+        try:
+            if not prepared_pages:
+                prepared_pages = [prepare_image(image_path)]
+
+            # HS코드 추천 프롬프트 구성
+            prompt = build_hs_code_prompt(extracted_data, self.engine.hs_code_list_key)
+
+            # Request 로깅
+            log_payload(logger, f"[HS CODE] REQUEST ({self.engine.label})", prompt)
+
+            try:
+                result_text = self.engine.call_hs_code(prompt, prepared_pages)
+            except Exception:
+                provider_errors_total.inc(provider=self.engine.name, operation='hs_code')
+                raise
+
+            # Response 로깅
+            log_payload(logger, f"[HS CODE] RESPONSE ({self.engine.label})", result_text)
+
+            # JSON 파싱
+            hs_codes = extract_json(result_text)
+
+            # HS코드를 기존 데이터에 병합
+            if isinstance(extracted_data, list) and isinstance(hs_codes, list):
+                # 리스트인 경우: 각 항목에 HS코드 추가
+                merged_data = []
+                for item, hs_item in zip(extracted_data, hs_codes):
+                    if isinstance(item, dict) and isinstance(hs_item, dict):
+                        merged_data.append({**item, **hs_item})  # 딕셔너리 병합
+                    else:
+                        merged_data.append(item)
+            elif isinstance(extracted_data, dict) and isinstance(hs_codes, dict):
+                # 딕셔너리인 경우: HS코드 병합
+                merged_data = {**extracted_data, **hs_codes}
+            else:
+                # 타입이 맞지 않는 경우: 원본 데이터 반환
+                merged_data = extracted_data
+
+            return {
+                'success': True,
+                'merged_data': merged_data,
+                'hs_code_recommendation': hs_codes,  # 파싱된 JSON
+                'hs_code_response_text': result_text,  # 원본 텍스트
+                'hs_prompt': prompt
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'merged_data': extracted_data,  # 오류 시 원본 데이터 반환
+                'hs_code_recommendation': None,
+                'hs_prompt': None
+            }
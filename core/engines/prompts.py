@@ -0,0 +1,111 @@
+"""
+엔진 공통 프롬프트 (HS 코드 추천)
+"""
+
+
+def build_hs_code_prompt(extracted_data, list_key: str = 'hs') -> str:
+    """HS코드 추천 프롬프트 구성 (list_key: 품목 목록 응답의 HS코드 키)"""
+
+    # 리스트인 경우와 딕셔너리인 경우 다르게 처리
+    if isinstance(extracted_data, list):
+        # 리스트인 경우: 각 항목을 번호와 함께 표시
+        data_summary = ""
+        for idx, item in enumerate(extracted_data, 1):
+            data_summary += f"\n[항목 {idx}]\n"
+            if isinstance(item, dict):
+                for key, value in item.items():
+                    data_summary += f"  - {key}: {value}\n"
+            else:
+                data_summary += f"  {item}\n"
+
+        prompt = f"""당신은 관세 및 무역 전문가입니다.
+Invoice에서 추출한 여러 항목의 데이터를 분석하여 각 항목별로 적합한 HS코드(관세율표 품목분류 코드)를 추천해주세요.
+
+[추출된 Invoice 데이터]
+{data_summary}
+
+[요청사항]
+1. 위 데이터와 첨부된 Invoice 이미지를 종합적으로 분석하세요
+2. 각 항목별로 상품의 재질, 용도, 형태 등을 고려하여 가장 적합한 HS코드를 추천하세요
+3. HS코드는 10자리 형식으로 제시하세요
+
+[응답 형식]
+반드시 다음 JSON 배열 형식으로만 응답해주세요. 설명이나 추가 텍스트 없이 JSON만 반환하세요.
+항목 순서대로 HS코드를 배열로 반환하세요.
+
+```json
+[
+  {{"{list_key}": "0000.00.00.00"}},
+  {{"{list_key}": "0000.00.00.00"}},
+  {{"{list_key}": "0000.00.00.00"}}
+]
+```
+
+주의사항:
+1. 반드시 JSON 배열 형식으로만 응답하세요
+2. HS코드는 10자리 형식입니다 (예: 0000.00.00.00)
+3. 설명, 근거, 기타 텍스트는 포함하지 마세요
+4. JSON 키는 "{list_key}"를 사용하세요
+5. 항목 개수만큼 배열에 포함해주세요 (총 {len(extracted_data)}개)
+"""
+    elif isinstance(extracted_data, dict):
+        # 딕셔너리인 경우: 기존 방식
+        data_summary = "\n".join([f"  - {key}: {value}" for key, value in extracted_data.items()])
+
+        prompt = f"""당신은 관세 및 무역 전문가입니다.
+Invoice에서 추출한 데이터를 분석하여 적합한 HS코드(관세율표 품목분류 코드)를 추천해주세요.
+
+[추출된 Invoice 데이터]
+{data_summary}
+
+[요청사항]
+1. 위 데이터와 첨부된 Invoice 이미지를 종합적으로 분석하세요
+2. 상품의 재질, 용도, 형태 등을 고려하여 가장 적합한 HS코드를 추천하세요
+3. HS코드는 10자리 형식으로 제시하세요
+
+[응답 형식]
+반드시 다음 JSON 형식으로만 응답해주세요. 설명이나 추가 텍스트 없이 JSON만 반환하세요.
+
+```json
+{{
+  "HS코드": "0000.00.00.00"
+}}
+```
+
+주의사항:
+1. 반드시 JSON 형식으로만 응답하세요
+2. HS코드는 10자리 형식입니다 (예: 0000.00.00.00)
+3. 설명, 근거, 기타 텍스트는 포함하지 마세요
+4. JSON 키는 "HS코드"를 사용하세요
+"""
+    else:
+        # 그 외의 경우
+        data_summary = str(extracted_data)
+        prompt = f"""당신은 관세 및 무역 전문가입니다.
+Invoice에서 추출한 데이터를 분석하여 적합한 HS코드(관세율표 품목분류 코드)를 추천해주세요.
+
+[추출된 Invoice 데이터]
+{data_summary}
+
+[요청사항]
+1. 위 데이터와 첨부된 Invoice 이미지를 종합적으로 분석하세요
+2. 상품의 재질, 용도, 형태 등을 고려하여 가장 적합한 HS코드를 추천하세요
+3. HS코드는 10자리 형식으로 제시하세요
+
+[응답 형식]
+반드시 다음 JSON 형식으로만 응답해주세요. 설명이나 추가 텍스트 없이 JSON만 반환하세요.
+
+```json
+{{
+  "HS코드": "0000.00.00.00"
+}}
+```
+
+주의사항:
+1. 반드시 JSON 형식으로만 응답하세요
+2. HS코드는 10자리 형식입니다 (예: 0000.00.00.00)
+3. 설명, 근거, 기타 텍스트는 포함하지 마세요
+4. JSON 키는 "HS코드"를 사용하세요
+"""
+
+    return prompt
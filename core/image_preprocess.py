@@ -0,0 +1,236 @@
+"""
+이미지 전처리
+요청당 한 번만 원본 이미지를 읽어 EXIF 회전 보정, 긴 변 기준 축소, JPEG 재압축을 수행하고
+모든 AI 단계와 HS 코드 추천이 같은 바이트/base64 버퍼를 재사용하도록 함
+(OCR은 인식 정확도를 위해 원본 파일을 그대로 사용)
+"""
+import io
+import math
+import base64
+import logging
+import mimetypes
+from dataclasses import dataclass, field
+from typing import Dict, Any, List
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger('core')
+
+
+@dataclass
+class PreparedImage:
+    """AI 요청에 사용할 전처리된 이미지"""
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    original_width: int = 0
+    original_height: int = 0
+    _base64: str = field(default=None, repr=False)
+
+    @property
+    def base64(self) -> str:
+        """base64 문자열 (최초 1회만 인코딩)"""
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode('utf-8')
+        return self._base64
+
+    @property
+    def data_url(self) -> str:
+        """ChatGPT image_url 형식"""
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    def as_gemini_part(self) -> Dict[str, Any]:
+        """Gemini 인라인 이미지 (SDK가 단계마다 PIL 이미지를 다시 인코딩하지 않도록 바이트로 전달)"""
+        return {'mime_type': self.mime_type, 'data': self.data}
+
+    def stats(self) -> Dict[str, Any]:
+        """바이트 절감량 및 이미지 토큰 추정치"""
+        return {
+            'original_bytes': self.original_bytes,
+            'prepared_bytes': len(self.data),
+            'bytes_saved': max(0, self.original_bytes - len(self.data)),
+            'original_size': [self.original_width, self.original_height],
+            'prepared_size': [self.width, self.height],
+            'mime_type': self.mime_type,
+            'estimated_tokens': {
+                'gpt': estimate_openai_image_tokens(self.width, self.height),
+                'gemini': estimate_gemini_image_tokens(self.width, self.height),
+            }
+        }
+
+
+def summarize_pages(pages: List[PreparedImage]) -> Dict[str, Any]:
+    """다중 페이지 문서의 전처리 결과 합계 (단일 이미지는 해당 이미지 결과 그대로)"""
+    if len(pages) == 1:
+        return pages[0].stats()
+
+    page_stats = [page.stats() for page in pages]
+    return {
+        'pages': len(pages),
+        'original_bytes': sum(stat['original_bytes'] for stat in page_stats),
+        'prepared_bytes': sum(stat['prepared_bytes'] for stat in page_stats),
+        'bytes_saved': sum(stat['bytes_saved'] for stat in page_stats),
+        'estimated_tokens': {
+            'gpt': sum(stat['estimated_tokens']['gpt'] for stat in page_stats),
+            'gemini': sum(stat['estimated_tokens']['gemini'] for stat in page_stats),
+        },
+        'page_stats': page_stats
+    }
+
+
+def estimate_openai_image_tokens(width: int, height: int) -> int:
+    """
+    OpenAI 이미지 토큰 추정 (detail=high 기준)
+    2048x2048 안으로 축소 -> 짧은 변 768로 축소 -> 512px 타일당 170 + 기본 85
+    """
+    if not width or not height:
+        return 0
+    scale = min(1.0, 2048 / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    tiles = math.ceil(w / 512) * math.ceil(h / 512)
+    return 85 + 170 * tiles
+
+
+def estimate_gemini_image_tokens(width: int, height: int) -> int:
+    """
+    Gemini 이미지 토큰 추정
+    두 변이 모두 384 이하이면 258, 그 외에는 768px 타일당 258
+    """
+    if not width or not height:
+        return 0
+    if width <= 384 and height <= 384:
+        return 258
+    return math.ceil(width / 768) * math.ceil(height / 768) * 258
+
+
+def crop_prepared_image(prepared: PreparedImage, region) -> PreparedImage:
+    """
+    전처리된 이미지에서 처리 영역만 잘라냄
+
+    Args:
+        prepared: 전처리된 이미지
+        region: (x0, y0, x1, y1) 페이지 대비 비율
+
+    Returns:
+        잘라낸 이미지 (실패 시 원래 이미지)
+    """
+    margin = getattr(settings, 'OCR_REGION_MARGIN', 0.02)
+    try:
+        img = Image.open(io.BytesIO(prepared.data))
+        width, height = img.size
+        x0, y0, x1, y1 = region
+        box = (
+            int(max(0.0, x0 - margin) * width),
+            int(max(0.0, y0 - margin) * height),
+            int(math.ceil(min(1.0, x1 + margin) * width)),
+            int(math.ceil(min(1.0, y1 + margin) * height)),
+        )
+        cropped = img.crop(box)
+        if cropped.mode not in ('RGB', 'L'):
+            cropped = cropped.convert('RGB')
+
+        buffer = io.BytesIO()
+        cropped.save(buffer, format='JPEG', quality=getattr(settings, 'IMAGE_JPEG_QUALITY', 85), optimize=True)
+    except Exception as e:
+        logger.warning(f"[IMAGE] Region crop failed, using full image: {str(e)}")
+        return prepared
+
+    logger.info(f"[IMAGE] Region crop {width}x{height} -> {cropped.width}x{cropped.height} "
+                f"({len(prepared.data):,} -> {buffer.tell():,} bytes)")
+    return PreparedImage(
+        buffer.getvalue(), 'image/jpeg', cropped.width, cropped.height,
+        prepared.original_bytes, prepared.original_width, prepared.original_height
+    )
+
+
+def prepare_image(image_path: str) -> PreparedImage:
+    """
+    이미지 전처리 (요청당 1회)
+
+    Args:
+        image_path: 원본 이미지 파일 경로
+
+    Returns:
+        전처리된 이미지 (전처리 비활성화/실패 시 원본 바이트 그대로)
+    """
+    with open(image_path, 'rb') as image_file:
+        original = image_file.read()
+
+    return prepare_image_bytes(original, mimetypes.guess_type(image_path)[0] or 'image/jpeg')
+
+
+def prepare_image_bytes(original: bytes, mime_type: str = 'image/jpeg') -> PreparedImage:
+    """
+    이미지 바이트 전처리 (다중 페이지 문서의 페이지별 이미지 등)
+
+    Args:
+        original: 원본 이미지 바이트
+        mime_type: 이미지 형식을 알 수 없을 때 사용할 MIME 타입
+
+    Returns:
+        전처리된 이미지
+    """
+    try:
+        img = Image.open(io.BytesIO(original))
+        original_width, original_height = img.size
+        original_mime = Image.MIME.get(img.format, mime_type)
+    except Exception as e:
+        logger.warning(f"[IMAGE] Cannot open image, using original bytes: {str(e)}")
+        return PreparedImage(original, mime_type, 0, 0, len(original))
+
+    if not getattr(settings, 'IMAGE_PREPROCESS_ENABLED', True):
+        return PreparedImage(
+            original, original_mime, original_width, original_height,
+            len(original), original_width, original_height
+        )
+
+    try:
+        max_edge = getattr(settings, 'IMAGE_MAX_EDGE', 2048)
+        # JPEG는 디코딩 단계에서 먼저 축소하여 디코딩 시간 단축
+        if max_edge and img.format == 'JPEG':
+            img.draft('RGB', (max_edge, max_edge))
+
+        # EXIF 회전 정보 반영 (휴대폰 사진)
+        orientation = img.getexif().get(0x0112, 1)
+        img = ImageOps.exif_transpose(img)
+
+        # 긴 변 기준 축소
+        if max_edge and max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=getattr(settings, 'IMAGE_JPEG_QUALITY', 85), optimize=True)
+        data = buffer.getvalue()
+
+        prepared = PreparedImage(
+            data, 'image/jpeg', img.width, img.height,
+            len(original), original_width, original_height
+        )
+
+        # 재압축 결과가 더 크고 크기/방향 변화도 없으면 원본 사용
+        if len(data) >= len(original) and orientation == 1 and img.size == (original_width, original_height):
+            prepared = PreparedImage(
+                original, original_mime, original_width, original_height,
+                len(original), original_width, original_height
+            )
+
+    except Exception as e:
+        logger.warning(f"[IMAGE] Preprocess failed, using original bytes: {str(e)}")
+        prepared = PreparedImage(
+            original, original_mime, original_width, original_height,
+            len(original), original_width, original_height
+        )
+
+    stats = prepared.stats()
+    logger.info(f"[IMAGE] {original_width}x{original_height} ({len(original):,} bytes) -> "
+                f"{prepared.width}x{prepared.height} ({len(prepared.data):,} bytes), "
+                f"saved {stats['bytes_saved']:,} bytes, "
+                f"est. tokens gpt={stats['estimated_tokens']['gpt']} gemini={stats['estimated_tokens']['gemini']}")
+    return prepared
@@ -0,0 +1,150 @@
+"""
+인보이스 이미지 내용 주소 저장소 (SHA-256)
+- 업로드 중 해시 계산 (FILE_UPLOAD_HANDLERS의 Hashing*FileUploadHandler) - 저장 시 파일을 다시 읽지 않음
+- invoices/sha256/<앞 2자리>/<다음 2자리>/<해시><확장자> 로 저장하여 같은 내용은 파일 하나만 기록
+  (재시도/배치 재전송 시 이미 있는 파일이면 쓰기 생략)
+- 처리 로그 참조 수를 StoredImage.ref_count로 관리하고, 삭제 요청 시 참조가 0이 되어야 파일 삭제
+  (참조 증가는 처리 로그 저장 트랜잭션 안에서, 해제는 처리 로그 삭제 커밋 후 post_delete 수신기에서)
+- 해시를 모르는 파일(결합 TIFF 등)은 임시 파일로 쓰면서 해시 계산 후 최종 경로로 이동
+"""
+import os
+import re
+import hashlib
+import logging
+import tempfile
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+logger = logging.getLogger('core')
+
+IMAGE_PREFIX = 'invoices/sha256'
+_NAME_PATTERN = re.compile(r'(?:^|/)invoices/sha256/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.[0-9a-z]+)?$')
+
+
+def content_name(sha256: str, ext: str = '') -> str:
+    """SHA-256 -> 저장 경로 (2단계 샤딩)"""
+    return f"{IMAGE_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}"
+
+
+def sha256_from_name(name: str) -> str:
+    """저장 경로(상대/절대) -> SHA-256 (내용 주소 경로가 아니면 None)"""
+    match = _NAME_PATTERN.search((name or '').replace('\\', '/'))
+    return match.group(1) if match else None
+
+
+class _HashingUploadMixin:
+    """업로드 데이터를 받으면서 SHA-256 계산 -> 완료된 파일의 sha256 속성으로 전달"""
+
+    def new_file(self, *args, **kwargs):
+        # 메모리 핸들러는 new_file에서 StopFutureHandlers를 발생시키므로 먼저 초기화
+        self._sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # 메모리 핸들러는 크기 초과 시 비활성화되어 다음 핸들러(임시 파일)로 넘김
+        if getattr(self, 'activated', True):
+            self._sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self._sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(_HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(_HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    SHA-256 내용 주소 파일 저장소 (MEDIA_ROOT 기준)
+    upload_to로 만든 이름은 확장자만 사용
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # 최종 경로는 내용으로 정해지므로 이름 충돌 확인 불필요
+        return name
+
+    def _save(self, name, content):
+        from .models import StoredImage
+
+        ext = os.path.splitext(name)[1].lower()
+        sha256 = getattr(content, 'sha256', None)
+        temp_path = None
+        try:
+            if sha256 is None:
+                sha256, temp_path = self._write_temp(content)
+            name = content_name(sha256, ext)
+            path = self.path(name)
+
+            with transaction.atomic():
+                image, _ = StoredImage.objects.select_for_update().get_or_create(name=name, defaults={'sha256': sha256})
+                if os.path.exists(path):
+                    logger.info(f"[IMAGE STORE] 중복 이미지 재사용: {sha256[:12]} (참조 {image.ref_count + 1})")
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if temp_path is None and hasattr(content, 'temporary_file_path'):
+                        # 디스크에 받은 업로드는 복사 없이 이동
+                        file_move_safe(content.temporary_file_path(), path, allow_overwrite=True)
+                    else:
+                        if temp_path is None:
+                            _, temp_path = self._write_temp(content)
+                        os.replace(temp_path, path)
+                        temp_path = None
+                    if self.file_permissions_mode is not None:
+                        os.chmod(path, self.file_permissions_mode)
+                StoredImage.objects.filter(pk=image.pk).update(
+                    ref_count=F('ref_count') + 1, size=os.path.getsize(path)
+                )
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def _write_temp(self, content):
+        """저장소 디렉토리의 임시 파일에 쓰면서 해시 계산 (같은 파일시스템 - 최종 경로로 rename)"""
+        temp_dir = self.path(f"{IMAGE_PREFIX}/tmp")
+        os.makedirs(temp_dir, exist_ok=True)
+        sha256 = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    sha256.update(chunk)
+                    f.write(chunk)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return sha256.hexdigest(), temp_path
+
+    def delete(self, name):
+        """참조 해제 - 마지막 참조일 때만 파일 삭제 (내용 주소 경로가 아니면 바로 삭제)"""
+        from .models import StoredImage
+
+        if sha256_from_name(name) is None:
+            return super().delete(name)
+
+        with transaction.atomic():
+            image = StoredImage.objects.select_for_update().filter(name=name).first()
+            if image is not None and image.ref_count > 1:
+                StoredImage.objects.filter(pk=image.pk).update(ref_count=F('ref_count') - 1)
+                return
+            if image is not None:
+                image.delete()
+            super().delete(name)
+
+
+image_storage = ContentAddressedStorage()
@@ -0,0 +1,357 @@
+"""
+인보이스 처리 작업 실행
+- 동기 처리: API 요청 스레드에서 바로 실행
+- 비동기 처리: 프로세스 내 워커 풀에서 실행 (InvoiceProcessLog.status가 작업 상태의 기준)
+- 배치 처리: 요청별 제한된 스레드 풀에서 실행하고 끝나는 순서대로 결과 반환
+"""
+import os
+import sys
+import time
+import threading
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from typing import Dict, Any, Callable, Iterator, List
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import InvoiceProcessLog
+from .services import InvoiceProcessor
+from .config_loader import load_declaration_config
+from . import metrics
+from .request_timing import record_stages
+
+logger = logging.getLogger('core')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_stream_executor = None
+_stream_slots = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """워커 풀 (프로세스당 1개, 크기는 INVOICE_JOB_WORKERS)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'INVOICE_JOB_WORKERS', 4),
+                    thread_name_prefix='invoice-job'
+                )
+    return _executor
+
+
+def _get_stream_executor() -> ThreadPoolExecutor:
+    """진행 상황 스트리밍 전용 워커 풀 (프로세스당 1개, 크기는 STREAM_MAX_WORKERS - 비동기 작업 풀과 분리)"""
+    global _stream_executor, _stream_slots
+    if _stream_executor is None:
+        with _executor_lock:
+            if _stream_executor is None:
+                max_workers = getattr(settings, 'STREAM_MAX_WORKERS', 4)
+                _stream_slots = threading.BoundedSemaphore(max_workers)
+                _stream_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='invoice-stream')
+    return _stream_executor
+
+
+def reserve_stream_slot() -> bool:
+    """스트리밍 처리 자리 확보 (빈 워커가 없으면 대기열에 쌓지 않고 False)"""
+    _get_stream_executor()
+    return _stream_slots.acquire(blocking=False)
+
+
+def release_stream_slot():
+    """확보한 자리를 작업 등록 없이 반환 (처리 로그 생성 실패 등)"""
+    _stream_slots.release()
+
+
+def submit_stream(fn: Callable, *args):
+    """확보한 자리에서 스트리밍 처리 실행 (완료 시 자리 반환)"""
+    def run():
+        try:
+            fn(*args)
+        finally:
+            _stream_slots.release()
+
+    _get_stream_executor().submit(contextvars.copy_context().run, run)
+
+
+def run_process_log(
+    process_log: InvoiceProcessLog,
+    mapping_info: list,
+    ai_metadata: str = None,
+    on_event: Callable[[str, Dict[str, Any]], None] = None
+) -> Dict[str, Any]:
+    """
+    인보이스 처리 실행 후 처리 로그 갱신
+
+    Args:
+        process_log: 처리 로그 (이미지, AI 엔진, HS 코드 처리 순서 포함)
+        mapping_info: 매핑 정보 (프롬프트 포함)
+        ai_metadata: AI 메타데이터 (최상위 컨텍스트)
+        on_event: 진행 이벤트 콜백 (InvoiceProcessor.process 참고)
+
+    Returns:
+        InvoiceProcessor 처리 결과
+    """
+    # 처리 지표 (엔진/신고서별, /api/metrics/)
+    engine = process_log.ai_engine
+    declaration = process_log.declaration.code
+    metrics.registry.start_flusher()
+    metrics.invoices_in_flight.inc(engine=engine)
+    try:
+        result = _process_and_save(process_log, mapping_info, ai_metadata, on_event)
+    except Exception:
+        metrics.invoices_total.inc(engine=engine, declaration=declaration, status='error')
+        raise
+    finally:
+        metrics.invoices_in_flight.dec(engine=engine)
+
+    metrics.record_invoice(result, engine, declaration)
+    record_stages(result.get('timings'))
+    return result
+
+
+def _process_and_save(
+    process_log: InvoiceProcessLog,
+    mapping_info: list,
+    ai_metadata: str = None,
+    on_event: Callable[[str, Dict[str, Any]], None] = None
+) -> Dict[str, Any]:
+    processor = InvoiceProcessor(engine=process_log.ai_engine)
+    result = processor.process(
+        image_path=process_log.image_file.path,
+        mapping_info=mapping_info,
+        ai_metadata=ai_metadata,
+        hs_code_process_order=process_log.hs_code_process_order,
+        on_event=on_event
+    )
+
+    # 로그 업데이트
+    process_log.processing_time = result.get('processing_time')
+
+    if result['success']:
+        process_log.status = 'completed'
+        process_log.completed_at = timezone.now()
+    else:
+        process_log.status = 'failed'
+        process_log.error_message = result.get('error')
+
+    save_start = time.time()
+    with transaction.atomic():
+        # 큰 본문(OCR/응답/결과 JSON)은 압축하여 별도 테이블에 저장
+        process_log.save_payload(
+            ocr_text=result.get('ocr_text'),
+            gpt_response=result.get('gpt_response'),
+            result_json=result.get('result_json')
+        )
+        process_log.save()
+    result.setdefault('timings', {})['db'] = time.time() - save_start
+    return result
+
+
+def _run_batch_item(process_log: InvoiceProcessLog, mapping_info: list, ai_metadata: str = None) -> Dict[str, Any]:
+    """배치 처리 워커에서 인보이스 1건 실행 (실패해도 예외를 전파하지 않음)"""
+    close_old_connections()
+    try:
+        return run_process_log(process_log, mapping_info, ai_metadata)
+
+    except Exception as e:
+        logger.exception(f"[BATCH] Log {process_log.id} failed")
+        process_log.status = 'failed'
+        process_log.error_message = str(e)
+        process_log.save(update_fields=['status', 'error_message'])
+        return {'success': False, 'error': str(e)}
+
+    finally:
+        close_old_connections()
+
+
+def iter_batch_results(
+    process_logs: List[InvoiceProcessLog],
+    snapshot,
+    max_workers: int = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    여러 인보이스를 제한된 동시성으로 처리하고 끝나는 순서대로 결과 반환
+
+    Args:
+        process_logs: 인보이스별 처리 로그 (status='processing')
+        snapshot: 신고서 설정 스냅샷 (배치 전체에서 1회 조회)
+        max_workers: 동시 처리 수 (기본값: BATCH_MAX_CONCURRENCY)
+
+    Yields:
+        (처리 로그, 처리 결과) 완료 순서대로
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'BATCH_MAX_CONCURRENCY', 4)
+    max_workers = max(1, min(max_workers, len(process_logs)))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='invoice-batch')
+    futures = {
+        executor.submit(
+            contextvars.copy_context().run,  # 요청 ID/디버그 추적 컨텍스트 전달
+            _run_batch_item, process_log, snapshot.mapping_info(), snapshot.ai_metadata
+        ): process_log
+        for process_log in process_logs
+    }
+    finished = set()
+    try:
+        for future in as_completed(futures):
+            finished.add(future)
+            yield futures[future], future.result()
+
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        # 응답 스트림이 중단된 경우: 시작하지 못한 건은 비동기 작업으로 넘겨 처리 로그가 모두 완료되도록 함
+        for future, process_log in futures.items():
+            if future not in finished and future.cancelled():
+                InvoiceProcessLog.objects.filter(pk=process_log.id, status='processing').update(
+                    status='pending', claimed_at=None, attempts=F('attempts') - 1
+                )
+                submit_process_log(process_log.id)
+                logger.info(f"[BATCH] Log {process_log.id} handed over to job pool")
+
+
+def _run_job(log_id: int):
+    """워커 스레드에서 대기 중인 처리 로그 1건 실행"""
+    close_old_connections()
+    try:
+        # pending -> processing 전환에 성공한 워커만 실행 (중복 실행 방지)
+        claimed = InvoiceProcessLog.objects.filter(pk=log_id, status='pending').update(
+            status='processing', claimed_at=timezone.now(), attempts=F('attempts') + 1
+        )
+        if not claimed:
+            logger.info(f"[JOB] Log {log_id} already claimed, skipping")
+            return
+
+        process_log = InvoiceProcessLog.objects.select_related(
+            'declaration', 'service_user'
+        ).get(pk=log_id)
+
+        logger.info(f"[JOB] Log {log_id} started ({process_log.ai_engine})")
+        snapshot = load_declaration_config(process_log.declaration, process_log.service_user)
+        result = run_process_log(process_log, snapshot.mapping_info(), snapshot.ai_metadata)
+        logger.info(f"[JOB] Log {log_id} finished: {process_log.status} ({result.get('processing_time', 0):.2f}s)")
+
+    except Exception as e:
+        logger.exception(f"[JOB] Log {log_id} failed")
+        InvoiceProcessLog.objects.filter(pk=log_id).update(
+            status='failed',
+            error_message=str(e)
+        )
+
+    finally:
+        close_old_connections()
+
+
+def submit_process_log(log_id: int):
+    """대기(pending) 상태의 처리 로그를 워커 풀에 등록"""
+    get_executor().submit(contextvars.copy_context().run, _run_job, log_id)
+
+
+def requeue_stale_jobs() -> List[int]:
+    """
+    처리 중(processing) 상태로 INVOICE_JOB_STALE_SECONDS 이상 지난 작업 복구
+    처리하던 워커가 비정상 종료한 작업으로 보고 대기(pending)로 되돌림
+    (INVOICE_JOB_MAX_ATTEMPTS번 시도한 작업은 실패 처리 - 워커를 종료시키는 이미지의 무한 재시도 방지)
+
+    Returns:
+        대기로 되돌린 처리 로그 ID 목록 (호출 측에서 워커 풀에 등록)
+    """
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'INVOICE_JOB_STALE_SECONDS', 1800))
+    max_attempts = getattr(settings, 'INVOICE_JOB_MAX_ATTEMPTS', 2)
+    stale = InvoiceProcessLog.objects.filter(status='processing', claimed_at__lt=cutoff)
+
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status='failed',
+        error_message='처리 중 서버가 중단되어 작업을 완료하지 못했습니다.'
+    )
+    if failed:
+        logger.warning(f"[JOB] Marked {failed} stale job(s) as failed after {max_attempts} attempt(s)")
+
+    log_ids = list(stale.values_list('id', flat=True))
+    # 조건부 업데이트 - 다른 프로세스가 먼저 되돌렸거나 그 사이 완료된 작업 제외
+    requeued = [
+        log_id for log_id in log_ids
+        if InvoiceProcessLog.objects.filter(pk=log_id, status='processing', claimed_at__lt=cutoff).update(
+            status='pending', claimed_at=None
+        )
+    ]
+    if requeued:
+        logger.warning(f"[JOB] Requeued {len(requeued)} stale processing job(s): {requeued}")
+    return requeued
+
+
+def resume_pending_jobs() -> int:
+    """
+    대기(pending) 상태로 남아 있는 작업을 다시 등록
+    서버 재시작 등으로 실행되지 못한 비동기 작업과 워커 비정상 종료로 처리 중에 멈춘 작업 복구용
+
+    Returns:
+        다시 등록한 작업 수
+    """
+    close_old_connections()
+    try:
+        requeue_stale_jobs()
+        log_ids = list(
+            InvoiceProcessLog.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True)
+        )
+    except Exception as e:
+        logger.warning(f"[JOB] Failed to load pending jobs: {str(e)}")
+        return 0
+    finally:
+        close_old_connections()
+
+    for log_id in log_ids:
+        submit_process_log(log_id)
+
+    if log_ids:
+        logger.info(f"[JOB] Resumed {len(log_ids)} pending job(s)")
+    return len(log_ids)
+
+
+def _sweep_stale_jobs():
+    """처리 중에 멈춘 작업을 주기적으로 확인하여 다시 등록 (서버 재시작 없이 워커만 비정상 종료된 경우)"""
+    interval = getattr(settings, 'INVOICE_JOB_STALE_CHECK_INTERVAL', 300)
+    while True:
+        time.sleep(interval)
+        close_old_connections()
+        try:
+            for log_id in requeue_stale_jobs():
+                submit_process_log(log_id)
+        except Exception as e:
+            logger.warning(f"[JOB] Failed to requeue stale jobs: {str(e)}")
+        finally:
+            close_old_connections()
+
+
+def is_server_process() -> bool:
+    """요청을 처리하는 서버 프로세스인지 확인 (runserver / gunicorn / uWSGI - migrate 등 관리 명령, 셸, 스크립트 제외)"""
+    program = os.path.basename(sys.argv[0]) if sys.argv else ''
+    if program == 'manage.py':
+        if len(sys.argv) < 2 or sys.argv[1] != 'runserver':
+            return False
+        # runserver 자동 재시작 시 실제 서버를 실행하는 자식 프로세스만
+        return os.environ.get('RUN_MAIN') == 'true'
+    if program.startswith('gunicorn') or 'gunicorn.arbiter' in sys.modules:
+        return True
+    # uWSGI는 내장 모듈 uwsgi를 제공
+    return program.startswith('uwsgi') or 'uwsgi' in sys.modules
+
+
+def schedule_resume_pending_jobs():
+    """앱 초기화 직후 DB 접근을 피하기 위해 잠시 후 대기 작업 복구"""
+    if not getattr(settings, 'INVOICE_JOB_RESUME_ON_STARTUP', True) or not is_server_process():
+        return
+
+    timer = threading.Timer(getattr(settings, 'INVOICE_JOB_RESUME_DELAY', 2.0), resume_pending_jobs)
+    timer.daemon = True
+    timer.start()
+
+    if getattr(settings, 'INVOICE_JOB_STALE_CHECK_INTERVAL', 300) > 0:
+        threading.Thread(target=_sweep_stale_jobs, name='invoice-job-sweeper', daemon=True).start()
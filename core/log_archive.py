@@ -0,0 +1,275 @@
+"""
+처리 로그 아카이브 (archive_process_logs 명령)
+- 서비스별 보관 기간이 지난 처리 로그를 월별 아카이브 파일로 옮기고 원본 행(본문 포함)과 이미지를 삭제
+- 파일 위치: LOG_ARCHIVE_ROOT/service=<slug>/month=<YYYY-MM>/part-<첫 ID>-<마지막 ID>.parquet
+  (pyarrow 미설치 시 .jsonl.gz) - 월 폴더가 파티션, 배치마다 파일 하나를 새로 씀
+- 이미지는 같은 월 폴더의 images/ 로 복사 (같은 내용은 SHA-256 이름으로 한 번만), DB 삭제가 커밋된 뒤에 원본 참조 해제
+- ArchivedProcessLog 색인(원래 ID -> 파일)으로 get_process_log에서 한 건씩 다시 읽음
+"""
+import os
+import gzip
+import json
+import time
+import shutil
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Service, InvoiceProcessLog, InvoiceProcessPayload, ArchivedProcessLog, decompress_payload
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 미설치 시 jsonl.gz로 아카이브
+    pa = None
+    pq = None
+
+logger = logging.getLogger('core')
+
+# 아카이브 대상 상태 (처리 중/대기 중인 로그는 워커가 다시 가져갈 수 있으므로 제외)
+ARCHIVE_STATUSES = ('completed', 'failed')
+
+# 아카이브 파일 컬럼 (parquet 타입)
+ARCHIVE_COLUMNS = (
+    ('id', 'int64'),
+    ('service', 'string'),
+    ('service_user_id', 'int64'),
+    ('declaration_id', 'int64'),
+    ('declaration', 'string'),
+    ('image_file', 'string'),
+    ('ai_engine', 'string'),
+    ('hs_code_process_order', 'int64'),
+    ('status', 'string'),
+    ('error_message', 'string'),
+    ('created_at', 'timestamp'),
+    ('completed_at', 'timestamp'),
+    ('processing_time', 'float64'),
+) + tuple((field, 'string') for field in InvoiceProcessPayload.PAYLOAD_FIELDS)
+
+
+def archive_root() -> str:
+    return str(getattr(settings, 'LOG_ARCHIVE_ROOT', 'archive'))
+
+
+def archive_format() -> str:
+    """아카이브 파일 형식 (parquet / jsonl)"""
+    fmt = getattr(settings, 'LOG_ARCHIVE_FORMAT', 'auto')
+    if fmt == 'auto':
+        return 'parquet' if pq is not None else 'jsonl'
+    if fmt == 'parquet' and pq is None:
+        raise Exception("LOG_ARCHIVE_FORMAT=parquet 에는 pyarrow 설치가 필요합니다.")
+    if fmt not in ('parquet', 'jsonl'):
+        raise Exception(f"지원하지 않는 아카이브 형식입니다: {fmt}")
+    return fmt
+
+
+def _parquet_schema():
+    types = {'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string(),
+             'timestamp': pa.timestamp('us', tz='UTC')}
+    return pa.schema([(name, types[kind]) for name, kind in ARCHIVE_COLUMNS])
+
+
+def _write_part(path: str, records: List[Dict[str, Any]], fmt: str):
+    """아카이브 파일 쓰기 (임시 파일에 쓴 뒤 교체 - 중단되어도 반쯤 쓴 파일이 남지 않음)"""
+    tmp_path = f"{path}.tmp"
+    if fmt == 'parquet':
+        table = pa.Table.from_pylist(records, schema=_parquet_schema())
+        pq.write_table(table, tmp_path, compression='zstd', row_group_size=100)
+    else:
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=_json_default) + '\n')
+    os.replace(tmp_path, path)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} 는 JSON으로 변환할 수 없습니다.")
+
+
+def _copy_image(process_log: InvoiceProcessLog, month_dir: str) -> str:
+    """
+    이미지를 월 폴더 images/ 로 복사, 없으면 None
+    내용 주소 이미지는 <SHA-256><확장자> 이름으로 월 폴더당 한 번만 복사 (같은 이미지를 참조하는 로그는 파일 공유)
+    그 외 이미지는 ID를 붙여 날짜 폴더 간 파일명 충돌 방지
+    """
+    if not process_log.image_file:
+        return None
+    try:
+        source = process_log.image_file.path
+    except NotImplementedError:  # 로컬 경로가 없는 저장소
+        return None
+    if not os.path.exists(source):
+        return None
+    sha256 = process_log.image_sha256
+    if sha256:
+        name = f"{sha256}{os.path.splitext(source)[1]}"
+    else:
+        name = f"{process_log.id}_{os.path.basename(source)}"
+    target = os.path.join(month_dir, 'images', name)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # 중단되어도 반쯤 쓴 파일이 남아 이후 복사를 건너뛰지 않도록 임시 파일에 쓰고 이동
+        shutil.copy2(source, target + '.tmp')
+        os.replace(target + '.tmp', target)
+    return os.path.join('images', name)
+
+
+def _to_record(process_log: InvoiceProcessLog, payload: InvoiceProcessPayload, image_file: str) -> Dict[str, Any]:
+    record = {
+        'id': process_log.id,
+        'service': process_log.service_user.service.name,
+        'service_user_id': process_log.service_user_id,
+        'declaration_id': process_log.declaration_id,
+        'declaration': process_log.declaration.name,
+        'image_file': image_file,
+        'ai_engine': process_log.ai_engine,
+        'hs_code_process_order': process_log.hs_code_process_order,
+        'status': process_log.status,
+        'error_message': process_log.error_message,
+        'created_at': process_log.created_at,
+        'completed_at': process_log.completed_at,
+        'processing_time': process_log.processing_time,
+    }
+    # 본문은 압축 해제한 문자열 그대로 (result_json은 JSON 문자열, 조회 시 파싱)
+    for field in InvoiceProcessPayload.PAYLOAD_FIELDS:
+        record[field] = decompress_payload(getattr(payload, field)) if payload is not None else None
+    return record
+
+
+def _archive_batch(service: Service, process_logs: List[InvoiceProcessLog], fmt: str) -> Dict[str, int]:
+    """
+    처리 로그 한 배치 아카이브
+    1. 월별 아카이브 파일 쓰기 + 이미지 복사
+    2. 짧은 트랜잭션으로 색인 추가 + 원본 행 삭제 (본문은 CASCADE)
+    3. 커밋 후 원본 이미지 삭제
+    """
+    ids = [process_log.id for process_log in process_logs]
+    payloads = {payload.process_log_id: payload for payload in InvoiceProcessPayload.objects.filter(process_log_id__in=ids)}
+
+    months = {}
+    for process_log in process_logs:
+        month = timezone.localtime(process_log.created_at).strftime('%Y-%m')
+        months.setdefault(month, []).append(process_log)
+
+    root = archive_root()
+    ext = 'parquet' if fmt == 'parquet' else 'jsonl.gz'
+    entries = []
+    images = 0
+    for month, month_logs in months.items():
+        month_rel = os.path.join(f"service={service.slug}", f"month={month}")
+        month_dir = os.path.join(root, month_rel)
+        os.makedirs(month_dir, exist_ok=True)
+
+        part_rel = os.path.join(month_rel, f"part-{month_logs[0].id}-{month_logs[-1].id}.{ext}")
+        records = []
+        for process_log in month_logs:
+            image_file = _copy_image(process_log, month_dir)
+            images += image_file is not None
+            records.append(_to_record(process_log, payloads.get(process_log.id), image_file))
+            entries.append(ArchivedProcessLog(
+                id=process_log.id,
+                service_user_id=process_log.service_user_id,
+                declaration_id=process_log.declaration_id,
+                status=process_log.status,
+                created_at=process_log.created_at,
+                archive_file=part_rel,
+                image_file=os.path.join(month_rel, image_file) if image_file else None,
+            ))
+        _write_part(os.path.join(root, part_rel), records, fmt)
+
+    # 원본 이미지 참조는 DB 삭제가 커밋된 뒤 해제 (InvoiceProcessLog post_delete 수신기)
+    with transaction.atomic():
+        ArchivedProcessLog.objects.bulk_create(entries)
+        InvoiceProcessLog.objects.filter(id__in=ids).delete()
+
+    return {'logs': len(ids), 'images': images, 'files': len(months)}
+
+
+def archive_expired_logs(
+    service: Service,
+    now: datetime = None,
+    batch_size: int = None,
+    pause: float = None,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """
+    서비스의 보관 기간이 지난 처리 로그 아카이브
+
+    Args:
+        service: 대상 서비스
+        now: 기준 시각 (기본: 현재)
+        batch_size: 배치당 처리 로그 수 (기본: LOG_ARCHIVE_BATCH_SIZE)
+        pause: 배치 사이 대기 시간 (초, 기본: LOG_ARCHIVE_BATCH_PAUSE_SECONDS)
+        dry_run: True면 대상 건수만 계산
+
+    Returns:
+        {'service', 'retention_days', 'cutoff', 'logs', 'images', 'files'}
+    """
+    retention_days = service.get_log_retention_days()
+    summary = {'service': service.slug, 'retention_days': retention_days, 'cutoff': None,
+               'logs': 0, 'images': 0, 'files': 0}
+    if not retention_days:
+        return summary
+
+    cutoff = (now or timezone.now()) - timedelta(days=retention_days)
+    summary['cutoff'] = cutoff
+    queryset = InvoiceProcessLog.objects.filter(
+        service_user__service=service, created_at__lt=cutoff, status__in=ARCHIVE_STATUSES
+    )
+    if dry_run:
+        summary['logs'] = queryset.count()
+        return summary
+
+    fmt = archive_format()
+    batch_size = batch_size or getattr(settings, 'LOG_ARCHIVE_BATCH_SIZE', 500)
+    pause = getattr(settings, 'LOG_ARCHIVE_BATCH_PAUSE_SECONDS', 0.2) if pause is None else pause
+
+    # ID 순으로 배치를 나누어 한 번에 잠그는 행 수를 제한
+    last_id = 0
+    while True:
+        process_logs = list(
+            queryset.filter(id__gt=last_id).select_related('service_user__service', 'declaration').order_by('id')[:batch_size]
+        )
+        if not process_logs:
+            break
+        last_id = process_logs[-1].id
+        result = _archive_batch(service, process_logs, fmt)
+        for key in ('logs', 'images', 'files'):
+            summary[key] += result[key]
+        logger.info(f"[ARCHIVE] {service.slug}: {result['logs']}건 아카이브 (~log_id={last_id})")
+        if pause:
+            time.sleep(pause)
+
+    return summary
+
+
+def load_archived_log(entry: ArchivedProcessLog) -> Dict[str, Any]:
+    """아카이브 파일에서 처리 로그 한 건 읽기 (result_json은 JSON으로 파싱)"""
+    path = os.path.join(archive_root(), entry.archive_file)
+    record = None
+    if path.endswith('.parquet'):
+        if pq is None:
+            raise Exception("parquet 아카이브 조회에는 pyarrow 설치가 필요합니다.")
+        rows = pq.read_table(path, filters=[('id', '=', entry.id)]).to_pylist()
+        record = rows[0] if rows else None
+    else:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                row = json.loads(line)
+                if row['id'] == entry.id:
+                    record = row
+                    break
+        if record is not None:
+            for field in ('created_at', 'completed_at'):
+                if record[field]:
+                    record[field] = datetime.fromisoformat(record[field])
+
+    if record is None:
+        raise Exception(f"아카이브 파일에 처리 로그가 없습니다: {entry.archive_file} (log_id={entry.id})")
+    if record['result_json'] is not None:
+        record['result_json'] = json.loads(record['result_json'])
+    return record
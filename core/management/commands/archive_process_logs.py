@@ -0,0 +1,63 @@
+"""
+처리 로그 아카이브 명령
+보관 기간(Service.log_retention_days, 없으면 LOG_RETENTION_DAYS)이 지난 처리 로그를
+월별 아카이브 파일로 옮기고 원본 행과 이미지를 삭제 (cron/작업 스케줄러에서 매일 실행)
+
+사용법:
+    python manage.py archive_process_logs                    # 전체 서비스
+    python manage.py archive_process_logs --service rk       # 특정 서비스
+    python manage.py archive_process_logs --dry-run          # 대상 건수만 확인
+    python manage.py archive_process_logs --batch-size 200 --pause 1
+"""
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Service
+from core.log_archive import archive_expired_logs, archive_root
+
+
+class Command(BaseCommand):
+    help = '보관 기간이 지난 처리 로그를 월별 아카이브 파일로 옮깁니다'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--service', dest='service_slug', help='대상 서비스 영문명 (기본: 전체)')
+        parser.add_argument('--batch-size', type=int, help='배치당 처리 로그 수 (기본: LOG_ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--pause', type=float, help='배치 사이 대기 시간(초) (기본: LOG_ARCHIVE_BATCH_PAUSE_SECONDS)')
+        parser.add_argument('--dry-run', action='store_true', help='아카이브하지 않고 대상 건수만 출력')
+
+    def handle(self, *args, **options):
+        services = Service.objects.all()
+        if options.get('service_slug'):
+            services = services.filter(slug=options['service_slug'])
+            if not services.exists():
+                raise CommandError(f"서비스를 찾을 수 없습니다: {options['service_slug']}")
+        if options.get('batch_size') is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size 는 1 이상이어야 합니다.')
+
+        total = 0
+        for service in services:
+            try:
+                summary = archive_expired_logs(
+                    service,
+                    batch_size=options.get('batch_size'),
+                    pause=options.get('pause'),
+                    dry_run=options['dry_run']
+                )
+            except Exception as e:
+                raise CommandError(f"{service.slug} 아카이브 실패: {e}")
+
+            if not summary['retention_days']:
+                self.stdout.write(f"{service.slug}: 보관 기간 없음 (건너뜀)")
+                continue
+            cutoff = summary['cutoff'].strftime('%Y-%m-%d %H:%M')
+            if options['dry_run']:
+                self.stdout.write(f"{service.slug}: {cutoff} 이전 {summary['logs']}건 아카이브 대상")
+            else:
+                self.stdout.write(
+                    f"{service.slug}: {cutoff} 이전 {summary['logs']}건 아카이브 "
+                    f"(파일 {summary['files']}개, 이미지 {summary['images']}개)"
+                )
+            total += summary['logs']
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"아카이브 대상 {total}건"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"처리 로그 {total}건 아카이브 -> {archive_root()}"))
@@ -0,0 +1,100 @@
+"""
+인보이스 처리 벤치마크 (기록/재생)
+
+사용법:
+    python manage.py benchmark_pipeline record <corpus_dir>
+    python manage.py benchmark_pipeline replay <corpus_dir> --username admin
+    python manage.py benchmark_pipeline replay <corpus_dir> --via processor --iterations 5 --latency-scale 0
+    python manage.py benchmark_pipeline replay <corpus_dir> --username admin --baseline baseline.json --threshold 0.2
+
+코퍼스 구성은 core/benchmark.py 참고
+"""
+import os
+import json
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmark import Benchmark, compare_results
+
+
+class Command(BaseCommand):
+    help = '기록된 Vision/AI 응답으로 인보이스 처리 흐름을 재생하여 단계별 시간, DB 쿼리 수, 메모리를 측정합니다'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['record', 'replay'], help='record: 실제 API 응답 기록, replay: 기록 재생 및 측정')
+        parser.add_argument('corpus', help='코퍼스 디렉터리 (manifest.json 포함)')
+        parser.add_argument('--via', choices=['api', 'processor'], default='api',
+                            help='재생 경로 (api: /api/process/ 뷰, processor: InvoiceProcessor.process)')
+        parser.add_argument('--username', help='API 요청 사용자 (--via api)')
+        parser.add_argument('--iterations', type=int, default=3, help='인보이스별 반복 횟수 (기본 3)')
+        parser.add_argument('--latency-scale', type=float, default=1.0,
+                            help='기록된 지연 시간 배율 (0: 대기 없이 CPU 처리 시간만 측정)')
+        parser.add_argument('--no-tracemalloc', action='store_true', help='메모리 할당 측정 생략')
+        parser.add_argument('--cold-config', action='store_true', help='매 실행 전 설정 스냅샷 캐시 비움')
+        parser.add_argument('--ocr-cache', action='store_true', help='OCR 캐시 사용 (기본: 사용 안 함)')
+        parser.add_argument('--output', help='결과 JSON 경로 (기본: <corpus>/results/benchmark-<시각>.json)')
+        parser.add_argument('--baseline', help='비교할 기준 결과 JSON (회귀가 있으면 실패)')
+        parser.add_argument('--threshold', type=float, default=0.2, help='회귀 판정 비율 (기본 0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        try:
+            benchmark = Benchmark(options['corpus'], use_ocr_cache=options['ocr_cache'], log=self.stdout.write)
+        except Exception as e:
+            raise CommandError(str(e))
+
+        if options['action'] == 'record':
+            try:
+                recorded = benchmark.record()
+            except Exception as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f'{len(recorded)}건 기록 완료'))
+            return
+
+        user = None
+        if options['via'] == 'api':
+            if not options['username']:
+                raise CommandError('--via api에는 --username이 필요합니다.')
+            try:
+                user = get_user_model().objects.get(username=options['username'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"사용자를 찾을 수 없습니다: {options['username']}")
+
+        try:
+            results = benchmark.replay(
+                via=options['via'],
+                user=user,
+                iterations=max(1, options['iterations']),
+                latency_scale=options['latency_scale'],
+                trace_allocations=not options['no_tracemalloc'],
+                cold_config=options['cold_config']
+            )
+        except Exception as e:
+            raise CommandError(str(e))
+
+        output = options['output'] or os.path.join(
+            options['corpus'], 'results', f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        self.stdout.write(f'결과 저장: {output}')
+
+        failed = [item['name'] for item in results['invoices'] if not item['success']]
+        if failed:
+            self.stdout.write(self.style.WARNING(f"처리 실패: {', '.join(failed)}"))
+
+        if options['baseline']:
+            with open(options['baseline'], 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+            try:
+                regressions = compare_results(results, baseline, options['threshold'])
+            except Exception as e:
+                raise CommandError(str(e))
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f"[회귀] {regression['name']} {regression['metric']}: "
+                    f"{regression['baseline']:.4g} -> {regression['current']:.4g}"
+                ))
+            if regressions:
+                raise CommandError(f'기준 대비 회귀 {len(regressions)}건')
+            self.stdout.write(self.style.SUCCESS('기준 대비 회귀 없음'))
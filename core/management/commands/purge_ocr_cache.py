@@ -0,0 +1,24 @@
+"""
+OCR 캐시 정리 명령
+
+사용법:
+    python manage.py purge_ocr_cache              # 만료된 항목만 삭제
+    python manage.py purge_ocr_cache --all        # 전체 삭제
+    python manage.py purge_ocr_cache --image <sha256>
+"""
+from django.core.management.base import BaseCommand
+from core.ocr_cache import ocr_cache
+
+
+class Command(BaseCommand):
+    help = 'OCR 결과 캐시를 정리합니다 (기본: 만료된 항목만)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='만료 여부와 관계없이 전체 삭제')
+        parser.add_argument('--image', dest='image_sha256', help='특정 이미지(SHA-256)의 캐시만 삭제')
+
+    def handle(self, *args, **options):
+        image_sha256 = options.get('image_sha256')
+        expired_only = not options['all'] and not image_sha256
+        deleted = ocr_cache.purge(expired_only=expired_only, image_sha256=image_sha256)
+        self.stdout.write(self.style.SUCCESS(f'OCR 캐시 {deleted}건 삭제'))
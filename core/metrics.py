@@ -0,0 +1,317 @@
+"""
+처리 지표 (Prometheus 텍스트 형식, /api/metrics/)
+프로세스 내 레지스트리에 카운터/게이지/히스토그램을 기록하고,
+METRICS_DIR이 설정된 경우 프로세스별 파일(metrics-<pid>.json)로 주기적으로 저장하여
+다른 워커 프로세스의 값까지 합산해 노출 (gunicorn 등 다중 프로세스 환경)
+
+- 카운터/히스토그램: 모든 프로세스 파일의 값을 합산 (종료된 프로세스 값 포함)
+- 게이지(처리 중 요청 수): 최근 METRICS_STALE_SECONDS 안에 저장된 프로세스 파일만 합산
+"""
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from typing import Dict, Any, List, Tuple, Optional
+from django.conf import settings
+
+logger = logging.getLogger('core')
+
+# 지연 시간 히스토그램 구간 (초)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Metric:
+    """레이블별 값을 가진 지표"""
+
+    type = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, labels: Tuple[str, ...]):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def describe(self) -> Dict[str, Any]:
+        return {'type': self.type, 'help': self.help, 'labels': list(self.labels)}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if not amount:
+            return
+        key = self._key(labels)
+        with self.registry.lock:
+            self.registry.check_pid()
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.registry.check_pid()
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, help_text, labels, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: Optional[float], **labels):
+        if value is None:
+            return
+        key = self._key(labels)
+        with self.registry.lock:
+            self.registry.check_pid()
+            # [구간별 개수..., 합계, 개수] (구간 개수는 누적이 아닌 해당 구간만, 출력 시 누적)
+            state = self.values.get(key)
+            if state is None:
+                state = [0] * (len(self.buckets) + 2)
+                self.values[key] = state
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def describe(self) -> Dict[str, Any]:
+        description = super().describe()
+        description['buckets'] = list(self.buckets)
+        return description
+
+
+class MetricsRegistry:
+    """프로세스 내 지표 레지스트리 (fork된 자식 프로세스는 값을 새로 시작)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self._pid = os.getpid()
+        self._flusher = None
+
+    def check_pid(self):
+        """fork 후 부모 프로세스 값이 중복 합산되지 않도록 초기화 (lock 안에서 호출)"""
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._flusher = None
+            for metric in self.metrics.values():
+                metric.values = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(self, name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(self, name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help_text, labels, buckets))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """현재 프로세스 값 (파일 저장 형식)"""
+        with self.lock:
+            self.check_pid()
+            return {
+                'pid': self._pid,
+                'updated': time.time(),
+                'metrics': {
+                    name: {
+                        **metric.describe(),
+                        'samples': [[list(key), value if not isinstance(value, list) else list(value)]
+                                    for key, value in metric.values.items()]
+                    }
+                    for name, metric in self.metrics.items()
+                }
+            }
+
+    # ---- 다중 프로세스 ----
+
+    def _directory(self) -> str:
+        return getattr(settings, 'METRICS_DIR', '')
+
+    def flush(self):
+        """현재 프로세스 값을 METRICS_DIR/metrics-<pid>.json에 저장 (원자적 교체)"""
+        directory = self._directory()
+        if not directory:
+            return
+        try:
+            os.makedirs(directory, exist_ok=True)
+            snapshot = self.snapshot()
+            path = os.path.join(directory, f"metrics-{snapshot['pid']}.json")
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(temp_path, path)
+        except Exception as e:
+            logger.warning(f"[METRICS] flush failed: {str(e)}")
+
+    def start_flusher(self):
+        """주기적 저장 스레드 시작 (METRICS_DIR 설정 시, 프로세스당 1개)"""
+        if not self._directory():
+            return
+        with self.lock:
+            self.check_pid()
+            if self._flusher is not None:
+                return
+            interval = getattr(settings, 'METRICS_FLUSH_SECONDS', 5)
+            pid = self._pid
+
+            def run():
+                while os.getpid() == pid:
+                    time.sleep(interval)
+                    self.flush()
+
+            self._flusher = threading.Thread(target=run, name='metrics-flush', daemon=True)
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def _other_process_snapshots(self) -> List[Dict[str, Any]]:
+        directory = self._directory()
+        if not directory or not os.path.isdir(directory):
+            return []
+        stale_seconds = getattr(settings, 'METRICS_STALE_SECONDS', 60)
+        snapshots = []
+        for filename in os.listdir(directory):
+            if not filename.startswith('metrics-') or not filename.endswith('.json'):
+                continue
+            if filename == f"metrics-{os.getpid()}.json":
+                continue
+            try:
+                with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshot['live'] = time.time() - snapshot.get('updated', 0) <= stale_seconds
+            snapshots.append(snapshot)
+        return snapshots
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """모든 프로세스 값 합산 ({name: {type, help, labels, buckets, samples: {label_values: value}}})"""
+        current = self.snapshot()
+        current['live'] = True
+        merged = {}
+        for snapshot in [current, *self._other_process_snapshots()]:
+            for name, data in snapshot['metrics'].items():
+                target = merged.setdefault(name, {**{k: v for k, v in data.items() if k != 'samples'}, 'samples': {}})
+                if data['type'] == 'gauge' and not snapshot['live']:
+                    continue
+                for label_values, value in data['samples']:
+                    key = tuple(label_values)
+                    if isinstance(value, list):
+                        existing = target['samples'].get(key)
+                        target['samples'][key] = value if existing is None else [a + b for a, b in zip(existing, value)]
+                    else:
+                        target['samples'][key] = target['samples'].get(key, 0) + value
+        return merged
+
+    def exposition(self) -> str:
+        """Prometheus 텍스트 형식 (version 0.0.4)"""
+        lines = []
+        for name, data in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {data['help']}")
+            lines.append(f"# TYPE {name} {data['type']}")
+            for key, value in sorted(data['samples'].items()):
+                labels = list(zip(data['labels'], key))
+                if data['type'] == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(data['buckets'], value):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + [('le', '+Inf')])} {value[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    escaped = []
+    for label, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{label}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+registry = MetricsRegistry()
+
+# ---- 처리 지표 ----
+
+invoices_total = registry.counter(
+    'invoice_requests_total', '인보이스 처리 건수', ('engine', 'declaration', 'status')
+)
+invoices_in_flight = registry.gauge(
+    'invoice_requests_in_flight', '처리 중인 인보이스 수', ('engine',)
+)
+stage_seconds = registry.histogram(
+    'invoice_stage_seconds', '처리 단계별 소요 시간 (ocr, preprocess, ai, prompt_build, json_parse, hs_code, result_merge, db, total)',
+    ('stage', 'engine', 'declaration')
+)
+step_seconds = registry.histogram(
+    'invoice_step_seconds', '업무그룹 단계별 AI 호출 시간', ('engine', 'declaration', 'work_group')
+)
+provider_errors_total = registry.counter(
+    'provider_errors_total', '외부 API 오류 수', ('provider', 'operation')
+)
+provider_retries_total = registry.counter(
+    'provider_retries_total', '외부 API 재시도 수 (HTTP 429/5xx 재시도, 응답 잘림으로 인한 행 범위 분할 호출)',
+    ('provider', 'reason')
+)
+coalesced_total = registry.counter(
+    'invoice_requests_coalesced_total', '처리 중인 동일 요청에 합쳐진 요청 수 (local: 같은 프로세스, remote: 다른 워커)', ('scope',)
+)
+tokens_total = registry.counter(
+    'ai_tokens_total', 'AI 토큰 사용량 (prompt, cached, completion)', ('engine', 'declaration', 'kind')
+)
+
+# result['timings']에서 히스토그램으로 기록하는 단계
+TIMED_STAGES = ('ocr', 'preprocess', 'ai', 'prompt_build', 'json_parse', 'hs_code', 'result_merge', 'db', 'total')
+
+
+def record_invoice(result: Dict[str, Any], engine: str, declaration: str):
+    """인보이스 1건 처리 결과 지표 기록 (InvoiceProcessor.process 결과)"""
+    invoices_total.inc(engine=engine, declaration=declaration, status='success' if result.get('success') else 'failed')
+
+    timings = result.get('timings') or {}
+    for stage in TIMED_STAGES:
+        stage_seconds.observe(timings.get(stage), stage=stage, engine=engine, declaration=declaration)
+
+    for step in result.get('steps') or []:
+        usage = step.get('usage') or {}
+        step_seconds.observe(usage.get('latency'), engine=engine, declaration=declaration, work_group=step.get('work_group'))
+
+    usage = result.get('usage') or {}
+    for kind in ('prompt', 'cached', 'completion'):
+        tokens_total.inc(usage.get(f'{kind}_tokens') or 0, engine=engine, declaration=declaration, kind=kind)
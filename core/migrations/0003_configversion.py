@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_tableprocessconfig_mappinginfo_table_config'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfigVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='설정 이름')),
+                ('version', models.BigIntegerField(default=0, verbose_name='버전')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='수정일시')),
+            ],
+            options={
+                'verbose_name': '설정 버전',
+                'verbose_name_plural': '설정 버전',
+                'db_table': 'config_versions',
+            },
+        ),
+    ]
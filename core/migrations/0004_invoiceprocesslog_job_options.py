@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_configversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceprocesslog',
+            name='ai_engine',
+            field=models.CharField(default='gpt', max_length=20, verbose_name='AI 엔진'),
+        ),
+        migrations.AddField(
+            model_name='invoiceprocesslog',
+            name='hs_code_process_order',
+            field=models.IntegerField(blank=True, null=True, verbose_name='HS 코드 추천 처리 순서'),
+        ),
+    ]
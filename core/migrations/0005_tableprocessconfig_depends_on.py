@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_invoiceprocesslog_job_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tableprocessconfig',
+            name='depends_on',
+            field=models.JSONField(blank=True, null=True, verbose_name='선행 업무그룹'),
+        ),
+    ]
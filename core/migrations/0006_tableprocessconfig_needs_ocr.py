@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_tableprocessconfig_depends_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tableprocessconfig',
+            name='needs_ocr',
+            field=models.BooleanField(default=True, verbose_name='OCR 텍스트 사용'),
+        ),
+    ]
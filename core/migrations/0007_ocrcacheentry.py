@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_tableprocessconfig_needs_ocr'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=64, unique=True, verbose_name='캐시 키')),
+                ('image_sha256', models.CharField(db_index=True, max_length=64, verbose_name='이미지 해시')),
+                ('ocr_text', models.TextField(blank=True, default='', verbose_name='OCR 추출 텍스트')),
+                ('hit_count', models.IntegerField(default=0, verbose_name='조회 횟수')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='생성일시')),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='만료일시')),
+            ],
+            options={
+                'verbose_name': 'OCR 캐시',
+                'verbose_name_plural': 'OCR 캐시',
+                'db_table': 'ocr_cache_entries',
+            },
+        ),
+    ]
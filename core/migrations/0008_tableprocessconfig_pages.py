@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_ocrcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tableprocessconfig',
+            name='pages',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='처리 페이지'),
+        ),
+    ]
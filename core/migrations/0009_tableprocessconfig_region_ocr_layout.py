@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_tableprocessconfig_pages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrcacheentry',
+            name='ocr_layout',
+            field=models.TextField(blank=True, default='', verbose_name='OCR 레이아웃'),
+        ),
+        migrations.AddField(
+            model_name='tableprocessconfig',
+            name='region',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='처리 영역'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_tableprocessconfig_region_ocr_layout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mappinginfo',
+            name='keyword_hints',
+            field=models.CharField(blank=True, default='', max_length=500, verbose_name='OCR 키워드'),
+        ),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:54
+
+import json
+import zlib
+from django.db import migrations, models
+import django.db.models.deletion
+
+PAYLOAD_FIELDS = ('ocr_text', 'gpt_request', 'gpt_response', 'result_json')
+BATCH_SIZE = 500
+
+
+def _payload_bytes(value):
+    if value is None:
+        return None
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return text.encode('utf-8')
+
+
+def move_payloads(apps, schema_editor):
+    """기존 처리 로그 본문을 압축하여 invoice_process_payloads로 이동 (id 순서로 나누어 처리)"""
+    InvoiceProcessLog = apps.get_model('core', 'InvoiceProcessLog')
+    InvoiceProcessPayload = apps.get_model('core', 'InvoiceProcessPayload')
+    has_payload = models.Q()
+    for field in PAYLOAD_FIELDS:
+        has_payload |= models.Q(**{f'{field}__isnull': False})
+
+    last_id = 0
+    while True:
+        rows = list(
+            InvoiceProcessLog.objects.filter(has_payload, id__gt=last_id)
+            .order_by('id').values('id', *PAYLOAD_FIELDS)[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        payloads = []
+        for row in rows:
+            values = {'raw_bytes': 0, 'stored_bytes': 0}
+            for field in PAYLOAD_FIELDS:
+                raw = _payload_bytes(row[field])
+                values[field] = None if raw is None else zlib.compress(raw, 6)
+                if raw is not None:
+                    values['raw_bytes'] += len(raw)
+                    values['stored_bytes'] += len(values[field])
+            payloads.append(InvoiceProcessPayload(process_log_id=row['id'], **values))
+        InvoiceProcessPayload.objects.bulk_create(payloads)
+        last_id = rows[-1]['id']
+
+
+def restore_payloads(apps, schema_editor):
+    """되돌리기: 압축 본문을 처리 로그 컬럼으로 복원"""
+    InvoiceProcessLog = apps.get_model('core', 'InvoiceProcessLog')
+    InvoiceProcessPayload = apps.get_model('core', 'InvoiceProcessPayload')
+    last_id = 0
+    while True:
+        payloads = list(
+            InvoiceProcessPayload.objects.filter(process_log_id__gt=last_id).order_by('process_log_id')[:BATCH_SIZE]
+        )
+        if not payloads:
+            break
+        for payload in payloads:
+            values = {}
+            for field in PAYLOAD_FIELDS:
+                blob = getattr(payload, field)
+                values[field] = None if blob is None else zlib.decompress(bytes(blob)).decode('utf-8')
+            if values['result_json'] is not None:
+                values['result_json'] = json.loads(values['result_json'])
+            InvoiceProcessLog.objects.filter(id=payload.process_log_id).update(**values)
+        last_id = payloads[-1].process_log_id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_mappinginfo_keyword_hints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceProcessPayload',
+            fields=[
+                ('process_log', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payload', serialize=False, to='core.invoiceprocesslog', verbose_name='처리 로그')),
+                ('ocr_text', models.BinaryField(blank=True, null=True, verbose_name='OCR 추출 텍스트')),
+                ('gpt_request', models.BinaryField(blank=True, null=True, verbose_name='GPT 요청')),
+                ('gpt_response', models.BinaryField(blank=True, null=True, verbose_name='GPT 응답')),
+                ('result_json', models.BinaryField(blank=True, null=True, verbose_name='결과 JSON')),
+                ('raw_bytes', models.BigIntegerField(default=0, verbose_name='원본 크기')),
+                ('stored_bytes', models.BigIntegerField(default=0, verbose_name='저장 크기')),
+            ],
+            options={
+                'verbose_name': '인보이스 처리 로그 본문',
+                'verbose_name_plural': '인보이스 처리 로그 본문',
+                'db_table': 'invoice_process_payloads',
+            },
+        ),
+        migrations.RunPython(move_payloads, restore_payloads),
+        migrations.RemoveField(
+            model_name='invoiceprocesslog',
+            name='gpt_request',
+        ),
+        migrations.RemoveField(
+            model_name='invoiceprocesslog',
+            name='gpt_response',
+        ),
+        migrations.RemoveField(
+            model_name='invoiceprocesslog',
+            name='ocr_text',
+        ),
+        migrations.RemoveField(
+            model_name='invoiceprocesslog',
+            name='result_json',
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_invoiceprocesspayload'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoiceprocesslog',
+            index=models.Index(fields=['-created_at', '-id'], name='ipl_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceprocesslog',
+            index=models.Index(fields=['service_user', '-created_at', '-id'], name='ipl_service_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceprocesslog',
+            index=models.Index(fields=['declaration', '-created_at', '-id'], name='ipl_declaration_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceprocesslog',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='ipl_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_invoiceprocesslog_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='log_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='처리 로그 보관 기간(일)'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedProcessLog',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='처리 로그 ID')),
+                ('status', models.CharField(max_length=20, verbose_name='처리 상태')),
+                ('created_at', models.DateTimeField(verbose_name='생성일시')),
+                ('archive_file', models.CharField(max_length=500, verbose_name='아카이브 파일')),
+                ('image_file', models.CharField(blank=True, max_length=500, null=True, verbose_name='아카이브 이미지')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='아카이브 일시')),
+                ('declaration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_process_logs', to='core.declaration', verbose_name='신고서')),
+                ('service_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_process_logs', to='core.serviceuser', verbose_name='서비스 사용자')),
+            ],
+            options={
+                'verbose_name': '아카이브된 처리 로그',
+                'verbose_name_plural': '아카이브된 처리 로그',
+                'db_table': 'archived_process_logs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['service_user', '-created_at'], name='apl_service_user_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:02
+
+import core.image_store
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_archived_process_logs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='파일 경로')),
+                ('sha256', models.CharField(db_index=True, max_length=64, verbose_name='이미지 해시')),
+                ('size', models.BigIntegerField(default=0, verbose_name='크기')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='참조 수')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='생성일시')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='수정일시')),
+            ],
+            options={
+                'verbose_name': '저장 이미지',
+                'verbose_name_plural': '저장 이미지',
+                'db_table': 'stored_images',
+            },
+        ),
+        migrations.AlterField(
+            model_name='invoiceprocesslog',
+            name='image_file',
+            field=models.ImageField(max_length=255, storage=core.image_store.ContentAddressedStorage(), upload_to='invoices/%Y/%m/%d/', verbose_name='인보이스 이미지'),
+        ),
+    ]
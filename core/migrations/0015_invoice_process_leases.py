@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_stored_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceProcessLease',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='요청 키')),
+                ('owner', models.CharField(max_length=255, verbose_name='처리 워커')),
+                ('expires_at', models.DateTimeField(verbose_name='만료일시')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='생성일시')),
+                ('process_log', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.invoiceprocesslog', verbose_name='처리 로그')),
+            ],
+            options={
+                'verbose_name': '인보이스 처리 임대',
+                'verbose_name_plural': '인보이스 처리 임대',
+                'db_table': 'invoice_process_leases',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_invoice_process_leases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceprocesslog',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='처리 시도 횟수'),
+        ),
+        migrations.AddField(
+            model_name='invoiceprocesslog',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='처리 시작일시'),
+        ),
+    ]
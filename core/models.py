@@ -1,6 +1,16 @@
+import json
+import zlib
+import logging
+from typing import Dict, Any
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils import timezone
+from .image_store import image_storage, sha256_from_name
+
+logger = logging.getLogger('core')
 
 
 class CustomUser(AbstractUser):
@@ -47,6 +57,9 @@ class Service(models.Model):
     db_user = models.CharField(max_length=100, blank=True, null=True, verbose_name='DB 사용자')
     db_password = models.CharField(max_length=255, blank=True, null=True, verbose_name='DB 비밀번호')
 
+    # 처리 로그 보관 기간 (일, 비우면 LOG_RETENTION_DAYS 설정 사용 / 0이면 보관 기간 없이 유지)
+    log_retention_days = models.PositiveIntegerField(blank=True, null=True, verbose_name='처리 로그 보관 기간(일)')
+
     is_active = models.BooleanField(default=True, verbose_name='활성화 여부')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='생성일시')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='수정일시')
@@ -60,6 +73,12 @@ class Service(models.Model):
     def __str__(self):
         return self.name
 
+    def get_log_retention_days(self) -> int:
+        """처리 로그 보관 기간 (일, 0이면 아카이브하지 않음)"""
+        if self.log_retention_days is not None:
+            return self.log_retention_days
+        return getattr(settings, 'LOG_RETENTION_DAYS', 0)
+
 
 class ServiceUser(models.Model):
     """
@@ -138,6 +157,19 @@ class TableProcessConfig(models.Model):
     # 테이블 전체에 대한 프롬프트
     table_prompt = models.TextField(blank=True, null=True, verbose_name='테이블 프롬프트')  # 테이블 전체 추출 시 사용할 프롬프트
 
+    # 선행 업무그룹 (null: 이전 처리 순서 전체에 의존, []: 선행 단계 없음)
+    # 서로 의존하지 않는 단계는 동시에 처리됨
+    depends_on = models.JSONField(blank=True, null=True, verbose_name='선행 업무그룹')
+
+    # OCR 텍스트 필요 여부 (False인 단계는 OCR 완료를 기다리지 않고 이미지만으로 바로 처리)
+    needs_ocr = models.BooleanField(default=True, verbose_name='OCR 텍스트 사용')
+
+    # 다중 페이지 문서(PDF/TIFF)에서 이 단계에 첨부할 페이지 (예: '1', '1-2', 'last', 빈 값: 전체)
+    pages = models.CharField(max_length=50, blank=True, default='', verbose_name='처리 페이지')
+
+    # 이 단계에 첨부할 이미지/OCR 영역 (페이지 대비 비율 'x0,y0,x1,y1', 예: 품목 표 '0,0.35,1,0.85', 빈 값: 전체)
+    region = models.CharField(max_length=100, blank=True, default='', verbose_name='처리 영역')
+
     is_active = models.BooleanField(default=True, verbose_name='활성화 여부')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='생성일시')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='수정일시')
@@ -149,6 +181,15 @@ class TableProcessConfig(models.Model):
         ordering = ['declaration', 'process_order']
         unique_together = ['declaration', 'service_user', 'db_table_name']
 
+    @property
+    def depends_on_display(self):
+        """화면 표시/입력용 선행 업무그룹 문자열 ('': 이전 단계 전체, '-': 없음)"""
+        if self.depends_on is None:
+            return ''
+        if not self.depends_on:
+            return '-'
+        return ', '.join(self.depends_on)
+
     def __str__(self):
         if self.service_user:
             return f"{self.declaration.name} - {self.work_group} (순서: {self.process_order}) - {self.service_user}"
@@ -192,6 +233,9 @@ class MappingInfo(models.Model):
     # 우선순위 (같은 항목에 대해 여러 매핑이 있을 경우)
     priority = models.IntegerField(default=0, verbose_name='우선순위')
 
+    # OCR 텍스트 축소 시 관련 줄을 찾기 위한 키워드 (쉼표 구분, 예: 'seller, shipper, exporter')
+    keyword_hints = models.CharField(max_length=500, blank=True, default='', verbose_name='OCR 키워드')
+
     is_active = models.BooleanField(default=True, verbose_name='활성화 여부')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='생성일시')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='수정일시')
@@ -266,24 +310,25 @@ class InvoiceProcessLog(models.Model):
     declaration = models.ForeignKey(Declaration, on_delete=models.CASCADE,
                                    related_name='process_logs', verbose_name='신고서')
 
-    # 이미지 파일
-    image_file = models.ImageField(upload_to='invoices/%Y/%m/%d/', verbose_name='인보이스 이미지')
-
-    # OCR 결과
-    ocr_text = models.TextField(blank=True, null=True, verbose_name='OCR 추출 텍스트')
+    # 이미지 파일 (SHA-256 내용 주소 저장 - 같은 이미지는 파일 하나를 공유, core.image_store)
+    image_file = models.ImageField(upload_to='invoices/%Y/%m/%d/', storage=image_storage, max_length=255,
+                                   verbose_name='인보이스 이미지')
 
-    # ChatGPT 요청/응답
-    gpt_request = models.TextField(blank=True, null=True, verbose_name='GPT 요청')
-    gpt_response = models.TextField(blank=True, null=True, verbose_name='GPT 응답')
+    # 처리 옵션 (비동기 처리 시 워커에서 재사용)
+    ai_engine = models.CharField(max_length=20, default='gpt', verbose_name='AI 엔진')
+    hs_code_process_order = models.IntegerField(blank=True, null=True, verbose_name='HS 코드 추천 처리 순서')
 
-    # 최종 JSON 결과
-    result_json = models.JSONField(blank=True, null=True, verbose_name='결과 JSON')
+    # OCR 결과 / AI 요청·응답 / 최종 JSON 결과는 InvoiceProcessPayload에 압축 보관 (save_payload / load_payload)
 
     # 처리 상태
     status = models.CharField(max_length=20, choices=STATUS_CHOICES,
                              default='pending', verbose_name='처리 상태')
     error_message = models.TextField(blank=True, null=True, verbose_name='에러 메시지')
 
+    # 처리 시작(processing 전환) 시각 / 시도 횟수 - 워커 비정상 종료로 processing에 남은 작업 복구용 (core.jobs)
+    claimed_at = models.DateTimeField(blank=True, null=True, verbose_name='처리 시작일시')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='처리 시도 횟수')
+
     # 타임스탬프
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='생성일시')
     completed_at = models.DateTimeField(blank=True, null=True, verbose_name='완료일시')
@@ -296,6 +341,233 @@ class InvoiceProcessLog(models.Model):
         verbose_name = '인보이스 처리 로그'
         verbose_name_plural = '인보이스 처리 로그'
         ordering = ['-created_at']
+        indexes = [
+            # 처리 로그 목록: 필터별 최신순 키셋 페이지네이션 (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='ipl_created_idx'),
+            models.Index(fields=['service_user', '-created_at', '-id'], name='ipl_service_user_created_idx'),
+            models.Index(fields=['declaration', '-created_at', '-id'], name='ipl_declaration_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='ipl_status_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.declaration.name} - {self.status} ({self.created_at})"
+
+    def save(self, *args, **kwargs):
+        # 이미지 참조 증가(image_storage._save)와 행 저장을 한 트랜잭션으로 - 저장 실패/롤백 시 참조도 취소
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    @property
+    def image_sha256(self) -> str:
+        """이미지 SHA-256 (내용 주소 저장 이전에 올라온 이미지는 None)"""
+        return sha256_from_name(self.image_file.name)
+
+    def save_payload(self, **values) -> 'InvoiceProcessPayload':
+        """처리 결과 본문 저장 (ocr_text, gpt_request, gpt_response, result_json)"""
+        return InvoiceProcessPayload.store(self, **values)
+
+    def load_payload(self) -> Dict[str, Any]:
+        """처리 결과 본문 조회 (상세 조회 시에만 별도 쿼리로 로드, 없으면 모두 None)"""
+        payload = InvoiceProcessPayload.objects.filter(process_log_id=self.pk).first()
+        if payload is None:
+            return dict.fromkeys(InvoiceProcessPayload.PAYLOAD_FIELDS)
+        return payload.load()
+
+
+@receiver(post_delete, sender=InvoiceProcessLog)
+def release_process_log_image(sender, instance, using, **kwargs):
+    """처리 로그 삭제 시 이미지 참조 해제 - 삭제가 커밋된 뒤 실행 (롤백되면 참조 유지)"""
+    if not instance.image_file:
+        return
+    storage, name = instance.image_file.storage, instance.image_file.name
+
+    def release():
+        try:
+            storage.delete(name)
+        except OSError as e:
+            logger.warning(f"[IMAGE STORE] 이미지 참조 해제 실패 (log_id={instance.pk}): {e}")
+
+    transaction.on_commit(release, using=using)
+
+
+def payload_bytes(value) -> bytes:
+    """본문 직렬화 (문자열은 그대로, 그 외는 JSON) - 압축 전 UTF-8 바이트"""
+    if value is None:
+        return None
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return text.encode('utf-8')
+
+
+def decompress_payload(blob) -> str:
+    if blob is None:
+        return None
+    return zlib.decompress(bytes(blob)).decode('utf-8')
+
+
+class InvoiceProcessPayload(models.Model):
+    """
+    인보이스 처리 로그 본문 (zlib 압축)
+    수 KB~수백 KB인 OCR 텍스트/AI 요청·응답/결과 JSON을 처리 로그 테이블에서 분리하여
+    목록/상태 조회는 작은 행만 읽고, 상세 조회에서만 로드
+    """
+    PAYLOAD_FIELDS = ('ocr_text', 'gpt_request', 'gpt_response', 'result_json')
+
+    process_log = models.OneToOneField(InvoiceProcessLog, on_delete=models.CASCADE, primary_key=True,
+                                       related_name='payload', verbose_name='처리 로그')
+    ocr_text = models.BinaryField(blank=True, null=True, verbose_name='OCR 추출 텍스트')
+    gpt_request = models.BinaryField(blank=True, null=True, verbose_name='GPT 요청')
+    gpt_response = models.BinaryField(blank=True, null=True, verbose_name='GPT 응답')
+    result_json = models.BinaryField(blank=True, null=True, verbose_name='결과 JSON')
+
+    # 압축 전/후 크기 (bytes)
+    raw_bytes = models.BigIntegerField(default=0, verbose_name='원본 크기')
+    stored_bytes = models.BigIntegerField(default=0, verbose_name='저장 크기')
+
+    class Meta:
+        db_table = 'invoice_process_payloads'
+        verbose_name = '인보이스 처리 로그 본문'
+        verbose_name_plural = '인보이스 처리 로그 본문'
+
+    def __str__(self):
+        return f"{self.process_log_id} ({self.stored_bytes:,} / {self.raw_bytes:,} bytes)"
+
+    @classmethod
+    def store(cls, process_log: InvoiceProcessLog, **values) -> 'InvoiceProcessPayload':
+        """처리 로그 본문 압축 저장 (지정하지 않은 항목은 None)"""
+        unknown = set(values) - set(cls.PAYLOAD_FIELDS)
+        if unknown:
+            raise Exception(f"알 수 없는 처리 로그 본문 항목입니다: {', '.join(sorted(unknown))}")
+
+        level = getattr(settings, 'PAYLOAD_COMPRESSION_LEVEL', 6)
+        defaults = {'raw_bytes': 0, 'stored_bytes': 0}
+        for field in cls.PAYLOAD_FIELDS:
+            raw = payload_bytes(values.get(field))
+            defaults[field] = None if raw is None else zlib.compress(raw, level)
+            if raw is not None:
+                defaults['raw_bytes'] += len(raw)
+                defaults['stored_bytes'] += len(defaults[field])
+
+        payload, _ = cls.objects.update_or_create(process_log=process_log, defaults=defaults)
+        return payload
+
+    def load(self) -> Dict[str, Any]:
+        """압축 해제 (result_json은 JSON으로 파싱)"""
+        data = {field: decompress_payload(getattr(self, field)) for field in self.PAYLOAD_FIELDS}
+        if data['result_json'] is not None:
+            data['result_json'] = json.loads(data['result_json'])
+        return data
+
+
+class InvoiceProcessLease(models.Model):
+    """
+    처리 중인 인보이스 요청 임대 (core.single_flight)
+    워커 프로세스 간 동일 요청 합치기 - 요청 키당 한 워커만 처리하고, 다른 워커는 process_log 완료를 기다림
+    """
+    key = models.CharField(max_length=64, primary_key=True, verbose_name='요청 키')
+    process_log = models.ForeignKey(InvoiceProcessLog, on_delete=models.CASCADE, blank=True, null=True,
+                                    related_name='+', verbose_name='처리 로그')
+    owner = models.CharField(max_length=255, verbose_name='처리 워커')
+    expires_at = models.DateTimeField(verbose_name='만료일시')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='생성일시')
+
+    class Meta:
+        db_table = 'invoice_process_leases'
+        verbose_name = '인보이스 처리 임대'
+        verbose_name_plural = '인보이스 처리 임대'
+
+    def __str__(self):
+        return f"{self.key[:12]} ({self.owner}, ~{self.expires_at})"
+
+
+class StoredImage(models.Model):
+    """
+    내용 주소 저장 이미지 (core.image_store)
+    같은 내용의 업로드는 파일 하나를 공유하고, 참조하는 처리 로그가 없어지면 파일 삭제
+    """
+    name = models.CharField(max_length=255, unique=True, verbose_name='파일 경로')
+    sha256 = models.CharField(max_length=64, db_index=True, verbose_name='이미지 해시')
+    size = models.BigIntegerField(default=0, verbose_name='크기')
+    ref_count = models.PositiveIntegerField(default=0, verbose_name='참조 수')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='생성일시')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='수정일시')
+
+    class Meta:
+        db_table = 'stored_images'
+        verbose_name = '저장 이미지'
+        verbose_name_plural = '저장 이미지'
+
+    def __str__(self):
+        return f"{self.sha256[:12]} (참조 {self.ref_count})"
+
+
+class ArchivedProcessLog(models.Model):
+    """
+    아카이브된 처리 로그 색인
+    보관 기간이 지난 처리 로그는 서비스/월별 아카이브 파일(Parquet 또는 jsonl.gz)로 옮기고,
+    원래 ID로 아카이브 파일 위치와 권한 확인에 필요한 최소 정보만 남김 (core.log_archive)
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='처리 로그 ID')
+    service_user = models.ForeignKey(ServiceUser, on_delete=models.CASCADE,
+                                     related_name='archived_process_logs', verbose_name='서비스 사용자')
+    declaration = models.ForeignKey(Declaration, on_delete=models.CASCADE,
+                                    related_name='archived_process_logs', verbose_name='신고서')
+    status = models.CharField(max_length=20, verbose_name='처리 상태')
+    created_at = models.DateTimeField(verbose_name='생성일시')
+
+    # LOG_ARCHIVE_ROOT 기준 상대 경로
+    archive_file = models.CharField(max_length=500, verbose_name='아카이브 파일')
+    image_file = models.CharField(max_length=500, blank=True, null=True, verbose_name='아카이브 이미지')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='아카이브 일시')
+
+    class Meta:
+        db_table = 'archived_process_logs'
+        verbose_name = '아카이브된 처리 로그'
+        verbose_name_plural = '아카이브된 처리 로그'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['service_user', '-created_at'], name='apl_service_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.id} - {self.archive_file}"
+
+
+class ConfigVersion(models.Model):
+    """
+    설정 버전
+    매핑정보/프롬프트/테이블 처리 설정이 변경될 때마다 증가하여
+    워커 프로세스별 설정 스냅샷 캐시를 무효화
+    """
+    name = models.CharField(max_length=50, unique=True, verbose_name='설정 이름')
+    version = models.BigIntegerField(default=0, verbose_name='버전')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='수정일시')
+
+    class Meta:
+        db_table = 'config_versions'
+        verbose_name = '설정 버전'
+        verbose_name_plural = '설정 버전'
+
+    def __str__(self):
+        return f"{self.name} (v{self.version})"
+
+
+class OCRCacheEntry(models.Model):
+    """
+    OCR 결과 캐시
+    이미지 바이트의 SHA-256과 OCR 설정(기능/언어 힌트)을 키로 OCR 결과를 보관
+    """
+    cache_key = models.CharField(max_length=64, unique=True, verbose_name='캐시 키')
+    image_sha256 = models.CharField(max_length=64, db_index=True, verbose_name='이미지 해시')
+    ocr_text = models.TextField(blank=True, default='', verbose_name='OCR 추출 텍스트')
+    ocr_layout = models.TextField(blank=True, default='', verbose_name='OCR 레이아웃')  # 단어 좌표 JSON (core.ocr_layout)
+    hit_count = models.IntegerField(default=0, verbose_name='조회 횟수')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='생성일시')
+    expires_at = models.DateTimeField(blank=True, null=True, db_index=True, verbose_name='만료일시')
+
+    class Meta:
+        db_table = 'ocr_cache_entries'
+        verbose_name = 'OCR 캐시'
+        verbose_name_plural = 'OCR 캐시'
+
+    def __str__(self):
+        return f"{self.image_sha256[:12]} ({self.created_at})"
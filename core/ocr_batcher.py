@@ -0,0 +1,174 @@
+"""
+Vision OCR 마이크로 배치
+짧은 대기 시간(OCR_BATCH_WINDOW_MS) 안에 들어온 OCR 요청(동시 API 요청, 배치 작업의 여러 인보이스,
+다중 페이지 문서의 페이지)을 모아 batch_annotate_images 한 번(최대 16장)으로 전송하고
+결과를 각 요청에 나누어 돌려줌
+혼자 들어온 요청은 대기 시간 이상 지연되지 않음
+"""
+import os
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from django.conf import settings
+from google.cloud import vision
+from .clients import get_vision_client
+
+logger = logging.getLogger('core')
+
+# Vision API batch_annotate_images 요청당 최대 이미지 수
+VISION_MAX_BATCH_SIZE = 16
+
+
+class _OCRRequest:
+    __slots__ = ('content', 'language_hints', 'future')
+
+    def __init__(self, content: bytes, language_hints: List[str]):
+        self.content = content
+        self.language_hints = language_hints
+        self.future = Future()
+
+
+class OCRBatcher:
+    """OCR 요청을 모아 batch_annotate_images로 전송하는 디스패처 (프로세스당 1개 스레드)"""
+
+    def __init__(self):
+        self._queue = None
+        self._sender = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'batches': 0, 'largest_batch': 0, 'errors': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(settings, 'OCR_BATCH_ENABLED', True)
+
+    def _window(self) -> float:
+        return max(0, getattr(settings, 'OCR_BATCH_WINDOW_MS', 5)) / 1000
+
+    def _max_size(self) -> int:
+        return max(1, min(VISION_MAX_BATCH_SIZE, getattr(settings, 'OCR_BATCH_MAX_SIZE', VISION_MAX_BATCH_SIZE)))
+
+    def _max_bytes(self) -> int:
+        return getattr(settings, 'OCR_BATCH_MAX_BYTES', 8 * 1024 * 1024)
+
+    def _ensure_started(self):
+        """디스패처 스레드 시작 (fork된 프로세스에서는 새로 시작)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            # 전송 중인 배치가 있어도 다음 배치를 모을 수 있도록 전송은 별도 스레드에서 실행
+            self._sender = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'OCR_BATCH_MAX_INFLIGHT', 4),
+                thread_name_prefix='ocr-batch-send'
+            )
+            self._thread = threading.Thread(target=self._run, name='ocr-batcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, content: bytes, language_hints: Optional[List[str]] = None) -> Future:
+        """
+        OCR 요청 등록
+
+        Args:
+            content: 이미지 바이트
+            language_hints: Vision API 언어 힌트
+
+        Returns:
+            AnnotateImageResponse Future
+        """
+        self._ensure_started()
+        request = _OCRRequest(content, list(language_hints or []))
+        self._queue.put(request)
+        return request.future
+
+    def annotate(self, content: bytes, language_hints: Optional[List[str]] = None) -> vision.AnnotateImageResponse:
+        """OCR 요청 후 결과 대기"""
+        return self.submit(content, language_hints).result()
+
+    def _run(self):
+        carry = None
+        while True:
+            first = carry or self._queue.get()
+            carry = None
+            batch = [first]
+            batch_bytes = len(first.content)
+            max_size = self._max_size()
+            max_bytes = self._max_bytes()
+            deadline = time.monotonic() + self._window()
+
+            # 대기 시간 안에 들어온 요청을 최대 크기까지 모음
+            while len(batch) < max_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if batch_bytes + len(request.content) > max_bytes:
+                    # 요청 크기 제한 초과 시 다음 배치로 넘김
+                    carry = request
+                    break
+                batch.append(request)
+                batch_bytes += len(request.content)
+
+            try:
+                self._sender.submit(self._send, batch)
+            except Exception as e:
+                self._fail(batch, e)
+
+    def _send(self, batch: List[_OCRRequest]):
+        try:
+            requests = []
+            for request in batch:
+                annotate_request = {
+                    'image': vision.Image(content=request.content),
+                    'features': [vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)],
+                }
+                if request.language_hints:
+                    annotate_request['image_context'] = {'language_hints': request.language_hints}
+                requests.append(annotate_request)
+
+            start = time.time()
+            response = get_vision_client().batch_annotate_images(requests=requests)
+            elapsed = time.time() - start
+        except Exception as e:
+            self._fail(batch, e)
+            return
+
+        with self._lock:
+            self._stats['requests'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+        logger.info(f"[OCR BATCH] {len(batch)} images in 1 call ({elapsed:.2f}s)")
+
+        # 요청 순서대로 응답이 반환됨
+        for request, image_response in zip(batch, response.responses):
+            request.future.set_result(image_response)
+        for request in batch[len(response.responses):]:
+            request.future.set_exception(Exception('Vision API 배치 응답 누락'))
+
+    def _fail(self, batch: List[_OCRRequest], error: Exception):
+        with self._lock:
+            self._stats['errors'] += 1
+        logger.warning(f"[OCR BATCH] Batch of {len(batch)} failed: {str(error)}")
+        for request in batch:
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        """배치 통계 (현재 프로세스 기준)"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['window_ms'] = getattr(settings, 'OCR_BATCH_WINDOW_MS', 5)
+        stats['average_batch_size'] = stats['requests'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+
+ocr_batcher = OCRBatcher()
@@ -0,0 +1,169 @@
+"""
+OCR 결과 캐시
+이미지 바이트의 SHA-256 + OCR 설정(기능/언어 힌트)을 키로
+프로세스 내 LRU 메모리 캐시와 DB 테이블(OCRCacheEntry)에 OCR 결과를 보관
+동일한 이미지를 다시 제출해도 Google Vision API를 다시 호출하지 않음
+"""
+import hashlib
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Any, Optional, Tuple
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .models import OCRCacheEntry
+from .ocr_layout import OCRText
+
+logger = logging.getLogger('core')
+
+# OCR 요청 기능 (캐시 키에 포함)
+OCR_FEATURE = 'text_detection'
+
+
+def get_language_hints() -> list:
+    """Vision API 언어 힌트 (OCR_LANGUAGE_HINTS)"""
+    return list(getattr(settings, 'OCR_LANGUAGE_HINTS', []) or [])
+
+
+def make_cache_key(image_bytes: bytes = None, image_sha256: str = None) -> Tuple[str, str]:
+    """
+    캐시 키 생성
+
+    Args:
+        image_bytes: 이미지 바이트 (image_sha256이 없을 때 해시 계산)
+        image_sha256: 이미 계산된 이미지 SHA-256
+
+    Returns:
+        (이미지 SHA-256, 캐시 키)
+    """
+    if image_sha256 is None:
+        image_sha256 = hashlib.sha256(image_bytes).hexdigest()
+    options = f"{OCR_FEATURE}|{','.join(get_language_hints())}"
+    cache_key = hashlib.sha256(f"{image_sha256}|{options}".encode('utf-8')).hexdigest()
+    return image_sha256, cache_key
+
+
+class OCRCache:
+    """LRU 메모리 캐시 + DB 영구 캐시"""
+
+    def __init__(self):
+        self._memory = OrderedDict()  # cache_key -> (ocr_text, 만료 시각 timestamp 또는 None)
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(settings, 'OCR_CACHE_ENABLED', True)
+
+    def _ttl(self) -> int:
+        return getattr(settings, 'OCR_CACHE_TTL_SECONDS', 0)
+
+    def _remember(self, cache_key: str, ocr_text: str, expires_ts: Optional[float]):
+        max_entries = getattr(settings, 'OCR_CACHE_MAX_ENTRIES', 512)
+        with self._lock:
+            self._memory[cache_key] = (ocr_text, expires_ts)
+            self._memory.move_to_end(cache_key)
+            while len(self._memory) > max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """캐시 조회 (메모리 -> DB 순서, 없으면 None)"""
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(cache_key)
+            if cached is not None:
+                ocr_text, expires_ts = cached
+                if expires_ts is None or expires_ts > now:
+                    self._memory.move_to_end(cache_key)
+                    self._stats['memory_hits'] += 1
+                    return ocr_text
+                del self._memory[cache_key]
+
+        try:
+            entry = OCRCacheEntry.objects.filter(cache_key=cache_key).only(
+                'id', 'ocr_text', 'ocr_layout', 'expires_at'
+            ).first()
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= timezone.now():
+                entry = None
+            if entry is not None:
+                OCRCacheEntry.objects.filter(pk=entry.pk).update(hit_count=F('hit_count') + 1)
+        except Exception as e:
+            logger.warning(f"[OCR CACHE] Lookup failed: {str(e)}")
+            entry = None
+
+        if entry is not None:
+            ocr_text = OCRText(entry.ocr_text, layout_json=entry.ocr_layout)
+            self._remember(cache_key, ocr_text, entry.expires_at.timestamp() if entry.expires_at else None)
+            with self._lock:
+                self._stats['db_hits'] += 1
+            return ocr_text
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, cache_key: str, image_sha256: str, ocr_text: str):
+        """OCR 결과 저장 (DB 저장 실패 시에도 OCR 처리는 계속)"""
+        ttl = self._ttl()
+        expires_at = timezone.now() + timedelta(seconds=ttl) if ttl else None
+        self._remember(cache_key, ocr_text, expires_at.timestamp() if expires_at else None)
+
+        try:
+            OCRCacheEntry.objects.update_or_create(
+                cache_key=cache_key,
+                defaults={
+                    'image_sha256': image_sha256,
+                    'ocr_text': ocr_text,
+                    'ocr_layout': getattr(ocr_text, 'layout_json', ''),
+                    'expires_at': expires_at
+                }
+            )
+        except Exception as e:
+            logger.warning(f"[OCR CACHE] Store failed: {str(e)}")
+
+        with self._lock:
+            self._stats['stores'] += 1
+
+    def purge(self, expired_only: bool = True, image_sha256: str = None) -> int:
+        """
+        캐시 삭제
+
+        Args:
+            expired_only: True면 만료된 항목만 삭제
+            image_sha256: 지정 시 해당 이미지의 캐시만 삭제
+
+        Returns:
+            삭제된 DB 항목 수
+        """
+        queryset = OCRCacheEntry.objects.all()
+        if expired_only:
+            queryset = queryset.filter(expires_at__isnull=False, expires_at__lte=timezone.now())
+        if image_sha256:
+            queryset = queryset.filter(image_sha256=image_sha256)
+        deleted, _ = queryset.delete()
+
+        # 메모리 캐시는 항목별 이미지 해시를 보관하지 않으므로 전체 비움
+        with self._lock:
+            self._memory.clear()
+
+        logger.info(f"[OCR CACHE] Purged {deleted} entries (expired_only={expired_only}, image={image_sha256})")
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        """캐시 적중률 통계"""
+        with self._lock:
+            hits = self._stats['memory_hits'] + self._stats['db_hits']
+            total = hits + self._stats['misses']
+            return {
+                **self._stats,
+                'hits': hits,
+                'hit_rate': hits / total if total else 0.0,
+                'memory_entries': len(self._memory),
+            }
+
+
+# 프로세스 공용 캐시
+ocr_cache = OCRCache()
@@ -0,0 +1,251 @@
+"""
+OCR 레이아웃 (단어/줄 단위 위치 정보)
+Vision API full_text_annotation의 단어 좌표를 페이지 대비 비율(0~1)로 보관하고
+격자(grid) 공간 인덱스로 영역 조회를 지원
+테이블 처리 설정의 처리 영역(region)에 해당하는 OCR 줄만 단계별 프롬프트에 포함하기 위해 사용
+"""
+import json
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger('core')
+
+# 격자 한 변의 칸 수 (페이지를 GRID_SIZE x GRID_SIZE 칸으로 나눔)
+GRID_SIZE = 20
+
+Region = Tuple[float, float, float, float]
+
+
+def parse_region(spec: Optional[str]) -> Optional[Region]:
+    """
+    처리 영역 설정 변환
+
+    Args:
+        spec: 'x0,y0,x1,y1' (페이지 대비 비율 0~1)
+
+    Returns:
+        (x0, y0, x1, y1) 또는 None (빈 값/형식 오류)
+    """
+    spec = (spec or '').strip()
+    if not spec:
+        return None
+    try:
+        x0, y0, x1, y1 = (float(value) for value in spec.split(','))
+    except ValueError:
+        return None
+    if not (0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1):
+        return None
+    return x0, y0, x1, y1
+
+
+@dataclass
+class OCRWord:
+    text: str
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+
+    @property
+    def center(self) -> Tuple[float, float]:
+        return (self.x0 + self.x1) / 2, (self.y0 + self.y1) / 2
+
+
+@dataclass
+class OCRLine:
+    page: int
+    words: List[OCRWord] = field(default_factory=list)
+
+    @property
+    def bounds(self) -> Region:
+        return (
+            min(word.x0 for word in self.words),
+            min(word.y0 for word in self.words),
+            max(word.x1 for word in self.words),
+            max(word.y1 for word in self.words),
+        )
+
+
+class OCRLayout:
+    """페이지별 OCR 줄/단어 좌표 + 격자 공간 인덱스"""
+
+    def __init__(self, lines: List[OCRLine]):
+        self.lines = lines
+        # (페이지, 격자 x, 격자 y) -> [(줄 번호, 단어 번호)]
+        self._grid: Dict[Tuple[int, int, int], List[Tuple[int, int]]] = defaultdict(list)
+        for line_index, line in enumerate(lines):
+            for word_index, word in enumerate(line.words):
+                for cell in self._cells(line.page, (word.x0, word.y0, word.x1, word.y1)):
+                    self._grid[cell].append((line_index, word_index))
+
+    @staticmethod
+    def _cells(page: int, region: Region):
+        def to_cell(value):
+            return min(GRID_SIZE - 1, max(0, int(value * GRID_SIZE)))
+
+        x0, y0, x1, y1 = region
+        for gx in range(to_cell(x0), to_cell(x1) + 1):
+            for gy in range(to_cell(y0), to_cell(y1) + 1):
+                yield page, gx, gy
+
+    @property
+    def page_count(self) -> int:
+        return max((line.page for line in self.lines), default=-1) + 1
+
+    def query(self, region: Region, pages: Optional[List[int]] = None) -> List[OCRLine]:
+        """
+        영역 안의 단어만 남긴 줄 목록 (단어 중심점 기준, 페이지/위치 순서)
+
+        Args:
+            region: (x0, y0, x1, y1) 페이지 대비 비율
+            pages: 조회할 페이지 인덱스 (없으면 전체)
+        """
+        x0, y0, x1, y1 = region
+        target_pages = pages if pages is not None else range(self.page_count)
+
+        candidates = set()
+        for page in target_pages:
+            for cell in self._cells(page, region):
+                candidates.update(self._grid.get(cell, ()))
+
+        selected = defaultdict(list)
+        for line_index, word_index in candidates:
+            word = self.lines[line_index].words[word_index]
+            cx, cy = word.center
+            if x0 <= cx <= x1 and y0 <= cy <= y1:
+                selected[line_index].append(word_index)
+
+        result = []
+        for line_index in sorted(selected):
+            line = self.lines[line_index]
+            result.append(OCRLine(line.page, [line.words[i] for i in sorted(selected[line_index])]))
+        return result
+
+    def text_in(self, region: Region, pages: Optional[List[int]] = None) -> str:
+        """영역 안의 OCR 텍스트 (다중 페이지는 [페이지 n] 구분)"""
+        lines = self.query(region, pages)
+        multi_page = self.page_count > 1
+        parts = []
+        current_page = None
+        for line in lines:
+            if multi_page and line.page != current_page:
+                current_page = line.page
+                if parts:
+                    parts.append('')
+                parts.append(f"[페이지 {line.page + 1}]")
+            parts.append(' '.join(word.text for word in line.words))
+        return '\n'.join(parts)
+
+    def to_json(self) -> str:
+        """캐시 저장용 JSON (좌표는 소수점 4자리)"""
+        return json.dumps([
+            [line.page, [[w.text, round(w.x0, 4), round(w.y0, 4), round(w.x1, 4), round(w.y1, 4)] for w in line.words]]
+            for line in self.lines
+        ], ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data: str) -> 'OCRLayout':
+        return cls([
+            OCRLine(page, [OCRWord(*word) for word in words])
+            for page, words in json.loads(data)
+        ])
+
+    @classmethod
+    def merge(cls, layouts: List[Optional['OCRLayout']]) -> Optional['OCRLayout']:
+        """페이지별 레이아웃을 하나로 결합 (페이지 번호는 목록 순서, 하나라도 없으면 None)"""
+        if not layouts or any(layout is None for layout in layouts):
+            return None
+        lines = []
+        for page, layout in enumerate(layouts):
+            lines.extend(OCRLine(page, line.words) for line in layout.lines)
+        return cls(lines)
+
+    @classmethod
+    def from_vision(cls, annotation, page: int = 0) -> Optional['OCRLayout']:
+        """
+        Vision API full_text_annotation -> 레이아웃
+
+        줄 구분은 마지막 글자의 detected_break(줄바꿈) 기준
+        """
+        # 이미지 1장은 Vision 페이지 1개
+        if annotation is None or not annotation.pages:
+            return None
+        vision_page = annotation.pages[0]
+        width, height = vision_page.width, vision_page.height
+        if not width or not height:
+            return None
+
+        line_breaks = ('EOL_SURE_SPACE', 'LINE_BREAK')
+        lines = []
+        for block in vision_page.blocks:
+            for paragraph in block.paragraphs:
+                line = OCRLine(page)
+                for word in paragraph.words:
+                    vertices = word.bounding_box.vertices
+                    if not vertices:
+                        continue
+                    xs = [vertex.x for vertex in vertices]
+                    ys = [vertex.y for vertex in vertices]
+                    line.words.append(OCRWord(
+                        ''.join(symbol.text for symbol in word.symbols),
+                        min(xs) / width, min(ys) / height,
+                        max(xs) / width, max(ys) / height
+                    ))
+                    last_break = word.symbols[-1].property.detected_break.type_.name if word.symbols else ''
+                    if last_break in line_breaks:
+                        lines.append(line)
+                        line = OCRLine(page)
+                if line.words:
+                    lines.append(line)
+
+        return cls(lines)
+
+
+class OCRText(str):
+    """
+    OCR 텍스트 + 레이아웃
+    기존 코드에서는 일반 문자열로 사용되고, 영역 처리가 필요한 단계에서만 layout을 조회
+    (레이아웃 JSON은 처음 조회할 때 변환)
+    """
+
+    def __new__(cls, text: str, layout: Optional[OCRLayout] = None, layout_json: str = ''):
+        obj = super().__new__(cls, text)
+        obj._layout = layout
+        obj._layout_json = layout_json
+        return obj
+
+    @property
+    def layout(self) -> Optional[OCRLayout]:
+        if self._layout is None and self._layout_json:
+            try:
+                self._layout = OCRLayout.from_json(self._layout_json)
+            except Exception as e:
+                logger.warning(f"[OCR LAYOUT] Invalid layout data: {str(e)}")
+            self._layout_json = ''
+        return self._layout
+
+    @property
+    def layout_json(self) -> str:
+        if self._layout_json:
+            return self._layout_json
+        return self._layout.to_json() if self._layout is not None else ''
+
+
+def region_text(ocr_text: Optional[str], region: Optional[Region], pages: Optional[List[int]] = None) -> Optional[str]:
+    """
+    단계의 처리 영역에 해당하는 OCR 텍스트
+
+    레이아웃이 없거나 영역 안에 텍스트가 없으면 전체 OCR 텍스트 사용
+    """
+    if not ocr_text or region is None:
+        return ocr_text
+    layout = getattr(ocr_text, 'layout', None)
+    if layout is None:
+        return ocr_text
+    text = layout.text_in(region, pages)
+    if not text.strip():
+        return ocr_text
+    logger.info(f"[OCR LAYOUT] Region {region}: {len(ocr_text)} -> {len(text)} chars")
+    return text
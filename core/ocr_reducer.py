@@ -0,0 +1,136 @@
+"""
+OCR 텍스트 축소 (업무그룹 단계별)
+단계의 추출 항목명, 프롬프트, 매핑정보의 OCR 키워드(keyword_hints)와 OCR 줄을 비교하여
+관련 있는 줄과 앞뒤 문맥 줄만 단계 프롬프트에 포함
+관련 줄을 찾지 못한 항목이 많으면(신뢰도 낮음) 전체 OCR 텍스트를 그대로 사용
+"""
+import re
+import logging
+from typing import Dict, Any, List, Set, Tuple
+from django.conf import settings
+
+logger = logging.getLogger('core')
+
+_TOKEN_PATTERN = re.compile(r'[0-9a-z가-힣]+')
+
+# 프롬프트에 자주 나오지만 특정 항목을 가리키지 않는 단어
+_STOPWORDS = {
+    '추출', '입력', '항목', '값', '경우', '없는', '있는', '없으면', '형식', '이미지', '인보이스', '기재된',
+    '해당', '표시', '사용', '반드시', '숫자', '날짜', '문자', '코드',
+    'the', 'and', 'for', 'of', 'to', 'in', 'is', 'no', 'invoice',
+}
+
+# 가중치: 키워드 > 항목명 > 프롬프트
+_HINT_WEIGHT = 3
+_FIELD_WEIGHT = 2
+_PROMPT_WEIGHT = 1
+
+
+def is_enabled() -> bool:
+    """OCR 텍스트 축소 사용 여부"""
+    return getattr(settings, 'OCR_REDUCER_ENABLED', False)
+
+
+def estimate_tokens(text: str) -> int:
+    """토큰 수 대략 추정 (로그용)"""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def _tokens(text: str) -> Set[str]:
+    return {
+        token for token in _TOKEN_PATTERN.findall((text or '').lower())
+        if len(token) >= 2 and token not in _STOPWORDS
+    }
+
+
+def _field_terms(mapping: Dict[str, Any]) -> Tuple[List[str], Dict[str, int]]:
+    """
+    항목별 검색어
+
+    Returns:
+        (키워드 구문 목록 - 부분 문자열 비교, 단어별 가중치)
+    """
+    phrases = [hint.strip().lower() for hint in (mapping.get('keyword_hints') or '').split(',') if hint.strip()]
+
+    weights = {}
+    for source, weight in (
+        (mapping.get('basic_prompt'), _PROMPT_WEIGHT),
+        (mapping.get('additional_prompt'), _PROMPT_WEIGHT),
+        (mapping.get('unipass_field_name'), _FIELD_WEIGHT),
+    ):
+        for token in _tokens(source):
+            weights[token] = max(weights.get(token, 0), weight)
+    return phrases, weights
+
+
+def _score_line(line: str, line_tokens: Set[str], phrases: List[str], weights: Dict[str, int]) -> int:
+    score = sum(_HINT_WEIGHT for phrase in phrases if phrase in line)
+    score += sum(weight for token, weight in weights.items() if token in line_tokens)
+    return score
+
+
+def reduce_ocr_text(ocr_text: str, mappings: List[Dict[str, Any]], step_label: str = '') -> str:
+    """
+    단계의 추출 항목과 관련 있는 OCR 줄만 남김
+
+    Args:
+        ocr_text: 전체(또는 처리 영역) OCR 텍스트
+        mappings: 단계의 매핑 정보 목록
+        step_label: 로그용 단계 이름
+
+    Returns:
+        축소된 OCR 텍스트 (비활성화/짧은 텍스트/신뢰도 낮음이면 원래 텍스트)
+    """
+    if not ocr_text or not is_enabled():
+        return ocr_text
+    if len(ocr_text) < getattr(settings, 'OCR_REDUCER_MIN_CHARS', 2000):
+        return ocr_text
+
+    lines = ocr_text.split('\n')
+    lowered = [line.lower() for line in lines]
+    line_tokens = [_tokens(line) for line in lowered]
+    min_score = getattr(settings, 'OCR_REDUCER_MIN_SCORE', 2)
+
+    keep = set()
+    matched_fields = 0
+    for mapping in mappings:
+        phrases, weights = _field_terms(mapping)
+        matched = False
+        for index, line in enumerate(lowered):
+            if _score_line(line, line_tokens[index], phrases, weights) >= min_score:
+                keep.add(index)
+                matched = True
+        matched_fields += matched
+
+    # 신뢰도: 관련 줄을 찾은 항목 비율
+    coverage = matched_fields / len(mappings) if mappings else 0.0
+    if coverage < getattr(settings, 'OCR_REDUCER_MIN_COVERAGE', 0.5):
+        logger.info(f"[OCR REDUCER] {step_label}: low confidence ({matched_fields}/{len(mappings)} fields), using full text")
+        return ocr_text
+
+    # 앞뒤 문맥 줄 포함 (표의 헤더/값이 다음 줄에 있는 경우)
+    context = getattr(settings, 'OCR_REDUCER_CONTEXT_LINES', 2)
+    selected = set()
+    for index in keep:
+        selected.update(range(max(0, index - context), min(len(lines), index + context + 1)))
+
+    # 생략된 구간은 '...'으로 표시
+    parts = []
+    previous = -1
+    for index in sorted(selected):
+        if index != previous + 1:
+            parts.append('...')
+        parts.append(lines[index])
+        previous = index
+    if previous != len(lines) - 1:
+        parts.append('...')
+    reduced = '\n'.join(parts)
+
+    if len(reduced) >= len(ocr_text) * getattr(settings, 'OCR_REDUCER_MAX_RATIO', 0.8):
+        return ocr_text
+
+    saved_chars = len(ocr_text) - len(reduced)
+    logger.info(f"[OCR REDUCER] {step_label}: {len(ocr_text):,} -> {len(reduced):,} chars "
+                f"(saved {saved_chars:,} chars, ~{estimate_tokens(ocr_text) - estimate_tokens(reduced):,} tokens, "
+                f"{len(selected)}/{len(lines)} lines, {matched_fields}/{len(mappings)} fields)")
+    return reduced
@@ -0,0 +1,196 @@
+"""
+캐시 친화적 프롬프트 구성 (PROMPT_LAYOUT = 'cache_friendly')
+한 인보이스의 모든 단계에서 동일한 부분(지시문, 응답 형식, 문서 정보, OCR 텍스트, 이미지)을
+앞쪽에 바이트 단위로 동일하게 배치하고, 단계마다 달라지는 부분(단계 번호, 이전 단계 결과,
+추출 항목)을 마지막에 배치하여 AI 제공자의 프롬프트 접두사 캐시를 활용
+"""
+from typing import Dict, Any, Optional
+from django.conf import settings
+
+
+def use_cache_friendly_layout() -> bool:
+    """캐시 친화적 프롬프트 구성 사용 여부"""
+    return getattr(settings, 'PROMPT_LAYOUT', 'legacy') == 'cache_friendly'
+
+
+def build_static_instructions(ai_metadata: Optional[str], missing_value_rule: str) -> str:
+    """
+    모든 단계에서 동일한 지시문 (단계 정보 미포함)
+
+    Args:
+        ai_metadata: AI 메타데이터 (문서 정보)
+        missing_value_rule: 값을 찾을 수 없는 경우의 규칙 (엔진별 기존 규칙 유지)
+    """
+    prompt = "당신은 인보이스(Invoice) 데이터를 분석하고 구조화하는 전문가입니다.\n\n"
+
+    prompt += "이 작업은 여러 단계로 나뉘어 처리됩니다. 각 단계에서는 요청의 마지막 부분에 지정된 항목만 추출하면 됩니다.\n\n"
+
+    prompt += "=== 중요: 첨부된 이미지를 우선적으로 분석하세요 ===\n"
+    prompt += "이 요청에는 인보이스 이미지가 첨부되어 있습니다. 반드시 이미지를 직접 확인하여 정확한 정보를 추출하세요.\n\n"
+
+    prompt += f"""[응답 형식]
+반드시 다음 형식의 JSON으로 응답해주세요.
+**중요**: JSON의 키는 [이번 단계에서 추출할 항목 및 규칙]에 제시된 한글 항목명(유니패스 필드명)을 그대로 사용해야 합니다.
+**주의**: 이번 단계에서 요청한 항목만 JSON에 포함하세요. 이전 단계 데이터는 포함하지 마세요.
+
+```json
+{{
+  "항목명1": "추출된_값1",
+  "항목명2": "추출된_값2",
+  ...
+}}
+```
+
+예시:
+```json
+{{
+  "판매자명": "N.S TRADING",
+  "송장일자": "2025-05-22",
+  "차대번호": "KMHDU41BP7U253602"
+}}
+```
+
+주의사항:
+1. **반드시 첨부된 이미지를 직접 분석**하여 정확한 정보를 추출하세요.
+2. OCR 텍스트는 참고용이며, 이미지가 우선입니다.
+3. 이전 단계 데이터는 참고만 하고, 현재 단계 항목만 추출하세요.
+4. {missing_value_rule}
+5. 날짜는 YYYY-MM-DD 형식으로 변환하세요.
+6. 숫자는 천단위 구분자 없이 숫자만 추출하세요.
+7. JSON 키는 제시된 한글 항목명을 정확히 사용하세요.
+8. 반드시 JSON 형식으로만 응답하세요.
+9. 각 항목별로 제시된 규칙을 준수하세요.
+
+"""
+
+    # AI 메타데이터 (신고서 단위로 고정)
+    if ai_metadata:
+        prompt += f"[문서 정보]\n{ai_metadata}\n\n"
+
+    return prompt
+
+
+def build_ocr_block(ocr_text: Optional[str]) -> str:
+    """OCR 텍스트 (인보이스 단위로 고정, OCR이 필요 없는 단계는 빈 문자열)"""
+    if not ocr_text:
+        return ""
+    prompt = "[OCR 추출 텍스트 - 참고용]\n"
+    prompt += "다음은 OCR로 추출한 텍스트입니다. 참고용으로만 사용하고, 반드시 이미지를 직접 확인하여 정확한 값을 추출하세요:\n\n"
+    prompt += f"{ocr_text}\n\n"
+    return prompt
+
+
+def build_step_block(mapping_info: list, previous_results: dict, step_num: int, total_steps: int) -> str:
+    """단계마다 달라지는 부분 (단계 번호, 이전 단계 결과, 테이블 가이드, 추출 항목)"""
+    prompt = f"=== 현재 단계: {step_num}/{total_steps} ===\n\n"
+
+    # 이전 단계 결과가 있으면 포함
+    if previous_results:
+        prompt += "[이전 단계에서 추출된 데이터]\n"
+        prompt += "참고: 아래는 이전 단계에서 이미 추출된 데이터입니다. 이 정보를 참고하여 현재 단계의 데이터를 추출하세요.\n\n"
+        if isinstance(previous_results, dict):
+            for key, value in previous_results.items():
+                prompt += f"  - {key}: {value}\n"
+        else:
+            prompt += f"{previous_results}\n"
+        prompt += "\n"
+
+    # 테이블 정보 추출 (테이블명과 table_prompt)
+    table_info = {}
+    for mapping in mapping_info:
+        table_name = mapping.get('db_table_name')
+        if table_name and table_name not in table_info:
+            table_info[table_name] = mapping.get('table_prompt')
+
+    if any(table_info.values()):
+        prompt += "[테이블별 추출 가이드]\n"
+        for table_name, table_prompt in table_info.items():
+            if table_prompt:
+                prompt += f"\n<{table_name} 테이블>\n{table_prompt}\n"
+        prompt += "\n"
+
+    # 추출할 항목 및 규칙
+    prompt += "[이번 단계에서 추출할 항목 및 규칙]\n"
+    prompt += "다음 항목들의 데이터를 이미지에서 찾아 위 규칙에 따라 추출해주세요:\n\n"
+
+    for mapping in mapping_info:
+        prompt += f"• {mapping['unipass_field_name']}\n"
+
+        if mapping.get('basic_prompt'):
+            prompt += f"  - {mapping['basic_prompt']}\n"
+
+        if mapping.get('additional_prompt'):
+            prompt += f"  - {mapping['additional_prompt']}\n"
+
+        prompt += "\n"
+
+    return prompt
+
+
+def _usage(prompt_tokens, cached_tokens, completion_tokens) -> Dict[str, int]:
+    prompt_tokens = prompt_tokens or 0
+    cached_tokens = cached_tokens or 0
+    return {
+        'prompt_tokens': prompt_tokens,
+        'cached_tokens': cached_tokens,
+        'uncached_tokens': max(0, prompt_tokens - cached_tokens),
+        'completion_tokens': completion_tokens or 0,
+    }
+
+
+def extract_openai_usage(response) -> Optional[Dict[str, int]]:
+    """OpenAI 응답의 토큰 사용량 (usage.prompt_tokens_details.cached_tokens)"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return None
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return _usage(
+        getattr(usage, 'prompt_tokens', 0),
+        getattr(details, 'cached_tokens', 0) if details is not None else 0,
+        getattr(usage, 'completion_tokens', 0)
+    )
+
+
+def extract_gemini_usage(response) -> Optional[Dict[str, int]]:
+    """Gemini 응답의 토큰 사용량 (usage_metadata.cached_content_token_count)"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return None
+    return _usage(
+        getattr(usage, 'prompt_token_count', 0),
+        getattr(usage, 'cached_content_token_count', 0),
+        getattr(usage, 'candidates_token_count', 0)
+    )
+
+
+def is_gemini_truncated(response) -> bool:
+    """Gemini 응답이 출력 토큰 상한에 걸려 잘렸는지 여부"""
+    candidates = getattr(response, 'candidates', None)
+    if not candidates:
+        return False
+    finish_reason = getattr(candidates[0], 'finish_reason', None)
+    return getattr(finish_reason, 'name', str(finish_reason)) == 'MAX_TOKENS'
+
+
+def merge_call_usage(usages) -> Dict[str, Any]:
+    """한 단계에서 여러 번 호출한 경우(행 범위 분할) 토큰 사용량/지연 시간 합계"""
+    usages = [usage for usage in usages if usage]
+    if len(usages) == 1:
+        return usages[0]
+    total = {}
+    for usage in usages:
+        for key, value in usage.items():
+            total[key] = total.get(key, 0) + value
+    total['calls'] = len(usages)
+    return total
+
+
+def sum_usage(usages) -> Dict[str, Any]:
+    """단계별 토큰 사용량 합계 (캐시 적중 비율 포함)"""
+    total = {'prompt_tokens': 0, 'cached_tokens': 0, 'uncached_tokens': 0, 'completion_tokens': 0}
+    for usage in usages:
+        if usage:
+            for key in total:
+                total[key] += usage.get(key, 0)
+    total['cached_ratio'] = total['cached_tokens'] / total['prompt_tokens'] if total['prompt_tokens'] else 0.0
+    return total
@@ -0,0 +1,115 @@
+"""
+API 요청 지연 시간 측정 (RequestTimingMiddleware)
+- 요청별 DB 쿼리 수/시간과 처리 단계별 시간(OCR, AI 등)을 모아 Server-Timing 헤더로 반환
+- 느린 요청(SLOW_REQUEST_THRESHOLD_MS 이상)은 단계별 시간과 함께 최근 N건을 보관 (프로세스별)
+- 최근 요청 지연 시간으로 p50/p95/p99 계산
+"""
+import time
+import threading
+import contextvars
+from collections import deque
+from typing import Dict, Any, List, Optional
+from django.conf import settings
+from .metrics import TIMED_STAGES
+
+# Server-Timing 항목 이름 (요청 전체 시간 total, DB 쿼리 db와 겹치는 처리 단계 이름 변경 / 처리 로그 저장은 db 쿼리에 포함)
+_STAGE_NAMES = {'total': 'process', 'db': None}
+
+# 현재 요청의 처리 단계별 시간 (워커 스레드에서도 같은 dict에 누적, contextvars.copy_context로 전달)
+request_stages_var = contextvars.ContextVar('request_stages', default=None)
+_stages_lock = threading.Lock()
+
+
+def record_stages(timings: Dict[str, Any]):
+    """InvoiceProcessor 처리 결과의 단계별 시간을 현재 요청에 누적 (배치는 인보이스별 합산)"""
+    stages = request_stages_var.get()
+    if stages is None or not timings:
+        return
+    with _stages_lock:
+        for stage in TIMED_STAGES:
+            name = _STAGE_NAMES.get(stage, stage)
+            value = timings.get(stage)
+            if name and value is not None:
+                stages[name] = stages.get(name, 0.0) + value
+
+
+class QueryTimer:
+    """connection.execute_wrapper용 쿼리 수/시간 집계 (요청 스레드의 DB 연결만 측정)"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+def server_timing_header(total: float, db: QueryTimer, stages: Dict[str, float]) -> str:
+    """Server-Timing 헤더 값 (ms)"""
+    entries = [
+        f"total;dur={total * 1000:.1f}",
+        f'db;dur={db.seconds * 1000:.1f};desc="{db.count} queries"',
+    ]
+    entries.extend(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages.items())
+    return ', '.join(entries)
+
+
+def _percentile(sorted_values: List[float], percent: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class SlowRequestLog:
+    """느린 요청 링 버퍼 + 최근 요청 지연 시간 (프로세스별)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slow = deque(maxlen=getattr(settings, 'SLOW_REQUEST_BUFFER_SIZE', 100))
+        self._recent = deque(maxlen=getattr(settings, 'REQUEST_TIMING_SAMPLE_SIZE', 1000))
+        self.total_requests = 0
+
+    @property
+    def threshold(self) -> float:
+        return getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 1000) / 1000
+
+    def add(self, entry: Dict[str, Any]):
+        with self._lock:
+            self.total_requests += 1
+            self._recent.append(entry['duration'])
+            if entry['duration'] >= self.threshold:
+                self._slow.append(entry)
+
+    def snapshot(self, limit: int = None) -> Dict[str, Any]:
+        """느린 요청 (느린 순) 및 최근 요청 지연 시간 분포"""
+        with self._lock:
+            slow = sorted(self._slow, key=lambda entry: entry['duration'], reverse=True)
+            recent = sorted(self._recent)
+            total_requests = self.total_requests
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'total_requests': total_requests,
+            'recent': {
+                'count': len(recent),
+                'p50': _percentile(recent, 50),
+                'p95': _percentile(recent, 95),
+                'p99': _percentile(recent, 99),
+                'max': recent[-1] if recent else None,
+            },
+            'slow_requests': slow[:limit] if limit else slow,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._slow.clear()
+            self._recent.clear()
+            self.total_requests = 0
+
+
+slow_requests = SlowRequestLog()
@@ -0,0 +1,219 @@
+"""
+동일 인보이스 처리 요청 합치기 (single-flight)
+클라이언트 타임아웃 후 재시도 등으로 처리 중인 요청과 같은 요청이 다시 들어오면
+OCR/AI 처리를 새로 시작하지 않고 진행 중인 처리의 결과를 함께 반환
+- 요청 키: 이미지 SHA-256 + 서비스 사용자 + 신고서 + AI 엔진 + HS 코드 처리 순서 + 설정 버전
+- 같은 워커 프로세스: 진행 중인 처리의 Future에 합류
+- 다른 워커 프로세스: InvoiceProcessLease 행(요청 키가 PK)으로 처리 중인 처리 로그를 찾아 완료될 때까지 상태 확인
+- 처리 중에는 SINGLE_FLIGHT_HEARTBEAT_SECONDS마다 임대 만료 시각을 갱신하고, 대기 요청은 임대가 유효한 동안 계속 대기
+- 임대는 처리가 끝나면 삭제, 워커가 비정상 종료하면 갱신이 멈춰 SINGLE_FLIGHT_LEASE_SECONDS 후 다음 요청이 인수
+"""
+import os
+import time
+import socket
+import hashlib
+import threading
+import logging
+from concurrent.futures import Future
+from datetime import timedelta
+from typing import Callable, Dict, Any, Optional, Tuple
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from .models import InvoiceProcessLog, InvoiceProcessLease
+from .metrics import coalesced_total
+
+logger = logging.getLogger('core')
+
+_DONE_STATUSES = ('completed', 'failed')
+
+# 합쳐진 요청이 받는 처리 결과 항목 - 다른 워커의 결과는 처리 로그에 저장된 항목만 복원할 수 있으므로
+# 같은 프로세스에서 합쳐진 경우에도 같은 항목만 반환 (timings, usage, steps 등은 원래 요청 응답에만 포함)
+SHARED_FIELDS = ('success', 'result_json', 'ocr_text', 'processing_time', 'error')
+
+# (처리 로그 ID, 처리 결과, 합쳐진 요청 여부)
+Outcome = Tuple[int, Dict[str, Any], bool]
+
+
+def upload_sha256(file) -> str:
+    """업로드 파일 SHA-256 (업로드 중 계산된 값 사용, 없으면 계산 후 보관하여 이미지 저장 시 재사용)"""
+    sha256 = getattr(file, 'sha256', None)
+    if sha256 is None:
+        digest = hashlib.sha256()
+        for chunk in file.chunks():
+            digest.update(chunk)
+        sha256 = file.sha256 = digest.hexdigest()
+    return sha256
+
+
+def request_key(image_sha256: str, service_user_id: int, declaration_id: int,
+                ai_engine: str, hs_code_process_order: Optional[int], config_version: int) -> str:
+    """동일 요청 판단 키"""
+    raw = '|'.join(str(part) for part in (
+        image_sha256, service_user_id, declaration_id, ai_engine, hs_code_process_order, config_version
+    ))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _shared_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """같은 프로세스의 처리 결과 -> 합쳐진 요청용 항목 (SHARED_FIELDS)"""
+    return {field: result.get(field) for field in SHARED_FIELDS}
+
+
+def _stored_result(process_log: InvoiceProcessLog) -> Dict[str, Any]:
+    """다른 워커가 저장한 처리 결과 (처리 로그 + 본문) -> 합쳐진 요청용 항목 (SHARED_FIELDS)"""
+    payload = process_log.load_payload()
+    return {
+        'success': process_log.status == 'completed',
+        'result_json': payload['result_json'],
+        'ocr_text': payload['ocr_text'],
+        'processing_time': process_log.processing_time,
+        'error': process_log.error_message,
+    }
+
+
+class SingleFlight:
+    """요청 키별로 한 번만 처리하고 같은 키의 동시 요청은 결과를 공유"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Future] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(settings, 'SINGLE_FLIGHT_ENABLED', True)
+
+    @property
+    def owner(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _expires_at(self):
+        return timezone.now() + timedelta(seconds=getattr(settings, 'SINGLE_FLIGHT_LEASE_SECONDS', 120))
+
+    def run(
+        self,
+        key: str,
+        start: Callable[[], InvoiceProcessLog],
+        process: Callable[[InvoiceProcessLog], Dict[str, Any]]
+    ) -> Outcome:
+        """
+        요청 처리 (같은 키가 처리 중이면 그 결과에 합류)
+
+        Args:
+            key: 요청 키 (request_key)
+            start: 처리 로그 생성 - 직접 처리하는 경우에만 호출
+            process: 처리 실행 -> 처리 결과 - 직접 처리하는 경우에만 호출
+
+        Returns:
+            (처리 로그 ID, 처리 결과, 합쳐진 요청 여부)
+        """
+        if not self.enabled:
+            process_log = start()
+            return process_log.id, process(process_log), False
+
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+
+        if not leader:
+            # 프로세스 내 첫 요청이 끝날 때까지 대기 (처리 중에는 그 요청이 임대를 갱신)
+            log_id, result, _ = future.result()
+            coalesced_total.inc(scope='local')
+            logger.info(f"[SINGLE FLIGHT] 처리 중인 동일 요청에 합류: {key[:12]} (log_id={log_id})")
+            return log_id, _shared_result(result), True
+
+        try:
+            outcome = self._lead(key, start, process)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(outcome)
+            return outcome
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def _lead(self, key, start, process) -> Outcome:
+        """프로세스 내 첫 요청: 임대를 얻으면 직접 처리, 다른 워커가 처리 중이면 그 결과 대기"""
+        while not self._acquire_lease(key):
+            outcome = self._wait_remote(key)
+            if outcome is not None:
+                coalesced_total.inc(scope='remote')
+                logger.info(f"[SINGLE FLIGHT] 다른 워커의 동일 요청 결과 사용: {key[:12]} (log_id={outcome[0]})")
+                return outcome
+            # 임대가 없어졌거나 만료됨 (처리 로그 생성 전 실패, 워커 비정상 종료) -> 다시 임대 시도
+
+        owner = self.owner
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(key, owner, stop), name='single-flight-heartbeat', daemon=True
+        )
+        heartbeat.start()
+        try:
+            process_log = start()
+            InvoiceProcessLease.objects.filter(key=key, owner=owner).update(process_log=process_log)
+            return process_log.id, process(process_log), False
+        finally:
+            stop.set()
+            heartbeat.join()
+            InvoiceProcessLease.objects.filter(key=key, owner=owner).delete()
+
+    def _heartbeat(self, key: str, owner: str, stop: threading.Event):
+        """처리하는 동안 임대 만료 시각 갱신 (처리가 임대 시간보다 길어져도 다른 워커가 인수하지 않도록)"""
+        interval = getattr(settings, 'SINGLE_FLIGHT_HEARTBEAT_SECONDS', 30)
+        try:
+            while not stop.wait(interval):
+                try:
+                    renewed = InvoiceProcessLease.objects.filter(key=key, owner=owner).update(
+                        expires_at=self._expires_at()
+                    )
+                except Exception as e:
+                    logger.warning(f"[SINGLE FLIGHT] 임대 갱신 실패: {key[:12]} - {str(e)}")
+                    continue
+                if not renewed:
+                    logger.warning(f"[SINGLE FLIGHT] 임대가 만료되어 다른 요청이 인수함: {key[:12]}")
+                    return
+        finally:
+            connection.close()
+
+    def _acquire_lease(self, key: str) -> bool:
+        now = timezone.now()
+        expires_at = self._expires_at()
+        try:
+            with transaction.atomic():
+                InvoiceProcessLease.objects.create(key=key, owner=self.owner, expires_at=expires_at)
+            return True
+        except IntegrityError:
+            # 만료된 임대는 인수
+            return InvoiceProcessLease.objects.filter(key=key, expires_at__lte=now).update(
+                owner=self.owner, expires_at=expires_at, process_log=None
+            ) == 1
+
+    def _wait_remote(self, key: str) -> Optional[Outcome]:
+        """다른 워커의 처리 완료 대기 - 처리 중인 워커가 임대를 갱신하는 동안 계속 대기 (임대가 없어지거나 만료되면 None)"""
+        poll = getattr(settings, 'SINGLE_FLIGHT_POLL_SECONDS', 0.5)
+        log_id = None
+        while True:
+            lease = InvoiceProcessLease.objects.filter(key=key).values('process_log_id', 'expires_at').first()
+            if lease is not None:
+                if lease['expires_at'] <= timezone.now():
+                    return None
+                log_id = lease['process_log_id'] or log_id
+
+            # 처리 로그는 임대 삭제 전에 완료 상태로 저장됨
+            if log_id is not None:
+                process_log = InvoiceProcessLog.objects.filter(pk=log_id).only(
+                    'id', 'status', 'error_message', 'processing_time'
+                ).first()
+                if process_log is not None and process_log.status in _DONE_STATUSES:
+                    return log_id, _stored_result(process_log), True
+
+            if lease is None:
+                return None
+            time.sleep(poll)
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,212 @@
+"""
+업무그룹 단계 실행 스케줄러
+TableProcessConfig.depends_on(선행 업무그룹)을 기준으로 단계 간 의존 관계를 구성하고,
+서로 의존하지 않는 단계는 제한된 스레드 풀에서 동시에 실행
+결과는 항상 처리 순서(process_order)대로 병합
+"""
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Callable, Iterable, List, Tuple
+from django.conf import settings
+from .structured_logging import log_payload
+
+logger = logging.getLogger('core')
+
+
+def group_mappings_by_order(mapping_info: list) -> Tuple[List[int], Dict[int, list]]:
+    """
+    처리 순서별로 매핑 정보 그룹화
+
+    Returns:
+        (정렬된 처리 순서 목록, 처리 순서별 매핑 목록)
+    """
+    ordered_mappings = {}
+    unordered_mappings = []
+
+    for mapping in mapping_info:
+        order = mapping.get('process_order')
+        # process_order가 None이거나 0인 경우 미설정으로 간주
+        if order is None or order == 0:
+            unordered_mappings.append(mapping)
+        else:
+            if order not in ordered_mappings:
+                ordered_mappings[order] = []
+            ordered_mappings[order].append(mapping)
+
+    # 처리 순서 정렬
+    sorted_orders = sorted(ordered_mappings.keys())
+
+    # 미설정 매핑이 있으면 가장 마지막에 추가 (이전 단계 전체에 의존)
+    if unordered_mappings:
+        last_order = max(sorted_orders) + 1 if sorted_orders else 1
+        for m in unordered_mappings:
+            if not m.get('work_group'):
+                m['work_group'] = '미설정 항목'
+            m['depends_on'] = None
+        ordered_mappings[last_order] = unordered_mappings
+        sorted_orders.append(last_order)
+
+    return sorted_orders, ordered_mappings
+
+
+def build_step_dependencies(sorted_orders: List[int], grouped_mappings: Dict[int, list]) -> Dict[int, Tuple[int, ...]]:
+    """
+    단계별 선행 단계(처리 순서) 구성
+
+    - depends_on이 None: 이전 단계 전체에 의존 (기존 순차 처리와 동일)
+    - depends_on이 목록: 해당 업무그룹 중 처리 순서가 더 빠른 단계에만 의존
+    """
+    order_by_work_group = {}
+    for order in sorted_orders:
+        work_group = grouped_mappings[order][0].get('work_group')
+        if work_group:
+            order_by_work_group.setdefault(work_group, order)
+
+    dependencies = {}
+    for index, order in enumerate(sorted_orders):
+        depends_on = grouped_mappings[order][0].get('depends_on')
+        if depends_on is None:
+            dependencies[order] = tuple(sorted_orders[:index])
+            continue
+
+        deps = []
+        for work_group in depends_on:
+            dep_order = order_by_work_group.get(work_group)
+            if dep_order is None or dep_order >= order:
+                # 존재하지 않거나 이후 단계인 업무그룹은 무시 (순환 방지)
+                logger.warning(f"[STEP SCHEDULER] Ignoring dependency '{work_group}' of order {order}")
+                continue
+            deps.append(dep_order)
+        dependencies[order] = tuple(sorted(set(deps)))
+
+    return dependencies
+
+
+def collect_dependency_orders(order: int, dependencies: Dict[int, Tuple[int, ...]]) -> List[int]:
+    """선행 단계 전체(간접 의존 포함)를 처리 순서대로 반환"""
+    collected = set()
+    stack = list(dependencies.get(order, ()))
+    while stack:
+        dep = stack.pop()
+        if dep not in collected:
+            collected.add(dep)
+            stack.extend(dependencies.get(dep, ()))
+    return sorted(collected)
+
+
+def merge_step_results(results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """단계 결과를 순서대로 병합 (나중 단계가 같은 키를 덮어씀)"""
+    merged = {}
+    for result in results:
+        if result:
+            merged.update(result)
+    return merged
+
+
+def to_step_result(step_result_korean, current_mappings: list, order: int) -> Dict[str, Any]:
+    """AI 응답 JSON을 단계 결과(dict)로 변환"""
+    step_result = {}
+    if isinstance(step_result_korean, dict):
+        step_result.update(step_result_korean)
+    elif isinstance(step_result_korean, list):
+        # 리스트인 경우 테이블명을 키로 저장 (이전 결과 보존)
+        db_table_name = current_mappings[0].get('db_table_name', f'items_step_{order}')
+        step_result[db_table_name] = step_result_korean
+    return step_result
+
+
+def merge_hs_codes(step_result: Dict[str, Any], hs_codes, target_table: str):
+    """HS 코드 추천 결과를 현재 단계 결과에 병합 (한글 키 기준)"""
+    logger.debug(f"[HS CODE] Merge {type(hs_codes).__name__} into {target_table}")
+
+    if isinstance(hs_codes, dict):
+        # HS 코드를 현재 테이블의 데이터에 병합
+        if target_table and target_table in step_result:
+            table_data = step_result[target_table]
+
+            if isinstance(table_data, list):
+                # 리스트인 경우: 각 항목에 HS 코드 추가
+                for item in table_data:
+                    if isinstance(item, dict):
+                        item.update(hs_codes)
+                logger.debug(f"[HS CODE] Merged HS codes into list items of {target_table}")
+            elif isinstance(table_data, dict):
+                # 딕셔너리인 경우: 직접 병합
+                table_data.update(hs_codes)
+                logger.debug(f"[HS CODE] Merged HS codes into dict of {target_table}")
+        else:
+            # 테이블이 없으면 최상위에 추가
+            step_result.update(hs_codes)
+            logger.debug(f"[HS CODE] Merged HS codes at top level (table not found)")
+    elif isinstance(hs_codes, list):
+        step_result['hs'] = hs_codes
+        logger.debug(f"[HS CODE] Merged as list with key 'hs'")
+
+    log_payload(logger, "[HS CODE] step_result after merge", step_result)
+
+
+def run_steps(
+    sorted_orders: List[int],
+    dependencies: Dict[int, Tuple[int, ...]],
+    run_step: Callable[[int, int, Dict[str, Any]], Dict[str, Any]],
+    max_workers: int = None
+) -> Dict[int, Dict[str, Any]]:
+    """
+    의존 관계에 따라 단계 실행
+
+    Args:
+        sorted_orders: 정렬된 처리 순서 목록
+        dependencies: 단계별 선행 단계
+        run_step: 단계 실행 함수 (step_num, order, previous_results) -> 단계 결과
+        max_workers: 동시 실행 단계 수 (기본값: STEP_EXECUTOR_MAX_WORKERS)
+
+    Returns:
+        처리 순서별 단계 결과
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'STEP_EXECUTOR_MAX_WORKERS', 4)
+
+    step_numbers = {order: step_num for step_num, order in enumerate(sorted_orders, 1)}
+    step_results = {}
+    pending = list(sorted_orders)
+    running = {}
+
+    def previous_results_for(order):
+        return merge_step_results(
+            step_results[dep] for dep in collect_dependency_orders(order, dependencies)
+        )
+
+    # 단일 작업자이거나 단계가 하나뿐이면 스레드 없이 순차 실행
+    if max_workers <= 1 or len(sorted_orders) <= 1:
+        for order in sorted_orders:
+            step_results[order] = run_step(step_numbers[order], order, previous_results_for(order))
+        return step_results
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='invoice-step') as executor:
+        try:
+            while pending or running:
+                # 선행 단계가 모두 끝난 단계 실행
+                for order in list(pending):
+                    if all(dep in step_results for dep in dependencies.get(order, ())):
+                        pending.remove(order)
+                        # 요청 ID/디버그 추적 컨텍스트를 단계 스레드로 전달
+                        running[executor.submit(
+                            contextvars.copy_context().run,
+                            run_step, step_numbers[order], order, previous_results_for(order)
+                        )] = order
+
+                if not running:
+                    # 의존 관계를 만족할 수 없는 단계 (발생하지 않아야 함)
+                    raise Exception(f"단계 의존 관계를 해결할 수 없습니다: {pending}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    order = running.pop(future)
+                    step_results[order] = future.result()
+        except Exception:
+            for future in running:
+                future.cancel()
+            raise
+
+    return step_results
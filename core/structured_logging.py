@@ -0,0 +1,117 @@
+"""
+구조화 로깅 (JSON 한 줄, 비동기 파일 기록)
+- 요청 스레드는 큐에 넣기만 하고 파일 기록/JSON 직렬화는 별도 스레드(QueueListener)에서 처리
+- 파일은 크기 기준으로 교체 (RotatingFileHandler)
+- 메시지는 LOG_MAX_MESSAGE_CHARS로 잘라서 기록
+- 프롬프트/OCR/응답 본문은 요청별 디버그 추적(관리자/스태프의 X-Debug-Trace 헤더)이 켜진 경우에만 전체 기록 (log_payload)
+"""
+import json
+import queue
+import atexit
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+from django.conf import settings
+
+# 요청 단위 컨텍스트 (워커 스레드로 넘길 때는 contextvars.copy_context().run 사용)
+request_id_var = contextvars.ContextVar('request_id', default=None)
+debug_trace_var = contextvars.ContextVar('debug_trace', default=False)
+
+
+def is_tracing() -> bool:
+    """현재 요청의 디버그 추적 여부"""
+    return debug_trace_var.get() or getattr(settings, 'LOG_DEBUG_TRACE', 'off') == 'all'
+
+
+def truncate(text: str, limit: int) -> str:
+    """limit자 초과 시 앞부분만 남기고 잘린 길이 표시 (limit <= 0이면 자르지 않음)"""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}...[truncated {len(text) - limit:,} chars]"
+
+
+def log_payload(logger: logging.Logger, label: str, payload):
+    """
+    프롬프트/OCR 텍스트/응답 등 큰 본문 로깅
+    디버그 추적 중이면 전체 본문, 아니면 길이와 LOG_PAYLOAD_PREVIEW_CHARS 만큼의 앞부분만 기록
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str)
+    if is_tracing():
+        logger.info(f"{label} ({len(text):,} chars):\n{text}", extra={'payload': True})
+        return
+    preview = getattr(settings, 'LOG_PAYLOAD_PREVIEW_CHARS', 200)
+    if preview > 0:
+        logger.info(f"{label} ({len(text):,} chars): {truncate(text, preview)}")
+    else:
+        logger.info(f"{label} ({len(text):,} chars)")
+
+
+def mask_authorization(value: Optional[str]) -> str:
+    """Authorization 헤더 마스킹 (인증 방식과 토큰 앞 4자리만 남김)"""
+    if not value:
+        return 'NOT PROVIDED'
+    scheme, _, credentials = value.partition(' ')
+    if not credentials:
+        return '***'
+    return f"{scheme} {credentials[:4]}***"
+
+
+class JsonFormatter(logging.Formatter):
+    """로그 레코드를 JSON 한 줄로 변환"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'thread': record.threadName,
+            'message': record.getMessage().strip(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class QueuedRotatingFileHandler(QueueHandler):
+    """
+    큐 기반 비동기 파일 핸들러 (LOGGING 설정에서 사용)
+    큐가 가득 차면 요청 스레드를 막지 않고 레코드를 버림 (dropped 개수 유지)
+    """
+
+    def __init__(self, filename, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                 queue_size: int = 10000, encoding: str = 'utf-8'):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.dropped = 0
+        file_handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        file_handler.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, file_handler, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 메시지 확정 및 길이 제한은 호출 스레드에서, JSON 직렬화/파일 기록은 리스너 스레드에서
+        record = logging.makeLogRecord(record.__dict__)
+        limit = getattr(settings, 'LOG_TRACE_MAX_CHARS' if getattr(record, 'payload', False) else 'LOG_MAX_MESSAGE_CHARS', 0)
+        record.msg = truncate(record.getMessage(), limit)
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if not hasattr(record, 'request_id'):
+            record.request_id = request_id_var.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
@@ -0,0 +1,247 @@
+"""
+단계별 토큰 예산
+AI 호출 전에 프롬프트 토큰 수를 계산하여 예산(PROMPT_TOKEN_BUDGET)을 넘으면
+이전 단계 결과 -> OCR 텍스트 순서로 줄이고, 응답 토큰 상한(max_tokens)은 예상 출력 크기로 결정
+응답이 상한에 걸려 잘린 경우(품목이 많은 표 등) 행 범위로 나누어 다시 요청한 뒤 목록을 합침
+"""
+import re
+import json
+import logging
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from django.conf import settings
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 미설치 시 문자 종류별 추정치 사용
+    tiktoken = None
+
+logger = logging.getLogger('core')
+
+_encoding = None
+_encoding_failed = False
+
+# 행 범위 지시문의 범위 (row_range_instruction 형식)
+ROW_RANGE_PATTERN = re.compile(r'(\d+)번째부터 (\d+)번째 품목')
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and tiktoken is not None and not _encoding_failed:
+        try:
+            _encoding = tiktoken.get_encoding(getattr(settings, 'TOKENIZER_ENCODING', 'o200k_base'))
+        except Exception as e:
+            # 인코딩 파일을 내려받을 수 없는 환경 등
+            logger.warning(f"[TOKEN BUDGET] tiktoken unavailable, using estimate: {str(e)}")
+            _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """텍스트 토큰 수 (tiktoken, 미설치 시 ASCII 4자당 1토큰 + 그 외 문자 0.7토큰으로 추정)"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return int(ascii_chars / 4 + (len(text) - ascii_chars) * 0.7) + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """토큰 수 상한에 맞게 텍스트 뒷부분을 잘라냄"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+    encoding = _get_encoding()
+    if encoding is not None:
+        truncated = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        # 추정치 기준 이분 탐색
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        truncated = text[:low]
+    return truncated + "\n... (토큰 예산 초과로 이하 생략)"
+
+
+def trim_previous_results(previous_results: Dict[str, Any], max_value_tokens: int = 200) -> Dict[str, Any]:
+    """이전 단계 결과 축소 (긴 목록/객체는 건수만, 긴 문자열은 앞부분만 남김)"""
+    trimmed = {}
+    for key, value in (previous_results or {}).items():
+        if isinstance(value, (list, dict)):
+            serialized = json.dumps(value, ensure_ascii=False)
+            if count_tokens(serialized) > max_value_tokens:
+                value = f"({len(value)}건, 토큰 예산 초과로 생략)"
+        elif isinstance(value, str) and count_tokens(value) > max_value_tokens:
+            value = truncate_to_tokens(value, max_value_tokens)
+        trimmed[key] = value
+    return trimmed
+
+
+def fit_prompt_budget(
+    build_prompt: Callable[[Optional[str], Dict[str, Any]], str],
+    ocr_text: Optional[str],
+    previous_results: Dict[str, Any],
+    image_tokens: int,
+    label: str = ''
+) -> Tuple[Optional[str], Dict[str, Any], Dict[str, Any]]:
+    """
+    프롬프트를 토큰 예산에 맞춤
+
+    Args:
+        build_prompt: (OCR 텍스트, 이전 단계 결과) -> 프롬프트 텍스트
+        ocr_text: 단계 OCR 텍스트
+        previous_results: 이전 단계 결과
+        image_tokens: 첨부 이미지 토큰 추정치
+        label: 로그용 단계 이름
+
+    Returns:
+        (OCR 텍스트, 이전 단계 결과, 예산 정보)
+    """
+    budget = getattr(settings, 'PROMPT_TOKEN_BUDGET', 60000)
+    prompt_tokens = count_tokens(build_prompt(ocr_text, previous_results)) + image_tokens
+    info = {'budget': budget, 'prompt_tokens': prompt_tokens, 'trimmed': []}
+    if not budget or prompt_tokens <= budget:
+        return ocr_text, previous_results, info
+
+    original_tokens = prompt_tokens
+
+    # 1. 이전 단계 결과 축소
+    if previous_results:
+        previous_results = trim_previous_results(previous_results)
+        prompt_tokens = count_tokens(build_prompt(ocr_text, previous_results)) + image_tokens
+        info['trimmed'].append('previous_results')
+
+    # 2. OCR 텍스트 축소 (초과분만큼)
+    if prompt_tokens > budget and ocr_text:
+        ocr_tokens = count_tokens(ocr_text)
+        ocr_text = truncate_to_tokens(ocr_text, max(0, ocr_tokens - (prompt_tokens - budget)))
+        prompt_tokens = count_tokens(build_prompt(ocr_text, previous_results)) + image_tokens
+        info['trimmed'].append('ocr_text')
+
+    info['prompt_tokens'] = prompt_tokens
+    logger.warning(f"[TOKEN BUDGET] {label}: prompt {original_tokens:,} -> {prompt_tokens:,} tokens "
+                   f"(budget {budget:,}, trimmed {', '.join(info['trimmed']) or 'nothing'})")
+    return ocr_text, previous_results, info
+
+
+def _output_limits() -> Tuple[int, int]:
+    return getattr(settings, 'AI_MIN_OUTPUT_TOKENS', 4096), getattr(settings, 'AI_MAX_OUTPUT_TOKENS', 16384)
+
+
+def _row_tokens(mappings: List[Dict[str, Any]]) -> int:
+    return max(1, len(mappings)) * getattr(settings, 'OUTPUT_TOKENS_PER_FIELD', 24)
+
+
+def pick_max_tokens(mappings: List[Dict[str, Any]]) -> int:
+    """
+    예상 출력 크기로 응답 토큰 상한 결정
+    항목 수 x 항목당 토큰 (품목이 많아 잘리면 call_with_row_split에서 전체 상한으로 다시 요청)
+    """
+    min_tokens, max_tokens = _output_limits()
+    return max(min_tokens, min(max_tokens, _row_tokens(mappings) + 256))
+
+
+def row_range_instruction(start: int, end: int) -> str:
+    """행 범위 요청 지시문 (프롬프트 마지막에 추가)"""
+    return (
+        f"\n[행 범위 지정]\n"
+        f"응답 길이 제한으로 품목(행)을 나누어 요청합니다. 이번 요청에서는 문서에 나오는 순서 기준 "
+        f"{start}번째부터 {end}번째 품목까지만 JSON 배열로 응답하세요. "
+        f"해당 범위에 품목이 없으면 빈 배열 []로 응답하세요.\n"
+    )
+
+
+def _rows_of(parsed) -> List[Any]:
+    """응답 JSON에서 행 목록 추출 (배열 또는 배열 값 하나를 가진 객체)"""
+    if isinstance(parsed, list):
+        return parsed
+    if isinstance(parsed, dict):
+        for value in parsed.values():
+            if isinstance(value, list):
+                return value
+        return [parsed] if parsed else []
+    return []
+
+
+def _is_list_response(text: str) -> bool:
+    """잘린 응답이 JSON 배열로 시작하는지 (코드 블록 표시 제외)"""
+    text = (text or '').lstrip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1].lstrip() if '\n' in text else ''
+    return text.startswith('[')
+
+
+def call_with_row_split(
+    call: Callable[[Optional[str], int], Tuple[str, bool]],
+    parse: Callable[[str], Any],
+    mappings: List[Dict[str, Any]],
+    label: str = ''
+) -> Tuple[str, Any]:
+    """
+    응답 토큰 상한을 정해 호출하고, 잘린 응답은 행 범위로 나누어 다시 요청
+
+    Args:
+        call: (추가 지시문, max_tokens) -> (응답 텍스트, 잘림 여부)
+        parse: 응답 텍스트 -> JSON
+        mappings: 단계 매핑 정보
+        label: 로그용 단계 이름
+
+    Returns:
+        (응답 텍스트 - 여러 번 호출한 경우 합친 텍스트, JSON 결과)
+    """
+    _, max_tokens = _output_limits()
+    first_tokens = pick_max_tokens(mappings)
+    result_text, truncated = call(None, first_tokens)
+    if truncated and first_tokens < max_tokens:
+        # 예상보다 긴 응답: 전체 상한으로 한 번 다시 요청 (잘린 응답은 버림)
+        logger.warning(f"[TOKEN BUDGET] {label}: response truncated at {first_tokens:,} tokens, retrying with {max_tokens:,}")
+        result_text, truncated = call(None, max_tokens)
+    if not truncated:
+        return result_text, parse(result_text)
+
+    # 품목 표(목록 응답)만 행 범위로 나눌 수 있음 - 헤더 항목(객체 응답)은 나누지 않음
+    if not _is_list_response(result_text):
+        raise Exception(f"응답이 응답 토큰 상한({max_tokens:,})을 넘어 잘렸습니다.")
+
+    # 응답이 잘림: 행 범위로 나누어 요청 (한 번에 요청할 행 수는 응답 토큰 상한 기준)
+    rows_per_call = max(1, (max_tokens - 256) // _row_tokens(mappings))
+    max_calls = getattr(settings, 'ROW_SPLIT_MAX_CALLS', 10)
+    logger.warning(f"[TOKEN BUDGET] {label}: response truncated, splitting into row ranges of {rows_per_call}")
+
+    texts = []
+    rows = []
+    start = 1
+    calls = 0
+    while calls < max_calls:
+        end = start + rows_per_call - 1
+        chunk_text, chunk_truncated = call(row_range_instruction(start, end), max_tokens)
+        calls += 1
+
+        if chunk_truncated:
+            if rows_per_call == 1:
+                raise Exception(f"응답 토큰 상한({max_tokens:,})으로 품목 1건도 추출할 수 없습니다.")
+            # 행 수를 줄여 같은 범위 다시 요청
+            rows_per_call = max(1, rows_per_call // 2)
+            continue
+
+        texts.append(chunk_text)
+        chunk_rows = _rows_of(parse(chunk_text))
+        rows.extend(chunk_rows)
+        if len(chunk_rows) < end - start + 1:
+            break
+        start = end + 1
+    else:
+        # 남은 품목이 있을 수 있으므로 일부만 완료로 저장하지 않음
+        raise Exception(
+            f"품목이 많아 행 범위 요청 {max_calls}회(ROW_SPLIT_MAX_CALLS) 안에 모두 추출하지 못했습니다 "
+            f"({len(rows)}건까지 추출)."
+        )
+
+    logger.info(f"[TOKEN BUDGET] {label}: merged {len(rows)} rows from {calls} row-range calls")
+    return "\n\n".join(texts), rows
@@ -9,9 +9,26 @@ from .models import (
     MappingInfo, PromptConfig, TableProcessConfig
 )
 from .forms import LoginForm, PasswordChangeForm, ServiceForm, CustomUserForm, DeclarationForm
+from .config_loader import bump_config_version
+from .ocr_layout import parse_region
 import os
 
 
+def _parse_depends_on(value):
+    """
+    선행 업무그룹 입력값 변환
+    - 빈 값: None (이전 처리 순서 전체에 의존)
+    - '-': [] (선행 단계 없음, 다른 단계와 동시 처리)
+    - '기본정보, 품목정보': 업무그룹 목록
+    """
+    value = (value or '').strip()
+    if not value:
+        return None
+    if value == '-':
+        return []
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
 def login_view(request):
     """로그인 페이지"""
     if request.user.is_authenticated:
@@ -383,6 +400,8 @@ def update_prompt_view(request, mapping_id):
     else:
         return JsonResponse({'success': False, 'error': '잘못된 프롬프트 유형입니다.'})
 
+    bump_config_version()
+
     return JsonResponse({
         'success': True,
         'message': '저장되었습니다.',
@@ -408,6 +427,7 @@ def add_mapping_view(request, declaration_id):
     db_field_name = request.POST.get('db_field_name')
     field_type = request.POST.get('field_type', 'string')
     field_length = request.POST.get('field_length')
+    keyword_hints = request.POST.get('keyword_hints', '').strip()
     service_user_id = request.POST.get('service_user_id')
 
     if not all([unipass_field_name, db_table_name, db_field_name]):
@@ -425,9 +445,12 @@ def add_mapping_view(request, declaration_id):
         db_field_name=db_field_name,
         field_type=field_type,
         field_length=int(field_length) if field_length else None,
+        keyword_hints=keyword_hints,
         is_active=True
     )
 
+    bump_config_version()
+
     return JsonResponse({
         'success': True,
         'message': '매핑 정보가 추가되었습니다.',
@@ -460,8 +483,12 @@ def update_mapping_view(request, mapping_id):
     mapping.db_field_name = db_field_name
     mapping.field_type = field_type
     mapping.field_length = int(field_length) if field_length else None
+    if 'keyword_hints' in request.POST:
+        mapping.keyword_hints = request.POST.get('keyword_hints', '').strip()
     mapping.save()
 
+    bump_config_version()
+
     return JsonResponse({
         'success': True,
         'message': '매핑 정보가 수정되었습니다.'
@@ -481,6 +508,8 @@ def delete_mapping_view(request, mapping_id):
 
     mapping.delete()
 
+    bump_config_version()
+
     return JsonResponse({
         'success': True,
         'message': '매핑 정보가 삭제되었습니다.'
@@ -544,6 +573,7 @@ def declaration_edit_view(request, service_slug, customs_code, declaration_code)
         form = DeclarationForm(request.POST, instance=declaration)
         if form.is_valid():
             form.save()
+            bump_config_version()
             messages.success(request, f'{declaration.name} 신고서가 수정되었습니다.')
             return redirect('declaration_list_with_user', service_slug=service.slug, customs_code=customs_code)
     else:
@@ -591,6 +621,8 @@ def update_metadata_view(request, declaration_id):
     declaration.description = metadata
     declaration.save()
 
+    bump_config_version()
+
     return JsonResponse({
         'success': True,
         'message': '메타데이터가 저장되었습니다.'
@@ -671,6 +703,10 @@ def add_table_config_view(request, declaration_id):
     db_table_name = request.POST.get('db_table_name', '').strip()
     process_order = request.POST.get('process_order', '').strip()
     table_prompt = request.POST.get('table_prompt', '').strip()
+    depends_on = _parse_depends_on(request.POST.get('depends_on'))
+    needs_ocr = request.POST.get('needs_ocr', 'true').lower() != 'false'
+    pages = request.POST.get('pages', '').strip()
+    region = request.POST.get('region', '').strip()
     service_user_id = request.POST.get('service_user_id')
     
     # 유효성 검사
@@ -681,6 +717,9 @@ def add_table_config_view(request, declaration_id):
         process_order = int(process_order)
     except ValueError:
         return JsonResponse({'success': False, 'error': '처리 순서는 숫자여야 합니다.'})
+
+    if region and parse_region(region) is None:
+        return JsonResponse({'success': False, 'error': '처리 영역은 0~1 사이 비율 4개(x0,y0,x1,y1)로 입력해주세요.'})
     
     # ServiceUser 조회
     service_user = None
@@ -705,8 +744,14 @@ def add_table_config_view(request, declaration_id):
         db_table_name=db_table_name,
         process_order=process_order,
         table_prompt=table_prompt if table_prompt else None,
+        depends_on=depends_on,
+        needs_ocr=needs_ocr,
+        pages=pages,
+        region=region,
         is_active=True
     )
+
+    bump_config_version()
     
     return JsonResponse({
         'success': True,
@@ -729,6 +774,7 @@ def update_table_config_view(request, config_id):
     db_table_name = request.POST.get('db_table_name', '').strip()
     process_order = request.POST.get('process_order', '').strip()
     table_prompt = request.POST.get('table_prompt', '').strip()
+    depends_on = _parse_depends_on(request.POST.get('depends_on'))
 
     # 유효성 검사
     if not all([work_group, db_table_name, process_order]):
@@ -754,7 +800,19 @@ def update_table_config_view(request, config_id):
     config.db_table_name = db_table_name
     config.process_order = process_order
     config.table_prompt = table_prompt if table_prompt else None
+    config.depends_on = depends_on
+    if 'needs_ocr' in request.POST:
+        config.needs_ocr = request.POST.get('needs_ocr', 'true').lower() != 'false'
+    if 'pages' in request.POST:
+        config.pages = request.POST.get('pages', '').strip()
+    if 'region' in request.POST:
+        region = request.POST.get('region', '').strip()
+        if region and parse_region(region) is None:
+            return JsonResponse({'success': False, 'error': '처리 영역은 0~1 사이 비율 4개(x0,y0,x1,y1)로 입력해주세요.'})
+        config.region = region
     config.save()
+
+    bump_config_version()
     
     return JsonResponse({
         'success': True,
@@ -773,6 +831,8 @@ def delete_table_config_view(request, config_id):
         return JsonResponse({'success': False, 'error': '관리자만 삭제할 수 있습니다.'})
     
     config.delete()
+
+    bump_config_version()
     
     return JsonResponse({
         'success': True,
@@ -41,6 +41,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.RequestTimingMiddleware',  # 요청 지연 시간 측정 (Server-Timing, 느린 요청 보관)
     'api.middleware.RequestLoggingMiddleware',  # 요청 로깅
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -112,6 +113,12 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# 업로드 중 SHA-256 계산 (인보이스 이미지 내용 주소 저장, core.image_store)
+FILE_UPLOAD_HANDLERS = [
+    'core.image_store.HashingMemoryFileUploadHandler',
+    'core.image_store.HashingTemporaryFileUploadHandler',
+]
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -132,6 +139,147 @@ GOOGLE_VISION_CREDENTIALS = os.getenv('GOOGLE_VISION_CREDENTIALS')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
+# 신고서 설정 스냅샷 캐시 (프로세스별 최대 보관 개수)
+CONFIG_SNAPSHOT_CACHE_SIZE = int(os.getenv('CONFIG_SNAPSHOT_CACHE_SIZE', '256'))
+
+# 비동기 인보이스 처리 (async=true) 워커 풀
+INVOICE_JOB_WORKERS = int(os.getenv('INVOICE_JOB_WORKERS', '4'))
+INVOICE_JOB_RESUME_ON_STARTUP = os.getenv('INVOICE_JOB_RESUME_ON_STARTUP', 'True') == 'True'
+# 처리 중(processing)으로 이 시간(초) 이상 지난 작업은 워커 비정상 종료로 보고 다시 처리 (최대 시도 횟수 초과 시 실패)
+INVOICE_JOB_STALE_SECONDS = int(os.getenv('INVOICE_JOB_STALE_SECONDS', '1800'))
+INVOICE_JOB_MAX_ATTEMPTS = int(os.getenv('INVOICE_JOB_MAX_ATTEMPTS', '2'))
+INVOICE_JOB_STALE_CHECK_INTERVAL = int(os.getenv('INVOICE_JOB_STALE_CHECK_INTERVAL', '300'))
+
+# 업무그룹 단계 동시 실행 수 (선행 업무그룹이 없는 단계끼리 동시 처리)
+STEP_EXECUTOR_MAX_WORKERS = int(os.getenv('STEP_EXECUTOR_MAX_WORKERS', '4'))
+
+# AI 단계와 동시에 실행하는 OCR 스레드 수
+OCR_EXECUTOR_WORKERS = int(os.getenv('OCR_EXECUTOR_WORKERS', '4'))
+
+# OCR 결과 캐시 (이미지 SHA-256 + OCR 설정 기준, TTL 0이면 만료 없음)
+OCR_CACHE_ENABLED = os.getenv('OCR_CACHE_ENABLED', 'True') == 'True'
+OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', '512'))
+OCR_CACHE_TTL_SECONDS = int(os.getenv('OCR_CACHE_TTL_SECONDS', '0'))
+
+# Vision API 언어 힌트 (쉼표 구분, 예: ko,en) - 변경 시 캐시 키도 달라짐
+OCR_LANGUAGE_HINTS = [hint.strip() for hint in os.getenv('OCR_LANGUAGE_HINTS', '').split(',') if hint.strip()]
+
+# 처리 영역(region)이 지정된 단계의 이미지 자르기 여백 (페이지 대비 비율)
+OCR_REGION_MARGIN = float(os.getenv('OCR_REGION_MARGIN', '0.02'))
+
+# 단계별 OCR 텍스트 축소: 추출 항목명/프롬프트/OCR 키워드와 관련 있는 줄 + 앞뒤 문맥 줄만 포함
+# (MIN_CHARS 미만 텍스트는 그대로, 관련 줄을 찾은 항목 비율이 MIN_COVERAGE 미만이면 전체 텍스트 사용)
+OCR_REDUCER_ENABLED = os.getenv('OCR_REDUCER_ENABLED', 'False') == 'True'
+OCR_REDUCER_CONTEXT_LINES = int(os.getenv('OCR_REDUCER_CONTEXT_LINES', '2'))
+OCR_REDUCER_MIN_CHARS = int(os.getenv('OCR_REDUCER_MIN_CHARS', '2000'))
+OCR_REDUCER_MIN_SCORE = int(os.getenv('OCR_REDUCER_MIN_SCORE', '2'))
+OCR_REDUCER_MIN_COVERAGE = float(os.getenv('OCR_REDUCER_MIN_COVERAGE', '0.5'))
+OCR_REDUCER_MAX_RATIO = float(os.getenv('OCR_REDUCER_MAX_RATIO', '0.8'))
+
+# Vision OCR 마이크로 배치: 대기 시간(ms) 안에 들어온 요청을 batch_annotate_images 한 번으로 전송 (최대 16장)
+OCR_BATCH_ENABLED = os.getenv('OCR_BATCH_ENABLED', 'True') == 'True'
+OCR_BATCH_WINDOW_MS = int(os.getenv('OCR_BATCH_WINDOW_MS', '5'))
+OCR_BATCH_MAX_SIZE = int(os.getenv('OCR_BATCH_MAX_SIZE', '16'))
+OCR_BATCH_MAX_BYTES = int(os.getenv('OCR_BATCH_MAX_BYTES', str(8 * 1024 * 1024)))
+OCR_BATCH_MAX_INFLIGHT = int(os.getenv('OCR_BATCH_MAX_INFLIGHT', '4'))
+
+# AI 요청용 이미지 전처리 (EXIF 회전 보정, 긴 변 축소, JPEG 재압축 - OCR은 원본 사용)
+IMAGE_PREPROCESS_ENABLED = os.getenv('IMAGE_PREPROCESS_ENABLED', 'True') == 'True'
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '2048'))
+IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '85'))
+
+# 외부 API 클라이언트 (워커 프로세스당 1개 생성 후 재사용)
+PROVIDER_CLIENT_WARMUP = os.getenv('PROVIDER_CLIENT_WARMUP', 'False') == 'True'  # 서버 시작 시 미리 생성
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '10'))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '60'))
+VISION_KEEPALIVE_TIME_MS = int(os.getenv('VISION_KEEPALIVE_TIME_MS', '30000'))
+
+# 프롬프트 구성 방식 (legacy: 기존 구성, cache_friendly: 단계 공통 부분을 앞에 배치하여 프롬프트 캐시 활용)
+PROMPT_LAYOUT = os.getenv('PROMPT_LAYOUT', 'legacy')
+
+# 동일 요청 합치기 (/api/process/ 동기 처리)
+# 같은 이미지/신고서/서비스 사용자/AI 엔진/설정 버전의 요청이 처리 중이면 새로 처리하지 않고 그 결과를 함께 반환
+# - 임대 만료(초): 처리 중에는 갱신 간격(초)마다 연장, 워커가 비정상 종료하면 이 시간 뒤 다른 요청이 인수
+# - 대기 요청은 임대가 유효한 동안 계속 대기 / 다른 워커 결과 확인 간격(초)
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'True') == 'True'
+SINGLE_FLIGHT_LEASE_SECONDS = int(os.getenv('SINGLE_FLIGHT_LEASE_SECONDS', '120'))
+SINGLE_FLIGHT_HEARTBEAT_SECONDS = float(os.getenv('SINGLE_FLIGHT_HEARTBEAT_SECONDS', '30'))
+SINGLE_FLIGHT_POLL_SECONDS = float(os.getenv('SINGLE_FLIGHT_POLL_SECONDS', '0.5'))
+
+# 인보이스 일괄 처리 (/api/process/batch/)
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '4'))  # 요청당 최대 동시 처리 수
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '100'))  # 요청당 최대 인보이스 수
+BATCH_MAX_FILE_SIZE = int(os.getenv('BATCH_MAX_FILE_SIZE', str(20 * 1024 * 1024)))  # zip 내 파일당 최대 크기
+BATCH_MAX_TOTAL_SIZE = int(os.getenv('BATCH_MAX_TOTAL_SIZE', str(200 * 1024 * 1024)))  # zip 내 파일 전체 최대 크기 (압축 해제 기준)
+
+# 진행 상황 스트리밍 (/api/process/stream/) 연결 유지 주석 전송 간격(초)
+SSE_KEEPALIVE_SECONDS = int(os.getenv('SSE_KEEPALIVE_SECONDS', '15'))
+# 스트리밍 처리 전용 워커 수 (프로세스당, 모두 사용 중이면 503 응답 - 비동기 작업 풀 INVOICE_JOB_WORKERS와 별도)
+STREAM_MAX_WORKERS = int(os.getenv('STREAM_MAX_WORKERS', '4'))
+
+# 다중 페이지 문서(PDF/TIFF) 페이지 렌더링 해상도(DPI)와 최대 페이지 수
+PDF_RENDER_DPI = int(os.getenv('PDF_RENDER_DPI', '200'))
+DOCUMENT_MAX_PAGES = int(os.getenv('DOCUMENT_MAX_PAGES', '30'))
+
+# 단계별 토큰 예산: 프롬프트(텍스트 + 이미지) 토큰 상한, 초과 시 이전 단계 결과 -> OCR 텍스트 순서로 축소
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '60000'))
+# 응답 토큰 상한(max_tokens) = 항목 수 x 항목당 토큰, MIN~MAX 범위 (잘리면 MAX로 다시 요청 후 품목 표는 행 범위 분할)
+OUTPUT_TOKENS_PER_FIELD = int(os.getenv('OUTPUT_TOKENS_PER_FIELD', '24'))
+# MIN: 품목 표 첫 호출이 잘려 다시 요청하는 경우를 줄이도록 기본 4096 이상 유지
+AI_MIN_OUTPUT_TOKENS = int(os.getenv('AI_MIN_OUTPUT_TOKENS', '4096'))
+AI_MAX_OUTPUT_TOKENS = int(os.getenv('AI_MAX_OUTPUT_TOKENS', '16384'))
+# 응답이 잘린 경우 행 범위로 나누어 요청하는 최대 횟수 (초과 시 단계 실패)
+ROW_SPLIT_MAX_CALLS = int(os.getenv('ROW_SPLIT_MAX_CALLS', '10'))
+# Gemini 2.5 생각(thinking) 토큰 여유분 (출력 상한에 포함됨)
+GEMINI_THINKING_RESERVE_TOKENS = int(os.getenv('GEMINI_THINKING_RESERVE_TOKENS', '8192'))
+
+# 로컬 AI 엔진 (ai_engine=local): 픽스처 JSON 경로와 호출당 지연 시간(ms) - 외부 API 없이 전체 흐름 부하 테스트용
+LOCAL_ENGINE_FIXTURES = os.getenv('LOCAL_ENGINE_FIXTURES', '')
+LOCAL_ENGINE_LATENCY_MS = int(os.getenv('LOCAL_ENGINE_LATENCY_MS', '0'))
+
+# 처리 지표 (/api/metrics/): 워커 프로세스별 지표 파일 디렉터리 (비우면 현재 프로세스 값만 노출),
+# 파일 저장 주기(초), 처리 중 게이지를 합산할 최근 저장 기준(초)
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+METRICS_STALE_SECONDS = float(os.getenv('METRICS_STALE_SECONDS', '60'))
+
+# 로깅: 로그 레벨, 파일 교체 크기/보관 개수, 비동기 기록 큐 크기 (가득 차면 버림)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_CONSOLE_LEVEL = os.getenv('LOG_CONSOLE_LEVEL', 'INFO')
+LOG_FILE_MAX_BYTES = int(os.getenv('LOG_FILE_MAX_BYTES', str(50 * 1024 * 1024)))
+LOG_FILE_BACKUP_COUNT = int(os.getenv('LOG_FILE_BACKUP_COUNT', '10'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# 로그 메시지 최대 길이 / 프롬프트·OCR·응답 본문 미리보기 길이 (0: 길이만 기록)
+LOG_MAX_MESSAGE_CHARS = int(os.getenv('LOG_MAX_MESSAGE_CHARS', '4000'))
+LOG_PAYLOAD_PREVIEW_CHARS = int(os.getenv('LOG_PAYLOAD_PREVIEW_CHARS', '200'))
+# 요청별 디버그 추적 (off / header: 관리자/스태프의 X-Debug-Trace: 1 요청만 / all: 모든 요청) - 추적 중에는 본문 전체를 LOG_TRACE_MAX_CHARS까지 기록
+LOG_DEBUG_TRACE = os.getenv('LOG_DEBUG_TRACE', 'off')
+LOG_TRACE_MAX_CHARS = int(os.getenv('LOG_TRACE_MAX_CHARS', '200000'))
+
+# 요청 지연 시간: 느린 요청 기준(ms)과 보관 개수, 지연 시간 분포(p50/p95/p99) 계산에 쓰는 최근 요청 수 (프로세스별)
+SLOW_REQUEST_THRESHOLD_MS = int(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '1000'))
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv('SLOW_REQUEST_BUFFER_SIZE', '100'))
+REQUEST_TIMING_SAMPLE_SIZE = int(os.getenv('REQUEST_TIMING_SAMPLE_SIZE', '1000'))
+
+# 처리 로그 본문(OCR 텍스트/AI 요청·응답/결과 JSON) zlib 압축 수준 (1: 빠름 ~ 9: 작음)
+PAYLOAD_COMPRESSION_LEVEL = int(os.getenv('PAYLOAD_COMPRESSION_LEVEL', '6'))
+
+# 처리 로그 목록 API: 페이지 최대 행 수, 페이지 응답 크기 상한(bytes, 0: 제한 없음)
+PROCESS_LOG_PAGE_MAX = int(os.getenv('PROCESS_LOG_PAGE_MAX', '200'))
+PROCESS_LOG_PAGE_MAX_BYTES = int(os.getenv('PROCESS_LOG_PAGE_MAX_BYTES', str(256 * 1024)))
+
+# 처리 로그 보관/아카이브 (archive_process_logs 명령)
+# - 보관 기간(일)이 지난 처리 로그를 서비스/월별 아카이브 파일로 옮기고 원본 행/이미지 삭제 (0: 아카이브하지 않음, 서비스별 설정 우선)
+# - 형식: auto(pyarrow 설치 시 parquet, 아니면 jsonl.gz) / parquet / jsonl
+# - 삭제는 배치 단위 짧은 트랜잭션으로 나누고, 배치 사이에 잠시 쉬어 테이블 잠금을 짧게 유지
+LOG_RETENTION_DAYS = int(os.getenv('LOG_RETENTION_DAYS', '0'))
+LOG_ARCHIVE_ROOT = os.getenv('LOG_ARCHIVE_ROOT', str(BASE_DIR / 'archive'))
+LOG_ARCHIVE_FORMAT = os.getenv('LOG_ARCHIVE_FORMAT', 'auto')
+LOG_ARCHIVE_BATCH_SIZE = int(os.getenv('LOG_ARCHIVE_BATCH_SIZE', '500'))
+LOG_ARCHIVE_BATCH_PAUSE_SECONDS = float(os.getenv('LOG_ARCHIVE_BATCH_PAUSE_SECONDS', '0.2'))
+
 # Session settings
 SESSION_COOKIE_AGE = 3600  # 1 hour
 SESSION_SAVE_EVERY_REQUEST = True
@@ -163,14 +311,17 @@ LOGGING = {
         },
     },
     'handlers': {
+        # JSON 한 줄 형식, 큐를 거쳐 별도 스레드에서 기록 (크기 기준 파일 교체)
         'file': {
             'level': 'DEBUG',
-            'class': 'logging.FileHandler',
+            'class': 'core.structured_logging.QueuedRotatingFileHandler',
             'filename': BASE_DIR / 'logs' / 'api.log',
-            'formatter': 'verbose',
+            'max_bytes': LOG_FILE_MAX_BYTES,
+            'backup_count': LOG_FILE_BACKUP_COUNT,
+            'queue_size': LOG_QUEUE_SIZE,
         },
         'console': {
-            'level': 'DEBUG',
+            'level': LOG_CONSOLE_LEVEL,
             'class': 'logging.StreamHandler',
             'formatter': 'simple',
         },
@@ -178,17 +329,17 @@ LOGGING = {
     'loggers': {
         'api': {
             'handlers': ['file', 'console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
         'core': {
             'handlers': ['file', 'console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
         'django.request': {
             'handlers': ['file', 'console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
     },